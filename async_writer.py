@@ -0,0 +1,280 @@
+#!/usr/bin/env python
+#
+# Asynchronous capture sink for high sample rates.
+#
+# gr.file_sink writes from inside the flow graph, so a slow write stalls
+# the graph and the USRP overruns.  async_writer takes the samples off
+# the graph with a message_sink instead and does the disk I/O in threads
+# of its own:
+#
+#   - a drain thread copies every message into a pool of preallocated,
+#     page aligned blocks (anonymous mmaps);
+#   - a writer thread writes full blocks to the file, optionally with
+#     O_DIRECT, and hands them back to the pool.
+#
+# Nothing in here blocks the flow graph.  The message_sink never blocks
+# (its queue has no limit) and the drain thread never waits for the
+# disk.  Samples are dropped in two places instead, and each run of
+# dropped samples is recorded as a gap:
+#
+#   - when more than queue_limit messages are waiting, the drain thread
+#     has fallen behind and discards the oldest message unread;
+#   - when the pool runs out, the rest of the message is discarded.
+#
+# The drain thread knows the size of every message, so the offsets are
+# exact.  The gap log is csv, one line per run of dropped samples,
+#
+#   stream_offset,dropped,file_offset
+#
+# all in samples: where in the stream reaching this block the gap
+# starts, how many samples were dropped, and where in the file the
+# stream picks up again.  The log does not cover samples lost before
+# the flow graph: USRP overflows ("O" on stderr) happen in the device
+# and UHD and never reach this block, so they are not in the log.
+#
+# --fsync chooses when data is forced to disk: never, after every block,
+# or once on close.
+#
+
+from gnuradio import gr
+import Queue
+import mmap
+import os
+import sys
+import threading
+import time
+
+
+class async_writer(gr.hier_block2):
+
+    def __init__(self, itemsize, filename, block_size=4<<20, nblocks=64, direct=False,
+                 fsync='close', gap_log=None, stats_interval=0, queue_limit=256):
+        """
+        @param itemsize: bytes per sample
+        @param filename: file to write
+        @param block_size: bytes per write, rounded up to whole pages and samples
+        @param nblocks: blocks in the pool
+        @param direct: open the file with O_DIRECT
+        @param fsync: none, block or close
+        @param gap_log: csv file to record dropped samples in, or None
+        @param stats_interval: seconds between stats lines on stderr, 0 for none
+        @param queue_limit: messages waiting before the oldest is discarded
+        """
+        gr.hier_block2.__init__(self, "async_writer",
+                gr.io_signature(1, 1, itemsize), # Input signature
+                gr.io_signature(0, 0, 0)) # Output signature
+
+        if fsync not in ('none', 'block', 'close'):
+            raise ValueError("fsync must be none, block or close")
+        page = mmap.PAGESIZE
+        block_size = max(page, (block_size + page - 1) // page * page)
+        while block_size % itemsize:
+            block_size += page
+        self.itemsize = itemsize
+        self.block_size = block_size
+        self.direct = direct
+        self.fsync = fsync
+        self.stats_interval = stats_interval
+        self.queue_limit = queue_limit
+
+        # no limit on the queue itself, so the sink never blocks the graph;
+        # _drain keeps it to queue_limit messages by discarding
+        self.msgq = gr.msg_queue()
+        self.connect(self, gr.message_sink(itemsize, self.msgq, True))
+
+        self.blocks = [mmap.mmap(-1, block_size) for i in range(nblocks)]
+        self.free = Queue.Queue()
+        for i in range(nblocks):
+            self.free.put(i)
+        self.full = Queue.Queue()
+
+        flags = os.O_WRONLY | os.O_CREAT | os.O_TRUNC
+        if direct:
+            if not hasattr(os, 'O_DIRECT'):
+                raise ValueError("O_DIRECT is not supported here")
+            flags |= os.O_DIRECT
+        self.fd = os.open(filename, flags, 0644)
+
+        self.gap_log = None
+        if gap_log:
+            self.gap_log = open(gap_log, 'w')
+            self.gap_log.write("stream_offset,dropped,file_offset\n")
+        self.gap = None             # [stream_offset, dropped, file_offset] being extended
+
+        # counters, in bytes
+        self.received = 0
+        self.kept = 0
+        self.dropped = 0
+        self.written = 0
+        self.gaps = 0
+
+        self.threads = []
+        self.done = threading.Event()
+
+    def start(self):
+        """
+        Start the drain and writer threads.  Call after starting the flow graph.
+        """
+        targets = [self._drain, self._write]
+        if self.stats_interval > 0:
+            targets.append(self._report)
+        for target in targets:
+            t = threading.Thread(target=target)
+            t.setDaemon(True)
+            t.start()
+            self.threads.append(t)
+
+    # -- drain thread ---------------------------------------------------
+
+    def _drain(self):
+        cur = None
+        fill = 0
+        while True:
+            msg = self.msgq.delete_head()
+            if msg.type() == 1:
+                break
+            if self.msgq.count() >= self.queue_limit:
+                # too far behind, drop the oldest rather than let the queue grow
+                self._drop(self.received, msg.length())
+                self.received += msg.length()
+                continue
+            data = msg.to_string()
+            pos = 0
+            while pos < len(data):
+                if cur is None:
+                    try:
+                        cur = self.free.get_nowait()
+                    except Queue.Empty:
+                        # pool exhausted, drop the rest rather than stall the graph
+                        self._drop(self.received + pos, len(data) - pos)
+                        break
+                    fill = 0
+                n = min(self.block_size - fill, len(data) - pos)
+                # buffer() and write() copy straight from the message string
+                block = self.blocks[cur]
+                block.seek(fill)
+                block.write(buffer(data, pos, n))
+                fill += n
+                pos += n
+                self.kept += n
+                if fill == self.block_size:
+                    self.full.put((cur, fill))
+                    cur = None
+            self.received += len(data)
+        if cur is not None and fill:
+            self.full.put((cur, fill))
+        self.full.put(None)
+
+    def _drop(self, offset, nbytes):
+        self.dropped += nbytes
+        if self.gap is not None and self.gap[0] + self.gap[1] == offset:
+            self.gap[1] += nbytes
+            return
+        self._flush_gap()
+        self.gap = [offset, nbytes, self.kept]
+        self.gaps += 1
+
+    def _flush_gap(self):
+        if self.gap is not None and self.gap_log:
+            self.gap_log.write("%d,%d,%d\n" % tuple(x // self.itemsize for x in self.gap))
+            self.gap_log.flush()
+        self.gap = None
+
+    # -- writer thread --------------------------------------------------
+
+    def _write(self):
+        padded = False
+        while True:
+            item = self.full.get()
+            if item is None:
+                break
+            i, n = item
+            length = n
+            if self.direct and n % mmap.PAGESIZE:
+                # O_DIRECT only writes whole pages; trimmed on close
+                length = (n + mmap.PAGESIZE - 1) // mmap.PAGESIZE * mmap.PAGESIZE
+                padded = True
+            if self.direct:
+                # carrying on after a short write would be unaligned
+                if os.write(self.fd, buffer(self.blocks[i], 0, length)) != length:
+                    raise IOError("short O_DIRECT write to the capture file")
+            else:
+                done = 0
+                while done < length:
+                    done += os.write(self.fd, buffer(self.blocks[i], done, length - done))
+            self.written += n
+            if self.fsync == 'block':
+                os.fsync(self.fd)
+            self.free.put(i)
+        if padded:
+            os.ftruncate(self.fd, self.written)
+        if self.fsync != 'none':
+            os.fsync(self.fd)
+        os.close(self.fd)
+
+    # -- stats ----------------------------------------------------------
+
+    def stats(self):
+        """
+        Return a dict of counters: bytes received, written and dropped,
+        number of gaps and the pool fill (0 to 1).
+        """
+        nblocks = len(self.blocks)
+        return {'received': self.received, 'written': self.written, 'dropped': self.dropped,
+                'gaps': self.gaps, 'pool_fill': float(nblocks - self.free.qsize()) / nblocks}
+
+    def _report(self):
+        last = self.written
+        last_t = time.time()
+        while not self.done.isSet():
+            self.done.wait(self.stats_interval)
+            now = time.time()
+            s = self.stats()
+            rate = (s['written'] - last) / max(now - last_t, 1e-9)
+            last, last_t = s['written'], now
+            sys.stderr.write("pool %3.0f%%  write %7.1f MB/s  dropped %d samples in %d gaps\n"
+                             % (100 * s['pool_fill'], rate / 1e6, s['dropped'] // self.itemsize,
+                                s['gaps']))
+
+    def stop(self):
+        """
+        Write out what is left and close the file.  Call after the flow
+        graph has stopped.
+        """
+        self.msgq.insert_tail(gr.message(1))
+        self.done.set()
+        for t in self.threads:
+            t.join()
+        self._flush_gap()
+        if self.gap_log:
+            self.gap_log.close()
+
+    def summary(self):
+        """
+        One line on what was captured, for after stop().
+        """
+        s = self.stats()
+        return "%d bytes written, %d samples dropped in %d gaps" % (
+            s['written'], s['dropped'] // self.itemsize, s['gaps'])
+
+    def add_options(normal, expert):
+        """
+        Add asynchronous writer options to the Options parser
+        """
+        normal.add_option("", "--async-writer", action="store_true", default=False,
+                          help="write from a thread through a buffer pool, dropping and "
+                          "logging samples instead of stalling the radio")
+        expert.add_option("", "--block-size", type="eng_float", default=4<<20, metavar="BYTES",
+                          help="bytes per write [default=%default]")
+        expert.add_option("", "--blocks", type="int", default=64,
+                          help="blocks in the buffer pool [default=%default]")
+        expert.add_option("", "--direct", action="store_true", default=False,
+                          help="write with O_DIRECT, bypassing the page cache")
+        expert.add_option("", "--fsync", type="choice", choices=["none", "block", "close"],
+                          default="close",
+                          help="when to fsync: none, block (every write) or close [default=%default]")
+        expert.add_option("", "--stats-interval", type="eng_float", default=0, metavar="SECS",
+                          help="print pool fill and write rate every SECS, 0 for never "
+                          "[default=%default]")
+    # Make a static method to call before instantiation
+    add_options = staticmethod(add_options)
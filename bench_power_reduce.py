@@ -0,0 +1,74 @@
+#!/usr/bin/env python
+#
+# Microbenchmark for the per-message power reduction done in main_loop.
+#
+# Compares the old per-bin math.log10 loop against fft_sum_db from
+# sense_path, for a single message and for a batch of messages, at
+# 1k/4k/16k FFT bins.
+#
+
+from optparse import OptionParser
+import math
+import timeit
+
+import numpy
+
+#from current dir
+from sense_path import fft_offset_db, fft_sum_db
+
+
+def loop_sum_db(data, k):
+    """
+    The reduction main_loop used to do, one math.log10 per bin.
+    """
+    temp_list = []
+    for item in data:
+        temp_list.append(10*math.log10(item) + k)
+    return sum(temp_list)/len(data)
+
+
+def bench(fn, repeat, number):
+    """
+    Return the best time per call in seconds.
+    """
+    t = timeit.Timer(fn)
+    return min(t.repeat(repeat, number)) / number
+
+
+def main():
+    parser = OptionParser()
+    parser.add_option("", "--sizes", type="string", default="1024,4096,16384",
+                      help="comma separated FFT sizes to test [default=%default]")
+    parser.add_option("", "--batch", type="int", default=16,
+                      help="number of messages per batch [default=%default]")
+    parser.add_option("", "--repeat", type="int", default=5,
+                      help="timing repetitions, the best one is kept [default=%default]")
+    parser.add_option("", "--number", type="int", default=100,
+                      help="calls per repetition [default=%default]")
+    (options, args) = parser.parse_args()
+
+    print "%8s %12s %12s %9s %14s %9s" % ("bins", "loop (us)", "numpy (us)", "speedup",
+                                          "batch/msg (us)", "speedup")
+    for fft_size in [int(x) for x in options.sizes.split(',')]:
+        k = fft_offset_db(fft_size)
+        # what bin_statistics_f hands us: a float32 vector of positive powers
+        batch = numpy.random.exponential(1e-6, (options.batch, fft_size)).astype(numpy.float32)
+        data = batch[0]
+        tuple_data = tuple(float(x) for x in data)
+
+        old = loop_sum_db(tuple_data, k)
+        new = fft_sum_db(data, k)
+        assert abs(old - new) < 1e-6, (old, new)
+        assert numpy.allclose(fft_sum_db(batch, k),
+                              [loop_sum_db(tuple(row), k) for row in batch])
+
+        t_loop = bench(lambda: loop_sum_db(tuple_data, k), options.repeat, options.number)
+        t_vec = bench(lambda: fft_sum_db(data, k), options.repeat, options.number)
+        t_batch = bench(lambda: fft_sum_db(batch, k), options.repeat, options.number) / options.batch
+
+        print "%8d %12.1f %12.1f %8.1fx %14.1f %8.1fx" % (fft_size, t_loop*1e6, t_vec*1e6,
+                                                          t_loop/t_vec, t_batch*1e6, t_loop/t_batch)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,357 @@
+#!/usr/bin/env python
+#
+# End-to-end throughput benchmark for the spectrum sensing pipeline.
+#
+# Two producers can drive the main_loop consumer stages (delete_head,
+# parse_msg, fft_sum_db, occupancy_log):
+#
+#   chain  a simulated USRP (usrp_device.sim_source) feeding a real
+#          sense_path flow graph, so the FFT, bin_statistics_f and the
+#          tune callback are all in the loop.
+#
+#   queue  a thread that inserts synthetic bin_statistics_f style
+#          messages into a gr.msg_queue at a fixed rate, dropping them
+#          when the queue is full like bin_statistics_f does.  This
+#          isolates the Python side.
+#
+# Every comma separated value of --fft-size, --samp-rate, --dwell-delay,
+# --tune-delay and --queue-depth is combined with every other, and one
+# JSON object per combination is written to stdout (or --output), so runs
+# from different commits can be compared line by line.
+#
+# Reported per run: messages/s, end-to-end latency percentiles (from the
+# moment a result is queued to the moment main_loop is done with it),
+# dropped and flushed messages, wall time per consumer stage and the
+# process CPU time.
+#
+# In chain mode a result is timestamped by the tune callback
+# bin_statistics_f makes right after queueing (or dropping) it.  The
+# callback's return value labels the next result, so the bench returns
+# a sequence number there instead of the frequency and every result is
+# matched to its own retune, however many were dropped.  Drops are what
+# was sent but neither read, flushed nor left in the queue at the end.
+#
+# Chain mode also reports the CPU cost per frame of every flow graph
+# stage (s2v, fft, mag, stats), each measured by running the chain up to
+# that stage on its own over --stage-frames canned frames and taking the
+# difference from the chain one stage shorter.
+#
+
+from gnuradio import gr, window
+from gnuradio.eng_option import eng_option
+from optparse import OptionParser
+import copy
+import itertools
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import numpy
+
+#from current dir
+from sense_path import sense_path, tune, parse_msg, fft_offset_db, fft_sum_db
+from occupancy_log import occupancy_log
+import usrp_device
+
+STAGES = ('wait', 'parse', 'reduce', 'log')
+
+
+class bench_top_block(gr.top_block):
+    """
+    sim_source -> sense_path, with every retune timestamped.
+    """
+    def __init__(self, options):
+        gr.top_block.__init__(self)
+        self.u = usrp_device.sim_source(options.samp_rate, options.sim_noise,
+                                        usrp_device.parse_primaries(options.sim_primary),
+                                        options.sim_tune_latency, options.sim_throttle)
+        self.usrp_rate = self.u.get_samp_rate()
+        self.tune_times = []
+        self.sense = sense_path(self.usrp_rate, self.u.set_center_freq, options)
+        self.connect(self.u, self.sense)
+        self._set_next_freq = self.sense.set_next_freq
+        self.sense.set_next_freq = self.set_next_freq
+
+    def set_next_freq(self):
+        # called from the tune callback, right after bin_statistics_f
+        # queued (or dropped) a result; the result it queues next is
+        # labelled with the sequence number of this retune
+        self.tune_times.append(time.time())
+        self._set_next_freq()
+        return float(len(self.tune_times) - 1)
+
+    def sent(self):
+        """
+        Number of results bin_statistics_f has queued or dropped.
+        """
+        return max(0, len(self.tune_times) - 1)
+
+
+class queue_producer(threading.Thread):
+    """
+    Inserts fake bin_statistics_f results at rate messages per second.
+    The message type carries a sequence number for latency matching.
+    """
+    def __init__(self, msgq, fft_size, rate):
+        threading.Thread.__init__(self)
+        self.setDaemon(True)
+        self.msgq = msgq
+        self.fft_size = fft_size
+        self.period = 1.0 / rate
+        self.payload = numpy.random.exponential(1e-6, fft_size).astype(numpy.float32).tostring()
+        self.sent_times = {}
+        self.dropped = 0
+        self.running = True
+
+    def run(self):
+        seq = 0
+        deadline = time.time()
+        while self.running:
+            now = time.time()
+            if now < deadline:
+                time.sleep(deadline - now)
+            deadline += self.period
+            if self.msgq.full_p():
+                self.dropped += 1
+                continue
+            self.sent_times[seq] = time.time()
+            self.msgq.insert_tail(gr.message_from_string(self.payload, seq, 600e6, self.fft_size))
+            seq += 1
+
+
+class _fixed_freq(object):
+    """
+    Stands in for a sense_path in the tune callback of stage_costs.
+    """
+    def set_next_freq(self):
+        return 0.0
+
+
+def stage_costs(fft_size, dwell_frames, nframes):
+    """
+    CPU microseconds per frame of every sense_path flow graph stage.
+
+    The chain is run up to each stage in turn over nframes frames of
+    canned noise, and a stage is charged the difference to the chain one
+    stage shorter, so the source and the scheduler are left out.
+    """
+    data = (numpy.random.normal(size=64*fft_size) +
+            1j*numpy.random.normal(size=64*fft_size)).astype(numpy.complex64)
+    callback = tune(_fixed_freq())
+
+    def stages(n):
+        blocks = [gr.stream_to_vector(gr.sizeof_gr_complex, fft_size),
+                  gr.fft_vcc(fft_size, True, window.blackmanharris(fft_size)),
+                  gr.complex_to_mag_squared(fft_size),
+                  gr.bin_statistics_f(fft_size, gr.msg_queue(1), callback, 0, dwell_frames)]
+        sinks = [gr.null_sink(gr.sizeof_gr_complex * fft_size),
+                 gr.null_sink(gr.sizeof_gr_complex * fft_size),
+                 gr.null_sink(gr.sizeof_float * fft_size),
+                 None]
+        return blocks[:n], sinks[n-1]
+
+    def cpu(n):
+        tb = gr.top_block()
+        blocks, sink = stages(n)
+        chain = [gr.vector_source_c(data.tolist(), True),
+                 gr.head(gr.sizeof_gr_complex, nframes * fft_size)] + blocks
+        if sink is not None:
+            chain.append(sink)
+        tb.connect(*chain)
+        t0 = os.times()
+        tb.run()
+        t1 = os.times()
+        return (t1[0] + t1[1]) - (t0[0] + t0[1])
+
+    costs = {}
+    last = cpu(1)
+    costs['s2v'] = last
+    for n, name in ((2, 'fft'), (3, 'mag'), (4, 'stats')):
+        t = cpu(n)
+        costs[name] = max(0.0, t - last)
+        last = t
+    return dict((name, 1e6 * t / nframes) for name, t in costs.items())
+
+
+def percentiles(values, pcts=(50, 90, 99, 100)):
+    if not values:
+        return dict((str(p), None) for p in pcts)
+    values = sorted(values)
+    out = {}
+    for p in pcts:
+        i = min(len(values) - 1, int(round(p / 100.0 * (len(values) - 1))))
+        out[str(p)] = values[i]
+    return out
+
+
+def consume(msgq, fft_size, threshold, duration, log, flush_every=0):
+    """
+    The main_loop stages, timed.
+
+    Returns (n, flushed, stage times, done times, ids), where ids holds the
+    message type (the queue producer's sequence number), the center
+    frequency (bench_top_block's sequence number) and the position of
+    the message in the stream counting flushed ones, for each message.
+    """
+    k = fft_offset_db(fft_size)
+    stage = dict((s, 0.0) for s in STAGES)
+    done = []
+    ids = []
+    flushed = 0
+    n = 0
+    deadline = time.time() + duration
+    while time.time() < deadline:
+        t0 = time.time()
+        msg = msgq.delete_head()
+        t1 = time.time()
+        m = parse_msg(msg)
+        t2 = time.time()
+        db = fft_sum_db(m.data, k)
+        t3 = time.time()
+        log.write(m.center_freq, db, db > threshold)
+        t4 = time.time()
+        stage['wait'] += t1 - t0
+        stage['parse'] += t2 - t1
+        stage['reduce'] += t3 - t2
+        stage['log'] += t4 - t3
+        done.append(t4)
+        ids.append((msg.type(), m.center_freq, n + flushed))
+        n += 1
+        if flush_every and n % flush_every == 0:
+            # what uhd_spectrum_sense_sum.py does at the end of a sweep
+            flushed += msgq.count()
+            msgq.flush()
+    return n, flushed, stage, done, ids
+
+
+def run_one(mode, options, params, log):
+    opts = copy.copy(options)
+    for name, value in params.items():
+        setattr(opts, name, value)
+
+    cpu0 = os.times()
+    t0 = time.time()
+    if mode == 'chain':
+        tb = bench_top_block(opts)
+        tb.start()
+        n, flushed, stage, done, ids = consume(tb.sense.msgq, opts.fft_size, opts.threshold,
+                                               opts.duration, log, opts.flush_every)
+        tb.stop()
+        tb.wait()
+        # the result labelled i was queued just before retune i+1
+        latency = [d - tb.tune_times[int(label) + 1] for d, (seq, label, pos) in zip(done, ids)
+                   if int(label) + 1 < len(tb.tune_times)]
+        dropped = max(0, tb.sent() - n - flushed - tb.sense.msgq.count())
+    else:
+        msgq = gr.msg_queue(opts.queue_depth)
+        rate = opts.samp_rate / float(opts.fft_size) / \
+            (max(0, int(round(opts.tune_delay * opts.samp_rate / opts.fft_size))) +
+             max(1, int(round(opts.dwell_delay * opts.samp_rate / opts.fft_size))))
+        prod = queue_producer(msgq, opts.fft_size, rate)
+        prod.start()
+        n, flushed, stage, done, ids = consume(msgq, opts.fft_size, opts.threshold,
+                                               opts.duration, log, opts.flush_every)
+        prod.running = False
+        prod.join()
+        latency = [d - prod.sent_times[seq] for d, (seq, label, pos) in zip(done, ids)]
+        dropped = prod.dropped
+    elapsed = time.time() - t0
+    cpu1 = os.times()
+    costs = None
+    if mode == 'chain' and opts.stage_frames > 0:
+        dwell_frames = max(1, int(round(opts.dwell_delay * opts.samp_rate / opts.fft_size)))
+        costs = stage_costs(opts.fft_size, dwell_frames, opts.stage_frames)
+
+    result = dict(params)
+    result.update({
+        'mode': mode,
+        'messages': n,
+        'messages_per_sec': n / elapsed,
+        'latency_ms': dict((p, v*1e3 if v is not None else None)
+                           for p, v in percentiles(latency).items()),
+        'dropped': dropped,
+        'flushed': flushed,
+        'stage_ms_per_msg': dict((s, stage[s]*1e3/n if n else 0) for s in STAGES),
+        'cpu_user_s': cpu1[0] - cpu0[0],
+        'cpu_sys_s': cpu1[1] - cpu0[1],
+        'stage_cpu_us_per_frame': costs,
+        'elapsed_s': elapsed,
+    })
+    return result
+
+
+def git_revision():
+    try:
+        p = subprocess.Popen(['git', 'rev-parse', '--short', 'HEAD'], stdout=subprocess.PIPE,
+                             stderr=subprocess.PIPE, cwd=os.path.dirname(os.path.abspath(__file__)))
+        return p.communicate()[0].strip() or None
+    except OSError:
+        return None
+
+
+def main():
+    parser = OptionParser(option_class=eng_option)
+    expert_grp = parser.add_option_group("Expert")
+    parser.add_option("-m", "--mode", type="choice", choices=["chain", "queue"], default="chain",
+                      help="producer to drive the consumer with, chain or queue [default=%default]")
+    parser.add_option("", "--duration", type="eng_float", default=5, metavar="SECS",
+                      help="length of each run [default=%default]")
+    parser.add_option("", "--flush-every", type="int", default=0,
+                      help="flush the queue after this many messages, 0 for never [default=%default]")
+    parser.add_option("", "--stage-frames", type="int", default=20000,
+                      help="frames to time every flow graph stage over in chain mode, "
+                      "0 to skip [default=%default]")
+    parser.add_option("-o", "--output", type="string", default=None,
+                      help="append results to this file instead of stdout")
+    sense_path.add_options(parser, expert_grp)
+    usrp_device.add_options(parser, expert_grp)
+    # the swept parameters take comma separated lists
+    for opt in ("--fft-size", "--tune-delay", "--dwell-delay", "--queue-depth"):
+        parser.remove_option(opt)
+    parser.add_option("-F", "--fft-size", type="string", default="1024")
+    parser.add_option("", "--tune-delay", type="string", default="0.01")
+    parser.add_option("", "--dwell-delay", type="string", default="0.05")
+    parser.add_option("", "--queue-depth", type="string", default="16")
+    parser.add_option("-s", "--samp-rate", type="string", default="6e6")
+
+    (options, args) = parser.parse_args()
+
+    sweep = [('fft_size', int, options.fft_size),
+             ('samp_rate', float, options.samp_rate),
+             ('dwell_delay', float, options.dwell_delay),
+             ('tune_delay', float, options.tune_delay),
+             ('queue_depth', int, options.queue_depth)]
+    names = [name for name, conv, values in sweep]
+    grid = [[conv(v) for v in values.split(',')] for name, conv, values in sweep]
+
+    if options.output:
+        out = open(options.output, 'a')
+    else:
+        out = sys.stdout
+    revision = git_revision()
+
+    tmpdir = tempfile.mkdtemp(prefix="bench_sense_")
+    try:
+        for values in itertools.product(*grid):
+            params = dict(zip(names, values))
+            log = occupancy_log(os.path.join(tmpdir, "log.bin"), "bench", 'bin')
+            result = run_one(options.mode, options, params, log)
+            log.close()
+            result['revision'] = revision
+            result['time'] = time.time()
+            out.write(json.dumps(result, sort_keys=True) + "\n")
+            out.flush()
+    finally:
+        shutil.rmtree(tmpdir, True)
+
+
+if __name__ == '__main__':
+    try:
+        main()
+    except KeyboardInterrupt:
+        pass
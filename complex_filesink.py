@@ -25,6 +25,16 @@ from gnuradio import audio
 from gnuradio.eng_option import eng_option
 from optparse import OptionParser
 from gnuradio import uhd
+import signal
+import time
+
+#from current dir
+from ring_capture import ring_capture, ring_name
+from energy_capture import energy_capture
+from control_server import control_server, make_control_server
+import iq_file
+from async_writer import async_writer
+from psd_capture import psd_capture
 
 class my_top_block(gr.top_block):
 
@@ -38,6 +48,16 @@ class my_top_block(gr.top_block):
                           help="set RF frequency [default=%default]")
         parser.add_option("-a", "--amp", type="eng_float", default=.8,
 		                  help="set sinusoid amplitude, 0<=amp<=1 [default=%default]")
+        parser.add_option("", "--prefix", type="string", default="complex_out",
+                          help="name of the capture files, without .dat [default=%default]")
+        ring_capture.add_options(parser, parser)
+        energy_capture.add_options(parser, parser)
+        control_server.add_options(parser, parser)
+        async_writer.add_options(parser, parser)
+        psd_capture.add_options(parser, parser)
+        parser.add_option("", "--format", type="choice", choices=sorted(iq_file.FORMATS.keys()),
+                          default="fc32",
+                          help="sample format to record, fc32, sc16 or sc8 [default=%default]")
                           
         (options, args) = parser.parse_args ()
         if len(args) != 0:
@@ -47,17 +67,91 @@ class my_top_block(gr.top_block):
         sample_rate = int(options.sample_rate)
         ampl = options.amp
         
-        src = uhd.usrp_source(device_addr="", io_type=uhd.io_type.COMPLEX_FLOAT32, num_channels=1)
+        if (options.energy_trigger or options.psd) and options.format != 'fc32':
+            parser.error("--energy-trigger and --psd need --format fc32")
+
+        # sc16 / sc8 come straight from the device, 4 or 2 bytes a sample
+        src = uhd.usrp_source(device_addr="", io_type=iq_file.io_type(options.format), num_channels=1)
         src.set_samp_rate(sample_rate) 
         src.set_center_freq(options.freq, 0)
         src.set_gain(src.get_gain_range().stop()/2, 0)
+        itemsize = iq_file.sample_size(options.format)
         
-        file_sink = gr.file_sink(gr.sizeof_gr_complex, "complex_out.dat") 
+        self.options = options
+        self.meta = dict(format=options.format, samp_rate=src.get_samp_rate(),
+                         center_freq=options.freq, gain=src.get_gain(0))
+        self.data_file = options.prefix + ".dat"
+        # psd_capture, energy_capture, ring_capture or async_writer, all
+        # with start(), stop() and summary(); None for a plain file_sink
+        self.capture = None
+        self.ring = None
+        if options.psd > 0:
+            # spectra only, averaged in the flow graph
+            self.capture = psd_capture(src.get_samp_rate(), options.prefix + "_spectrogram.dat",
+                                       options.freq, options.fft_size, options.psd, self.meta['gain'])
+            self.data_file = None
+            self.connect (src, self.capture)
+        elif options.energy_trigger:
+            self.meta['bursts'] = options.prefix + "_bursts.csv"
+            # only the bursts, with an index of where they were
+            self.capture = energy_capture(sample_rate, options.prefix, options.threshold,
+                                          options.fft_size, options.pre_pad, options.post_pad)
+            self.connect (src, self.capture)
+        elif options.ring > 0:
+            # fixed disk use: a ring of segments, dumped on a trigger
+            file_sink = gr.file_sink(itemsize, ring_name(options.prefix, 0))
+            self.ring = ring_capture(file_sink, options.prefix, options.ring,
+                                     options.segment, options.post_trigger, self.meta)
+            self.capture = self.ring
+            self.data_file = None
+            self.connect (src, file_sink)
+        elif options.async_writer:
+            # the disk can fall behind without stalling the radio
+            self.capture = async_writer(itemsize, self.data_file, int(options.block_size),
+                                        options.blocks, options.direct, options.fsync,
+                                        options.prefix + "_gaps.csv", options.stats_interval)
+            self.connect (src, self.capture)
+        else:
+            file_sink = gr.file_sink(itemsize, self.data_file) 
+            self.connect (src, file_sink)
+
+    def write_metadata(self):
+        """
+        Write the sidecar of the capture file, just before starting.
+        """
+        if self.data_file is not None:
+            iq_file.write_metadata(self.data_file, start_time=time.time(), **self.meta)
 
-        self.connect (src, file_sink)
+    def commands(self):
+        """
+        Commands for the control endpoint.
+        """
+        commands = {}
+        if self.ring is not None:
+            commands["trigger"] = lambda value: self.ring.trigger()
+        return commands
 
 if __name__ == '__main__':
-    try:
-        my_top_block().run()
-    except KeyboardInterrupt:
-        pass
+    tb = my_top_block()
+    tb.write_metadata()
+    if tb.capture is None:
+        try:
+            tb.run()
+        except KeyboardInterrupt:
+            pass
+    else:
+        if tb.ring is not None:
+            # trigger with SIGUSR1 or the "trigger" control command
+            signal.signal(signal.SIGUSR1, lambda signum, frame: tb.ring.trigger())
+            make_control_server(tb.options, tb.commands())
+        tb.start()
+        tb.capture.start()
+        try:
+            while 1:
+                time.sleep(1)
+        except KeyboardInterrupt:
+            # the captures write out what is left once the stream has stopped
+            tb.stop()
+            tb.wait()
+            tb.capture.stop()
+            print tb.capture.summary()
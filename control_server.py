@@ -0,0 +1,134 @@
+#!/usr/bin/env python
+#
+# Runtime control endpoint for the transmit utilities.
+#
+# A running flow graph can be retuned without a restart by sending it
+# commands over localhost TCP (--control-port) or a Unix socket
+# (--control-socket).  The protocol is one JSON object per line:
+#
+#   {"cmd": "set_freq", "value": 650e6}
+#
+# and every command is answered with one line,
+#
+#   {"ok": true, "cmd": "set_freq", "elapsed": 0.0123}
+#   {"ok": false, "cmd": "set_fre", "error": "unknown command"}
+#
+# where elapsed is how long the command took to apply, in seconds.
+# {"cmd": "help"} lists the commands.  Commands are applied one at a
+# time, whichever connection they come from.
+#
+#   echo '{"cmd": "set_gain", "value": 10}' | nc localhost 5050
+#
+
+import SocketServer
+import json
+import os
+import threading
+import time
+
+
+class _handler(SocketServer.StreamRequestHandler):
+
+    def handle(self):
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            line = line.strip()
+            if not line:
+                continue
+            reply = self.server.control.execute(line)
+            self.wfile.write(json.dumps(reply) + "\n")
+            self.wfile.flush()
+
+
+class _tcp_server(SocketServer.ThreadingMixIn, SocketServer.TCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class _unix_server(SocketServer.ThreadingMixIn, SocketServer.UnixStreamServer):
+    daemon_threads = True
+
+
+class control_server(object):
+
+    def __init__(self, commands, port=None, path=None):
+        """
+        @param commands: dict of command name to a function taking the value
+        @param port: localhost TCP port to listen on
+        @param path: Unix socket to listen on instead of a port
+        """
+        self.commands = dict(commands)
+        self.lock = threading.Lock()
+        self.path = path
+        if path:
+            if os.path.exists(path):
+                os.unlink(path)
+            self.server = _unix_server(path, _handler)
+        else:
+            self.server = _tcp_server(("127.0.0.1", port), _handler)
+        self.server.control = self
+        self.thread = None
+
+    def execute(self, line):
+        """
+        Run one JSON command line and return the reply as a dict.
+        """
+        try:
+            request = json.loads(line)
+            cmd = request["cmd"]
+        except (ValueError, KeyError, TypeError), e:
+            return {"ok": False, "error": "bad request: %s" % e}
+        if cmd == "help":
+            return {"ok": True, "cmd": cmd, "commands": sorted(self.commands.keys())}
+        func = self.commands.get(cmd)
+        if func is None:
+            return {"ok": False, "cmd": cmd, "error": "unknown command"}
+        self.lock.acquire()
+        try:
+            start = time.time()
+            try:
+                func(request.get("value"))
+            except Exception, e:
+                return {"ok": False, "cmd": cmd, "error": str(e)}
+            elapsed = time.time() - start
+        finally:
+            self.lock.release()
+        return {"ok": True, "cmd": cmd, "elapsed": elapsed}
+
+    def start(self):
+        """
+        Serve commands in a background thread.
+        """
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.setDaemon(True)
+        self.thread.start()
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+        if self.path and os.path.exists(self.path):
+            os.unlink(self.path)
+
+    def add_options(normal, expert):
+        """
+        Add control endpoint options to the Options parser
+        """
+        normal.add_option("", "--control-port", type="int", default=None,
+                          help="accept JSON commands on this localhost TCP port")
+        expert.add_option("", "--control-socket", type="string", default=None, metavar="PATH",
+                          help="accept JSON commands on this Unix socket")
+    # Make a static method to call before instantiation
+    add_options = staticmethod(add_options)
+
+
+def make_control_server(options, commands):
+    """
+    Start a control_server if the options ask for one, else return None.
+    """
+    if not options.control_port and not options.control_socket:
+        return None
+    server = control_server(commands, options.control_port, options.control_socket)
+    server.start()
+    return server
@@ -0,0 +1,253 @@
+#!/usr/bin/env python
+#
+# Sliced and adaptive dwell for sense_path.
+#
+# bin_statistics_f dwells a fixed number of frames on every channel.  In
+# sliced mode sense_path gives it no tune delay and a short dwell (one
+# slice) instead, and dwell_control decides after every slice whether to
+# stay on the channel or move on:
+#
+#   - the first settle slices after a retune are thrown away, which
+#     stands in for --tune-delay;
+#   - the next slices are max-held together, exactly like a full
+#     bin_statistics_f dwell, until max_slices have been seen;
+#   - with a sequential test (sprt) the visit ends as soon as the test is
+#     confident the channel is busy or idle.
+#
+# Two threads are involved.  The tune callback runs on the GNU Radio
+# scheduler thread and calls start_visit() / move_on(); main_loop calls
+# accept() with every message.  The callback labels each slice before
+# bin_statistics_f measures it, so main_loop knows which visit a message
+# belongs to and whether it is a settle slice.  A label is a sequence
+# number: the callback returns it instead of the frequency, so
+# bin_statistics_f hands it back as the message's center_freq, and
+# accept() finds the exact label even when consecutive visits share a
+# frequency.  Dropped or flushed messages then only cost their slices.
+# When a test is used, move_on() waits (at most one slice) for main_loop
+# to score the slice that was just queued.
+#
+
+import collections
+import math
+import threading
+
+import numpy
+
+
+class sprt(object):
+    """
+    Wald's sequential probability ratio test on per-slice power in dB.
+
+    H0 (idle): power ~ N(threshold - delta, sigma^2)
+    H1 (busy): power ~ N(threshold + delta, sigma^2)
+    """
+    def __init__(self, threshold, delta=3.0, sigma=2.0, alpha=0.01, beta=0.01):
+        """
+        @param threshold: detection threshold in dB
+        @param delta: distance of each hypothesis from the threshold in dB
+        @param sigma: standard deviation of one slice's power in dB
+        @param alpha: allowed false alarm probability
+        @param beta: allowed missed detection probability
+        """
+        self.threshold = threshold
+        self.scale = 2.0 * delta / (sigma * sigma)
+        self.upper = math.log((1 - beta) / alpha)
+        self.lower = math.log(beta / (1 - alpha))
+        self.reset()
+
+    def reset(self):
+        self.llr = 0.0
+
+    def update(self, x):
+        """
+        Add one observation.  Returns 1 for busy, -1 for idle, 0 if undecided.
+        """
+        self.llr += self.scale * (x - self.threshold)
+        if self.llr >= self.upper:
+            return 1
+        if self.llr <= self.lower:
+            return -1
+        return 0
+
+
+class dwell_result(object):
+    """
+    What main_loop gets back for a finished visit; looks like a parse_msg.
+    """
+    def __init__(self, center_freq, data, slices, verdict):
+        self.center_freq = center_freq
+        self.vlen = len(data)
+        self.data = data
+        self.slices = slices        # measured slices max-held into data
+        self.verdict = verdict      # 1 busy, -1 idle, 0 ran the full dwell
+
+
+class dwell_control(object):
+
+    def __init__(self, settle_slices, max_slices, reduce=None, test=None, timeout=0.01):
+        """
+        @param settle_slices: slices to discard after a retune
+        @param max_slices: most slices measured per visit
+        @param reduce: function turning a slice vector into dB, needed with a test
+        @param test: an sprt, or None for a fixed dwell
+        @param timeout: longest the tune callback waits for a verdict, in seconds
+        """
+        self.settle_slices = settle_slices
+        self.max_slices = max(1, max_slices)
+        self.reduce = reduce
+        self.test = test
+        self.timeout = timeout
+
+        self.labels = collections.deque()     # (seq, visit, freq, slice, settle)
+        self.cond = threading.Condition()
+
+        # tune callback side
+        self.seq = 0                # label of the slice being measured
+        self.visit = -1
+        self.freq = None
+        self.settle = settle_slices
+        self.cb_slices = 0
+
+        # main_loop side, shared through cond
+        self.scored = (-1, 0)       # (visit, slices) main_loop has seen
+        self.decided = -1           # last visit main_loop finished
+
+        self.acc_visit = None
+        self.acc = None
+        self.acc_slices = 0
+
+    # -- tune callback side ---------------------------------------------
+
+    def start_visit(self, freq, settle_slices=None):
+        """
+        Called after retuning to freq.  The next slice starts the visit;
+        the tune callback returns seq to label it.
+        """
+        if settle_slices is None:
+            settle_slices = self.settle_slices
+        self.visit += 1
+        self.freq = freq
+        self.settle = settle_slices
+        self.cb_slices = 0
+        self._add_label()
+
+    def move_on(self):
+        """
+        Called by the tune callback after every slice.  Returns True when
+        the current visit is over, False to measure another slice on the
+        same frequency, labelled seq.
+        """
+        if self.visit < 0:
+            return True
+        self.cb_slices += 1
+        measured = self.cb_slices - self.settle
+        done = measured >= self.max_slices
+        if not done and measured > 0 and self.test is not None:
+            self.cond.acquire()
+            try:
+                if self.scored < (self.visit, measured) and self.decided < self.visit:
+                    self.cond.wait(self.timeout)
+                done = self.decided >= self.visit
+            finally:
+                self.cond.release()
+        if not done:
+            self._add_label()
+        return done
+
+    def _add_label(self):
+        self.seq += 1
+        self.labels.append((self.seq, self.visit, self.freq, self.cb_slices, self.settle))
+
+    # -- main_loop side -------------------------------------------------
+
+    def _label(self, seq):
+        # pop the label bin_statistics_f measured this slice under,
+        # skipping any whose message was dropped or flushed
+        while self.labels and self.labels[0][0] <= seq:
+            label = self.labels.popleft()
+            if label[0] == seq:
+                return label[1:]
+        return None
+
+    def flush(self):
+        """
+        Forget pending labels, e.g. after msgq.flush().
+        """
+        self.labels.clear()
+
+    def accept(self, m):
+        """
+        Feed one parse_msg.  Returns a dwell_result when a visit is over,
+        otherwise None.
+        """
+        label = self._label(int(m.center_freq))
+        if label is None:
+            return None
+        visit, freq, index, settle = label
+        if visit <= self.decided:
+            return None                 # already reported
+        if visit != self.acc_visit:
+            self.acc_visit = visit
+            self.acc = None
+            self.acc_slices = 0
+            if self.test is not None:
+                self.test.reset()
+        if index < settle:
+            return None
+
+        if self.acc is None:
+            self.acc = numpy.array(m.data)
+        else:
+            numpy.maximum(self.acc, m.data, self.acc)
+        self.acc_slices += 1
+
+        verdict = 0
+        if self.test is not None:
+            verdict = self.test.update(self.reduce(m.data))
+
+        # by slice number, so a dropped slice is neither waited for nor
+        # keeps the visit from finishing
+        measured = index - settle + 1
+        finished = verdict != 0 or measured >= self.max_slices
+        self.cond.acquire()
+        try:
+            self.scored = (visit, measured)
+            if finished:
+                self.decided = visit
+            self.cond.notifyAll()
+        finally:
+            self.cond.release()
+
+        if finished:
+            return dwell_result(freq, self.acc, self.acc_slices, verdict)
+        return None
+
+    def add_options(normal, expert):
+        """
+        Add adaptive dwell options to the Options parser
+        """
+        normal.add_option("", "--adaptive-dwell", action="store_true", default=False,
+                          help="leave a channel as soon as a sequential test is confident "
+                          "it is busy or idle")
+        dwell_control.add_slice_options(normal, expert)
+        expert.add_option("", "--sprt-delta", type="eng_float", default=3, metavar="DB",
+                          help="distance of the busy/idle hypotheses from the threshold [default=%default]")
+        expert.add_option("", "--sprt-sigma", type="eng_float", default=2, metavar="DB",
+                          help="spread of one slice's power [default=%default]")
+        expert.add_option("", "--sprt-alpha", type="eng_float", default=.01,
+                          help="allowed false alarm probability [default=%default]")
+        expert.add_option("", "--sprt-beta", type="eng_float", default=.01,
+                          help="allowed missed detection probability [default=%default]")
+    # Make a static method to call before instantiation
+    add_options = staticmethod(add_options)
+
+    def add_slice_options(normal, expert):
+        """
+        Add the slice length option to the Options parser, for scripts
+        that dwell in slices without the adaptive dwell
+        """
+        expert.add_option("", "--dwell-slice", type="eng_float", default=.005, metavar="SECS",
+                          help="length of one measurement slice when dwelling in slices "
+                          "(--adaptive-dwell, --tune-cache, --ddc-span) [default=%default]")
+    # Make a static method to call before instantiation
+    add_slice_options = staticmethod(add_slice_options)
@@ -0,0 +1,220 @@
+#!/usr/bin/env python
+#
+# Energy-triggered IQ capture.
+#
+# Samples are only written while the band is occupied.  The detector is
+# the sense_path chain: frames of fft_size samples go through a
+# Blackman-Harris fft_vcc and complex_to_mag_squared, and a frame is busy
+# when its fft_sum_db is above --threshold, the same test spectrum_sense
+# makes per channel.
+#
+# Two message_sinks hand the flow graph's output to Python, one with the
+# IQ frames and one with their mag squared vectors.  A thread pairs them
+# up frame by frame and runs the burst state machine: a burst starts
+# --pre-pad seconds before the first busy frame and ends once the band
+# has been idle for --post-pad seconds.  Frames are handled a whole
+# message at a time with numpy, so Python only loops over frames near a
+# burst.
+#
+# Bursts are appended to PREFIX.dat.  PREFIX_bursts.csv has one line per
+# burst,
+#
+#   start,stop,file_offset
+#
+# with start and stop as sample offsets in the received stream and
+# file_offset the sample offset of the burst in PREFIX.dat.
+#
+
+from gnuradio import gr, window
+import collections
+import threading
+
+import numpy
+
+#from current dir
+from sense_path import fft_offset_db, fft_sum_db
+
+
+class energy_capture(gr.hier_block2):
+
+    def __init__(self, samp_rate, prefix, threshold, fft_size=1024, pre_pad=.01, post_pad=.05,
+                 queue_limit=64):
+        """
+        @param samp_rate: sample rate of the input stream
+        @param prefix: name of the data and index files
+        @param threshold: detection threshold in dB, as in sense_path
+        @param fft_size: samples per detector frame
+        @param pre_pad: seconds kept before a burst
+        @param post_pad: idle seconds that end a burst
+        @param queue_limit: messages each message queue may hold
+        """
+        gr.hier_block2.__init__(self, "energy_capture",
+                gr.io_signature(1, 1, gr.sizeof_gr_complex), # Input signature
+                gr.io_signature(0, 0, 0)) # Output signature
+
+        self.fft_size = fft_size
+        self.threshold = threshold
+        self.k = fft_offset_db(fft_size)
+        frame_time = float(fft_size) / samp_rate
+        self.pre_frames = int(round(pre_pad / frame_time))
+        self.post_frames = max(1, int(round(post_pad / frame_time)))
+
+        self.iq_q = gr.msg_queue(queue_limit)
+        self.mag_q = gr.msg_queue(queue_limit)
+
+        s2v = gr.stream_to_vector(gr.sizeof_gr_complex, fft_size)
+        fft = gr.fft_vcc(fft_size, True, window.blackmanharris(fft_size))
+        c2mag = gr.complex_to_mag_squared(fft_size)
+        iq_sink = gr.message_sink(gr.sizeof_gr_complex * fft_size, self.iq_q, False)
+        mag_sink = gr.message_sink(gr.sizeof_float * fft_size, self.mag_q, False)
+        self.connect(self, s2v, fft, c2mag, mag_sink)
+        self.connect(s2v, iq_sink)
+
+        self.data = open(prefix + ".dat", 'wb')
+        self.index = open(prefix + "_bursts.csv", 'w')
+        self.index.write("start,stop,file_offset\n")
+
+        self.frame = 0                      # frames seen
+        self.written = 0                    # samples in the data file
+        self.pre = collections.deque()      # idle frames kept for padding
+        self.burst_start = None             # first frame of the open burst
+        self.burst_offset = 0               # where it starts in the data file
+        self.idle = 0                       # idle frames since the last busy one
+        self.bursts = 0
+        self.thread = None
+        self.running = False
+        self.lock = threading.Lock()
+
+    def start(self):
+        """
+        Start handling frames in a background thread.
+        """
+        self.running = True
+        self.thread = threading.Thread(target=self._run)
+        self.thread.setDaemon(True)
+        self.thread.start()
+
+    def _run(self):
+        iq = []
+        mag = []
+        niq = nmag = 0
+        while self.running:
+            # read whichever stream is behind, so neither message_sink
+            # can block the other
+            if niq < nmag:
+                a = self._frames(self.iq_q, numpy.complex64)
+                iq.append(a)
+                niq += len(a)
+            else:
+                a = self._frames(self.mag_q, numpy.float32)
+                mag.append(a)
+                nmag += len(a)
+            n = min(niq, nmag)
+            if n == 0:
+                continue
+            iq_frames = numpy.concatenate(iq)
+            mag_frames = numpy.concatenate(mag)
+            self.lock.acquire()
+            try:
+                if not self.running:
+                    return
+                self.process(iq_frames[:n], mag_frames[:n])
+            finally:
+                self.lock.release()
+            iq = [iq_frames[n:]]
+            mag = [mag_frames[n:]]
+            niq -= n
+            nmag -= n
+
+    def _frames(self, q, dtype):
+        msg = q.delete_head()
+        return numpy.frombuffer(msg.to_string(), dtype=dtype).reshape(-1, self.fft_size)
+
+    def process(self, iq, mag):
+        """
+        Run the burst state machine over matching IQ and mag squared frames.
+        """
+        busy = fft_sum_db(mag, self.k) > self.threshold
+        if self.burst_start is None and not busy.any():
+            # nothing going on, just keep the padding
+            self.frame += len(iq)
+            self._keep(iq)
+            return
+        for i in range(len(iq)):
+            if self.burst_start is None:
+                if busy[i]:
+                    self.burst_start = self.frame - len(self.pre)
+                    self.burst_offset = self.written
+                    for frame in self.pre:
+                        self._write(frame)
+                    self.pre.clear()
+                    self._write(iq[i])
+                    self.idle = 0
+                else:
+                    self._keep(iq[i:i+1])
+            else:
+                self._write(iq[i])
+                if busy[i]:
+                    self.idle = 0
+                else:
+                    self.idle += 1
+                    if self.idle >= self.post_frames:
+                        self._end_burst(self.frame + 1)
+            self.frame += 1
+
+    def _keep(self, frames):
+        if self.pre_frames == 0:
+            return
+        for frame in frames[-self.pre_frames:]:
+            self.pre.append(frame.copy())
+        while len(self.pre) > self.pre_frames:
+            self.pre.popleft()
+
+    def _write(self, frame):
+        frame.tofile(self.data)
+        self.written += self.fft_size
+
+    def _end_burst(self, stop_frame):
+        self.index.write("%d,%d,%d\n" % (self.burst_start * self.fft_size,
+                                         stop_frame * self.fft_size, self.burst_offset))
+        self.index.flush()
+        self.burst_start = None
+        self.bursts += 1
+
+    def stop(self):
+        """
+        Stop handling frames and close the files.  Call after the flow
+        graph has stopped.
+        """
+        self.lock.acquire()
+        try:
+            self.running = False
+            if self.burst_start is not None:
+                self._end_burst(self.frame)
+            self.data.close()
+            self.index.close()
+        finally:
+            self.lock.release()
+
+    def summary(self):
+        """
+        One line on what was captured, for after stop().
+        """
+        return "%d bursts written" % (self.bursts,)
+
+    def add_options(normal, expert):
+        """
+        Add energy triggered capture options to the Options parser
+        """
+        normal.add_option("", "--energy-trigger", action="store_true", default=False,
+                          help="only write IQ while the band power is above --threshold")
+        normal.add_option("", "--threshold", type="eng_float", default=-54,
+                          help="set detection threshold [default=%default]")
+        expert.add_option("-F", "--fft-size", type="int", default=1024,
+                          help="samples per detector frame [default=%default]")
+        expert.add_option("", "--pre-pad", type="eng_float", default=.01, metavar="SECS",
+                          help="IQ kept before a burst [default=%default]")
+        expert.add_option("", "--post-pad", type="eng_float", default=.05, metavar="SECS",
+                          help="IQ kept after a burst, the idle time that ends it [default=%default]")
+    # Make a static method to call before instantiation
+    add_options = staticmethod(add_options)
@@ -0,0 +1,182 @@
+#!/usr/bin/env python
+#
+# Timer based hop scheduler for the simulated primaries.
+#
+# A schedule is a list of hops (time, freq, dwell): time in seconds from
+# the start of the run, the frequency to hop to and how long to stay
+# there.  hop_scheduler.run() sleeps until each deadline, hops, and
+# records when the hop really happened, so the hop jitter can be
+# measured and the hops can be lined up with what the sensor logged.
+#
+# Schedule files have one hop per line, "TIME FREQ [DWELL]", with
+# eng_notation frequencies.  Blank lines and lines starting with # are
+# skipped.  Without DWELL a hop lasts until the next one starts.
+#
+# With a command lead the hop is handed to the device ahead of time as a
+# timed command: set_freq is called lead seconds before the deadline,
+# with the deadline, and the device makes the hop exactly then.
+#
+# The hop log is csv, one line per hop:
+#
+#   deadline,actual,freq,late,issued,kind
+#
+# with absolute times from time.time(), late = actual - deadline and
+# issued the time set_freq was called.  actual is the time set_freq
+# returned, so late includes the time the retune itself took; kind is
+# "measured".  A timed hop cannot be watched happening.  Its set_freq
+# returns the device time, in host seconds, read back right after the
+# command was issued.  If that is still before the deadline, the device
+# will hop then, and actual is the deadline with kind "scheduled".
+# Otherwise the command was late, the device carries it out straight
+# away, and actual is the time read back with kind "late".
+#
+
+from gnuradio import eng_notation
+import random
+import time
+
+
+def read_schedule(filename):
+    """
+    Read a schedule file.  Returns a list of (time, freq, dwell), sorted by time.
+    """
+    hops = []
+    f = open(filename)
+    try:
+        for n, line in enumerate(f):
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            fields = line.split()
+            if len(fields) not in (2, 3):
+                raise ValueError("%s:%d: expected TIME FREQ [DWELL]" % (filename, n+1))
+            t = float(fields[0])
+            freq = eng_notation.str_to_num(fields[1])
+            dwell = None
+            if len(fields) == 3:
+                dwell = float(fields[2])
+            hops.append((t, freq, dwell))
+    finally:
+        f.close()
+    hops.sort()
+    # a hop without a dwell lasts until the next one
+    for i in range(len(hops) - 1):
+        t, freq, dwell = hops[i]
+        if dwell is None:
+            hops[i] = (t, freq, hops[i+1][0] - t)
+    if hops and hops[-1][2] is None:
+        t, freq, dwell = hops[-1]
+        hops[-1] = (t, freq, 0)
+    return hops
+
+
+def make_schedule(channels, interval, total_time, random_order=False):
+    """
+    Make the schedule sinusoidal_primary has always followed: hop to the
+    next channel (or a random one) every interval seconds until
+    total_time, starting one interval in on channels[1].
+    """
+    hops = []
+    current = 0
+    t = interval
+    while t < total_time:
+        if random_order:
+            current = random.randint(0, len(channels) - 1)
+        else:
+            current = (current + 1) % len(channels)
+        hops.append((t, channels[current], min(interval, total_time - t)))
+        t += interval
+    return hops
+
+
+def sleep_until(deadline):
+    """
+    Sleep until time.time() reaches deadline.
+    """
+    while True:
+        remaining = deadline - time.time()
+        if remaining <= 0:
+            return
+        time.sleep(remaining)
+
+
+class hop_scheduler(object):
+
+    def __init__(self, schedule, set_freq, log_file=None, lead=0):
+        """
+        @param schedule: list of (time, freq, dwell) hops
+        @param set_freq: function that does the hop, called with the
+        frequency, and with the deadline too when lead is set; then it
+        returns the device time after issuing the hop
+        @param log_file: file name to write the hop log to, or None
+        @param lead: seconds ahead of each deadline to issue a timed hop, 0 to hop on time
+        """
+        self.schedule = list(schedule)
+        self.set_freq = set_freq
+        self.log_file = log_file
+        self.lead = lead
+        self.hops = []          # (deadline, actual, freq) of every hop made
+
+    def run(self, start=None):
+        """
+        Make every hop of the schedule, then wait out the last dwell.
+
+        @param start: time.time() the schedule times count from, default now
+        """
+        if start is None:
+            start = time.time()
+        log = None
+        if self.log_file:
+            log = open(self.log_file, 'w')
+            log.write("deadline,actual,freq,late,issued,kind\n")
+        try:
+            end = start
+            for t, freq, dwell in self.schedule:
+                deadline = start + t
+                if self.lead > 0:
+                    sleep_until(deadline - self.lead)
+                    issued = time.time()
+                    device_time = self.set_freq(freq, deadline)
+                    if device_time < deadline:
+                        actual, kind = deadline, 'scheduled'
+                    else:
+                        actual, kind = device_time, 'late'
+                else:
+                    sleep_until(deadline)
+                    issued = time.time()
+                    self.set_freq(freq)
+                    actual, kind = time.time(), 'measured'
+                self.hops.append((deadline, actual, freq))
+                if log:
+                    log.write("%.6f,%.6f,%s,%.6f,%.6f,%s\n" % (deadline, actual, freq,
+                                                              actual - deadline, issued, kind))
+                end = max(end, deadline + dwell)
+            sleep_until(end)
+        finally:
+            if log:
+                log.close()
+
+    def jitter(self):
+        """
+        Return (mean, max) of how late the hops were, in seconds.
+        """
+        if not self.hops:
+            return 0.0, 0.0
+        late = [actual - deadline for deadline, actual, freq in self.hops]
+        return sum(late) / len(late), max(late)
+
+    def add_options(normal, expert):
+        """
+        Add hop scheduler options to the Options parser
+        """
+        normal.add_option("", "--schedule", type="string", default=None, metavar="FILE",
+                          help="hop schedule file with TIME FREQ [DWELL] lines, instead of "
+                          "hopping every --channel-interval")
+        normal.add_option("", "--hop-log", type="string", default=None, metavar="FILE",
+                          help="write the time of every hop to FILE")
+        expert.add_option("", "--timed-hops", action="store_true", default=False,
+                          help="hop with timed commands against the device time")
+        expert.add_option("", "--command-lead", type="eng_float", default=.3, metavar="SECS",
+                          help="how far ahead of the hop a timed command is issued [default=%default]")
+    # Make a static method to call before instantiation
+    add_options = staticmethod(add_options)
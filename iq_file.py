@@ -0,0 +1,147 @@
+#!/usr/bin/env python
+#
+# IQ recording formats and their metadata.
+#
+# complex_filesink.py can record in three formats:
+#
+#   fc32   complex64, 8 bytes per sample (what it has always written)
+#   sc16   interleaved int16 I/Q, 4 bytes per sample, the USRP wire format
+#   sc8    interleaved int8 I/Q, 2 bytes per sample
+#
+# Next to every recording goes a sidecar, FILE.json, with the format,
+# sample rate, center frequency, gain and start time, so a recording can
+# be read back without being told how it was made.
+#
+# iq_file memory-maps a recording in any of the formats and converts to
+# complex64 only the samples asked for, a slice or a chunk at a time;
+# full scale of the integer formats becomes 1.0, as UHD does.  A raw
+# file without a sidecar is taken to be fc32.
+#
+
+import json
+import os
+
+import numpy
+
+
+# format -> (numpy dtype of one I or Q value, full scale)
+FORMATS = {
+    'fc32': (numpy.float32, 1.0),
+    'sc16': (numpy.int16, 32767.0),
+    'sc8':  (numpy.int8, 127.0),
+}
+
+
+def sample_size(format):
+    """
+    Bytes per complex sample in format.
+    """
+    return 2 * numpy.dtype(FORMATS[format][0]).itemsize
+
+
+def io_type(format):
+    """
+    The uhd.io_type a device should stream in to record format.
+    """
+    from gnuradio import uhd
+    name = {'fc32': 'COMPLEX_FLOAT32', 'sc16': 'COMPLEX_INT16', 'sc8': 'COMPLEX_INT8'}[format]
+    if not hasattr(uhd.io_type, name):
+        raise ValueError("this UHD cannot stream %s" % format)
+    return getattr(uhd.io_type, name)
+
+
+def metadata_name(filename):
+    return filename + ".json"
+
+
+def write_metadata(filename, format, samp_rate, center_freq=None, gain=None,
+                   start_time=None, **extra):
+    """
+    Write the sidecar for a recording.  Extra keyword arguments are
+    stored as they are.
+    """
+    meta = dict(extra)
+    meta.update(format=format, samp_rate=samp_rate, center_freq=center_freq,
+                gain=gain, start_time=start_time)
+    f = open(metadata_name(filename), 'w')
+    try:
+        json.dump(meta, f, indent=1, sort_keys=True)
+        f.write("\n")
+    finally:
+        f.close()
+
+
+def read_metadata(filename):
+    """
+    Return the sidecar of a recording as a dict, or None if it has none.
+    """
+    name = metadata_name(filename)
+    if not os.path.exists(name):
+        return None
+    f = open(name)
+    try:
+        return json.load(f)
+    finally:
+        f.close()
+
+
+class iq_file(object):
+
+    def __init__(self, filename, format=None):
+        """
+        @param filename: the recording
+        @param format: fc32, sc16 or sc8, default from the sidecar, else fc32
+        """
+        self.filename = filename
+        self.metadata = read_metadata(filename) or {}
+        if format is None:
+            format = self.metadata.get('format', 'fc32')
+        if format not in FORMATS:
+            raise ValueError("unknown IQ format %s" % format)
+        self.format = format
+        self.samp_rate = self.metadata.get('samp_rate')
+        self.center_freq = self.metadata.get('center_freq')
+        self.gain = self.metadata.get('gain')
+        self.start_time = self.metadata.get('start_time')
+
+        dtype, self.scale = FORMATS[format]
+        if format == 'fc32':
+            self.raw = numpy.memmap(filename, dtype=numpy.complex64, mode='r')
+        else:
+            raw = numpy.memmap(filename, dtype=dtype, mode='r')
+            self.raw = raw[:len(raw) // 2 * 2].reshape(-1, 2)
+
+    def __len__(self):
+        return len(self.raw)
+
+    def read(self, start, stop):
+        """
+        Return samples start to stop as complex64.  For fc32 this is a
+        view of the mapped file, otherwise a converted copy.
+        """
+        block = self.raw[start:stop]
+        if self.format == 'fc32':
+            return block
+        out = numpy.empty(len(block), dtype=numpy.complex64)
+        out.real = block[:, 0]
+        out.imag = block[:, 1]
+        out *= 1.0 / self.scale
+        return out
+
+    def chunks(self, chunk_samples=1<<20):
+        """
+        Generate (sample_offset, complex64 samples) for the whole file.
+        """
+        for start in xrange(0, len(self), chunk_samples):
+            yield start, self.read(start, start + chunk_samples)
+
+    def add_options(normal, expert):
+        """
+        Add recording format options to the Options parser
+        """
+        normal.add_option("", "--format", type="choice", choices=sorted(FORMATS.keys()),
+                          default=None,
+                          help="sample format, one of fc32, sc16, sc8 [default=from the "
+                          ".json sidecar, else fc32]")
+    # Make a static method to call before instantiation
+    add_options = staticmethod(add_options)
@@ -0,0 +1,196 @@
+#!/usr/bin/env python
+#
+# Counters, gauges and latency histograms for the sensing pipeline.
+#
+# Instrumented code asks the module registry for its metrics once, at
+# import time, and then only does an add or a bisect per event, cheap
+# enough to leave on all the time.  With several receivers one metric is
+# updated from several threads (the reader threads and the scheduler
+# threads running the tune callbacks), so every update takes the
+# metric's lock; readers only ever see a slightly stale value.
+#
+# The registry renders the Prometheus text format.  start_exporter()
+# either rewrites --metrics-file every --metrics-interval seconds (via a
+# temporary file and a rename, so readers never see half a file, e.g.
+# for the node_exporter textfile collector) or serves it on
+# http://127.0.0.1:PORT/metrics with --metrics-port, or both.
+#
+
+import BaseHTTPServer
+import bisect
+import os
+import threading
+import time
+
+
+# seconds, from 10 us to 10 s
+LATENCY_BUCKETS = (1e-5, 3e-5, 1e-4, 3e-4, 1e-3, 3e-3, 1e-2, 3e-2, .1, .3, 1, 3, 10)
+
+
+class counter(object):
+    type = 'counter'
+
+    def __init__(self, name, help):
+        self.name = name
+        self.help = help
+        self.value = 0
+        self.lock = threading.Lock()
+
+    def inc(self, n=1):
+        self.lock.acquire()
+        try:
+            self.value += n
+        finally:
+            self.lock.release()
+
+    def samples(self):
+        return [(self.name, self.value)]
+
+
+class gauge(counter):
+    type = 'gauge'
+
+    def set(self, value):
+        self.value = value
+
+
+class histogram(object):
+    type = 'histogram'
+
+    def __init__(self, name, help, buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self.lock = threading.Lock()
+
+    def observe(self, value):
+        i = bisect.bisect_left(self.buckets, value)
+        self.lock.acquire()
+        try:
+            self.counts[i] += 1
+            self.sum += value
+            self.count += 1
+        finally:
+            self.lock.release()
+
+    def samples(self):
+        # a consistent snapshot, so the buckets add up to the count
+        self.lock.acquire()
+        try:
+            counts = list(self.counts)
+            sum, count = self.sum, self.count
+        finally:
+            self.lock.release()
+        out = []
+        total = 0
+        for le, n in zip(self.buckets, counts):
+            total += n
+            out.append(('%s_bucket{le="%g"}' % (self.name, le), total))
+        out.append(('%s_bucket{le="+Inf"}' % self.name, count))
+        out.append(('%s_sum' % self.name, sum))
+        out.append(('%s_count' % self.name, count))
+        return out
+
+
+class registry(object):
+
+    def __init__(self):
+        self.metrics = []
+        self.by_name = {}
+
+    def _add(self, metric):
+        # asking twice for a name returns the same metric
+        if metric.name in self.by_name:
+            return self.by_name[metric.name]
+        self.metrics.append(metric)
+        self.by_name[metric.name] = metric
+        return metric
+
+    def counter(self, name, help):
+        return self._add(counter(name, help))
+
+    def gauge(self, name, help):
+        return self._add(gauge(name, help))
+
+    def histogram(self, name, help, buckets=LATENCY_BUCKETS):
+        return self._add(histogram(name, help, buckets))
+
+    def render(self):
+        """
+        Return every metric in the Prometheus text format.
+        """
+        lines = []
+        for m in self.metrics:
+            lines.append("# HELP %s %s" % (m.name, m.help))
+            lines.append("# TYPE %s %s" % (m.name, m.type))
+            for name, value in m.samples():
+                lines.append("%s %s" % (name, repr(float(value))))
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = registry()
+
+
+class _handler(BaseHTTPServer.BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        if self.path != '/metrics':
+            self.send_error(404)
+            return
+        body = self.server.registry.render()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def write_file(filename, reg=REGISTRY):
+    """
+    Atomically replace filename with the current metrics.
+    """
+    tmp = filename + ".tmp"
+    f = open(tmp, 'w')
+    try:
+        f.write(reg.render())
+    finally:
+        f.close()
+    os.rename(tmp, filename)
+
+
+def start_exporter(options, reg=REGISTRY):
+    """
+    Start the exporters the options ask for, in daemon threads.
+    """
+    if options.metrics_port:
+        server = BaseHTTPServer.HTTPServer(("127.0.0.1", options.metrics_port), _handler)
+        server.registry = reg
+        t = threading.Thread(target=server.serve_forever)
+        t.setDaemon(True)
+        t.start()
+    if options.metrics_file:
+        def run():
+            while True:
+                write_file(options.metrics_file, reg)
+                time.sleep(options.metrics_interval)
+        t = threading.Thread(target=run)
+        t.setDaemon(True)
+        t.start()
+
+
+def add_options(normal, expert):
+    """
+    Add metrics export options to the Options parser
+    """
+    expert.add_option("", "--metrics-file", type="string", default=None, metavar="FILE",
+                      help="write metrics in Prometheus text format to FILE")
+    expert.add_option("", "--metrics-port", type="int", default=None,
+                      help="serve metrics on http://127.0.0.1:PORT/metrics")
+    expert.add_option("", "--metrics-interval", type="eng_float", default=5, metavar="SECS",
+                      help="how often --metrics-file is rewritten [default=%default]")
@@ -0,0 +1,206 @@
+#!/usr/bin/env python
+#
+# Several simulated primaries in one transmit stream.
+#
+# tone_bank puts a tone at every given offset from the LO.  Each tone is
+# a table of whole periods of a complex exponential, computed once and
+# looped by a vector_source_c, so no trig runs per sample.  With a
+# whole Hz sample rate and offset, some whole number of periods is a
+# whole number of samples: the table holds as many of them as fit in
+# SHORT_TABLE_LEN samples, or one if that is longer, up to --table-len.
+# Otherwise the table is --table-len samples and the offset is rounded to
+# the nearest multiple of samp_rate/table_len.  Every tone goes through
+# its own multiply_const_cc, which gates it on and off, and the tones are
+# added together.  The LO is never touched.
+#
+# tone_scheduler switches the tones from a schedule like the
+# hop_scheduler one, "TIME OFFSET DWELL": the tone at OFFSET is on from
+# TIME for DWELL seconds.  Its log is csv,
+#
+#   deadline,actual,offset,on,late
+#
+
+from gnuradio import gr, eng_notation
+import math
+import time
+
+import numpy
+
+#from current dir
+from hop_scheduler import sleep_until
+
+
+# whole periods of a tone are packed into about this many samples
+SHORT_TABLE_LEN = 4096
+
+_tables = {}
+
+
+def tone_table(samp_rate, offset, table_len):
+    """
+    Return (table, actual offset): a whole number of periods of a complex
+    tone at offset, at most table_len samples long.  Tables are cached.
+    """
+    n = int(round(samp_rate))
+    f = int(round(offset))
+    if n == samp_rate and f == offset:
+        # exact: as many whole periods as fit in SHORT_TABLE_LEN samples,
+        # or one period if it is longer but still within table_len
+        period = n // gcd(n, abs(f))
+        if period <= table_len:
+            table_len = period * max(1, min(table_len, SHORT_TABLE_LEN) // period)
+    cycles = int(round(offset * table_len / float(samp_rate)))
+    key = (table_len, cycles)
+    if key not in _tables:
+        phase = 2 * math.pi * cycles * numpy.arange(table_len) / table_len
+        _tables[key] = tuple(numpy.exp(1j * phase).astype(numpy.complex64).tolist())
+    return _tables[key], cycles * float(samp_rate) / table_len
+
+
+def gcd(a, b):
+    while b:
+        a, b = b, a % b
+    return a
+
+
+def parse_tones(specs):
+    """
+    Turn a list of "OFFSET[:AMP]" strings into (offset, amp) tuples.
+    """
+    tones = []
+    for spec in specs or []:
+        if ':' in spec:
+            offset, amp = spec.split(':')
+            amp = float(amp)
+        else:
+            offset, amp = spec, None
+        tones.append((eng_notation.str_to_num(offset), amp))
+    return tones
+
+
+class tone_bank(gr.hier_block2):
+
+    def __init__(self, samp_rate, tones, table_len=65536, default_amp=.8):
+        """
+        @param samp_rate: sample rate of the stream
+        @param tones: list of (offset, amp); amp None shares default_amp between the tones
+        @param table_len: longest waveform table per tone
+        @param default_amp: total amplitude of the tones without an amp
+        """
+        gr.hier_block2.__init__(self, "tone_bank",
+                gr.io_signature(0, 0, 0), # Input signature
+                gr.io_signature(1, 1, gr.sizeof_gr_complex)) # Output signature
+
+        share = default_amp / max(1, len([a for o, a in tones if a is None]))
+        self.offsets = []
+        self.amps = []
+        self.gates = []
+        for offset, amp in tones:
+            if abs(offset) >= samp_rate / 2:
+                raise ValueError("tone at %s is outside the %s passband"
+                                 % (eng_notation.num_to_str(offset), eng_notation.num_to_str(samp_rate)))
+            if amp is None:
+                amp = share
+            table, actual = tone_table(samp_rate, offset, table_len)
+            src = gr.vector_source_c(table, True)
+            gate = gr.multiply_const_cc(0)
+            self.connect(src, gate)
+            self.offsets.append(actual)
+            self.amps.append(amp)
+            self.gates.append(gate)
+
+        if len(self.gates) == 1:
+            self.connect(self.gates[0], self)
+        else:
+            add = gr.add_cc()
+            for i, gate in enumerate(self.gates):
+                self.connect(gate, (add, i))
+            self.connect(add, self)
+
+    def tone(self, offset):
+        """
+        Index of the tone nearest to offset.
+        """
+        return min(range(len(self.offsets)), key=lambda i: abs(self.offsets[i] - offset))
+
+    def set_tone(self, offset, on):
+        """
+        Switch the tone nearest to offset on or off.
+        """
+        i = self.tone(offset)
+        if on:
+            self.gates[i].set_k(self.amps[i])
+        else:
+            self.gates[i].set_k(0)
+
+    def set_all(self, on):
+        for offset in self.offsets:
+            self.set_tone(offset, on)
+
+
+class tone_scheduler(object):
+
+    def __init__(self, schedule, bank, log_file=None):
+        """
+        @param schedule: list of (time, offset, dwell), e.g. from read_schedule
+        @param bank: the tone_bank to switch
+        @param log_file: file name to write the switch log to, or None
+        """
+        self.bank = bank
+        self.log_file = log_file
+        # on at time, off after dwell
+        self.events = []
+        for t, offset, dwell in schedule:
+            self.events.append((t, 1, offset))
+            self.events.append((t + dwell, 0, offset))
+        # off before on, so back to back visits of a tone stay on
+        self.events.sort()
+        self.switches = []      # (deadline, actual, offset, on)
+
+    def run(self, start=None):
+        """
+        Make every switch of the schedule.
+
+        @param start: time.time() the schedule times count from, default now
+        """
+        if start is None:
+            start = time.time()
+        log = None
+        if self.log_file:
+            log = open(self.log_file, 'w')
+            log.write("deadline,actual,offset,on,late\n")
+        try:
+            for t, on, offset in self.events:
+                deadline = start + t
+                sleep_until(deadline)
+                actual = time.time()
+                self.bank.set_tone(offset, on)
+                self.switches.append((deadline, actual, offset, on))
+                if log:
+                    log.write("%.6f,%.6f,%s,%d,%.6f\n" % (deadline, actual, offset, on,
+                                                        actual - deadline))
+        finally:
+            if log:
+                log.close()
+
+    def add_options(normal, expert):
+        """
+        Add multi-tone options to the Options parser
+        """
+        normal.add_option("", "--tone", type="string", action="append", default=[],
+                          metavar="OFFSET[:AMP]",
+                          help="transmit a tone at OFFSET from the center frequency, may be "
+                          "repeated; replaces hopping the LO")
+        normal.add_option("", "--tone-schedule", type="string", default=None, metavar="FILE",
+                          help="switch tones on and off by a TIME OFFSET DWELL schedule "
+                          "[default=all on]")
+        expert.add_option("", "--tone-log", type="string", default=None, metavar="FILE",
+                          help="write the time of every tone switch to FILE")
+        expert.add_option("", "--table-len", type="int", default=65536,
+                          help="longest precomputed waveform table per tone; only a tone "
+                          "whose period is longer than %d samples uses more than that, and "
+                          "one whose period is longer than this is rounded to fit "
+                          "[default=%%default]" % (SHORT_TABLE_LEN,))
+    # Make a static method to call before instantiation
+    add_options = staticmethod(add_options)
+
@@ -0,0 +1,200 @@
+#!/usr/bin/env python
+#
+# Buffered occupancy logger for the spectrum sensing scripts.
+#
+# Replaces opening spectrum_sense_exp_*.csv in append mode for every
+# message.  The file is kept open for the whole run and records are
+# batched in memory, then written out when enough bytes have built up,
+# when enough time has passed, and at exit.
+#
+# Two formats are supported:
+#
+#   csv  the legacy format: a header line, then "1," or "0," per channel
+#        and a newline at the end of every sweep.
+#
+#   bin  a binary columnar format.  After the file header, each flush
+#        writes one block:
+#
+#            'BLK0' <uint32 n>
+#            float64[n] timestamp (seconds since the epoch)
+#            float64[n] center_freq (Hz)
+#            float32[n] power (dB)
+#            uint8[n]   decision (1 = occupied)
+#
+#        all little-endian.  read_occupancy_log() loads it back.
+#
+
+import atexit
+import struct
+import time
+
+import numpy
+
+BIN_MAGIC = "OCCLOG1\n"
+BLOCK_MAGIC = "BLK0"
+
+FORMATS = {'csv': '.csv', 'bin': '.bin'}
+
+
+class occupancy_log(object):
+
+    def __init__(self, filename, header, format='csv', flush_secs=5.0, flush_bytes=1<<20):
+        """
+        Open filename for writing and write the header.
+
+        @param filename: output file, truncated if it exists
+        @param header: one line of text describing the run
+        @param format: 'csv' or 'bin'
+        @param flush_secs: write out buffered records at least this often
+        @param flush_bytes: write out buffered records once this many bytes are pending
+        """
+        if format not in FORMATS:
+            raise ValueError("unknown log format %r" % (format,))
+        self.filename = filename
+        self.format = format
+        self.flush_secs = flush_secs
+        self.flush_bytes = flush_bytes
+        self.last_flush = time.time()
+
+        self.f = open(filename, 'wb')
+        if format == 'csv':
+            self.f.write("%s\n" % (header,))
+            self.pending = []
+            self.pending_bytes = 0
+        else:
+            self.f.write(BIN_MAGIC)
+            self.f.write(struct.pack('<I', len(header)))
+            self.f.write(header)
+            # one record is 8 + 8 + 4 + 1 bytes
+            self.capacity = max(1, flush_bytes // 21)
+            self.timestamp = numpy.zeros(self.capacity, dtype='<f8')
+            self.center_freq = numpy.zeros(self.capacity, dtype='<f8')
+            self.db = numpy.zeros(self.capacity, dtype='<f4')
+            self.decision = numpy.zeros(self.capacity, dtype='u1')
+            self.n = 0
+        self.f.flush()
+
+        # make sure buffered records survive ^C and sys.exit
+        atexit.register(self.close)
+
+    def write(self, center_freq, db, decision, end_of_sweep=False, timestamp=None):
+        """
+        Record one channel measurement.
+
+        @param center_freq: channel center frequency in Hz
+        @param db: measured power in dB
+        @param decision: True if the channel was judged occupied
+        @param end_of_sweep: True for the last channel of a sweep (csv only)
+        @param timestamp: time of the measurement, defaults to now
+        """
+        if self.f is None:
+            return
+        now = time.time()
+        if self.format == 'csv':
+            if decision:
+                s = "1,"
+            else:
+                s = "0,"
+            if end_of_sweep:
+                s += "\n"
+            self.pending.append(s)
+            self.pending_bytes += len(s)
+            full = self.pending_bytes >= self.flush_bytes
+        else:
+            if timestamp is None:
+                timestamp = now
+            i = self.n
+            self.timestamp[i] = timestamp
+            self.center_freq[i] = center_freq
+            self.db[i] = db
+            self.decision[i] = bool(decision)
+            self.n += 1
+            full = self.n >= self.capacity
+
+        if full or now - self.last_flush >= self.flush_secs:
+            self.flush()
+
+    def flush(self):
+        """
+        Write out everything buffered so far.
+        """
+        if self.f is None:
+            return
+        if self.format == 'csv':
+            if self.pending:
+                self.f.write("".join(self.pending))
+                self.pending = []
+                self.pending_bytes = 0
+        elif self.n:
+            n = self.n
+            self.f.write(BLOCK_MAGIC)
+            self.f.write(struct.pack('<I', n))
+            for col in (self.timestamp, self.center_freq, self.db, self.decision):
+                self.f.write(col[:n].tostring())
+            self.n = 0
+        self.f.flush()
+        self.last_flush = time.time()
+
+    def close(self):
+        if self.f is None:
+            return
+        self.flush()
+        self.f.close()
+        self.f = None
+
+    def add_options(normal, expert):
+        """
+        Add logger specific options to the Options parser
+        """
+        normal.add_option("", "--log-format", type="choice", choices=sorted(FORMATS.keys()),
+                          default="csv",
+                          help="log file format, csv (0/1 per channel) or bin (columnar) [default=%default]")
+        expert.add_option("", "--log-flush-secs", type="eng_float", default=5.0, metavar="SECS",
+                          help="write buffered log records at least this often [default=%default]")
+        expert.add_option("", "--log-flush-bytes", type="intx", default=1<<20,
+                          help="write buffered log records once this many bytes are pending [default=%default]")
+    # Make a static method to call before instantiation
+    add_options = staticmethod(add_options)
+
+
+def open_log(prefix, header, options):
+    """
+    Create an occupancy_log named prefix + timestamp using the --log-* options.
+    """
+    filename = prefix + time.strftime('%y%m%d_%H%M%S') + FORMATS[options.log_format]
+    return occupancy_log(filename, header, options.log_format,
+                         options.log_flush_secs, options.log_flush_bytes)
+
+
+def read_occupancy_log(filename):
+    """
+    Load a bin format log.
+
+    @rtype: (header, dict of column name -> numpy array)
+    """
+    f = open(filename, 'rb')
+    try:
+        if f.read(len(BIN_MAGIC)) != BIN_MAGIC:
+            raise ValueError("%s is not a binary occupancy log" % (filename,))
+        (hlen,) = struct.unpack('<I', f.read(4))
+        header = f.read(hlen)
+        cols = {'timestamp': [], 'center_freq': [], 'db': [], 'decision': []}
+        while True:
+            magic = f.read(4)
+            if len(magic) < 4:
+                break
+            if magic != BLOCK_MAGIC:
+                raise ValueError("%s: corrupt block" % (filename,))
+            (n,) = struct.unpack('<I', f.read(4))
+            for name, dtype in (('timestamp', '<f8'), ('center_freq', '<f8'),
+                                ('db', '<f4'), ('decision', 'u1')):
+                size = numpy.dtype(dtype).itemsize
+                cols[name].append(numpy.fromstring(f.read(n*size), dtype=dtype))
+    finally:
+        f.close()
+    for name in cols:
+        if cols[name]:
+            cols[name] = numpy.concatenate(cols[name])
+        else:
+            cols[name] = numpy.zeros(0)
+    return header, cols
@@ -0,0 +1,325 @@
+#!/usr/bin/env python
+#
+# Opt-in profiling of the sensing loop.
+#
+# bin_statistics_f calls tune.eval on a GNU Radio scheduler thread for
+# every retune, and the stream is stalled for as long as that Python
+# runs, so time spent there stretches the whole sweep.  With --profile,
+# start_profiler() wraps the functions it is given (parse_msg,
+# tune.eval, set_next_freq and set_freq in the sense scripts) in a timer
+# that only reads the clock twice and adds up under a lock, and nothing
+# is wrapped without it.  main_loop runs once for the whole session, so
+# instead of being wrapped it reports each iteration with record(),
+# split into main_loop.wait (blocked on the next result) and
+# main_loop.work (everything else); record() does nothing without
+# --profile.
+#
+# At exit it prints to stderr
+#
+#   - a per-function breakdown: calls, total, mean and max time;
+#   - a per-sweep timeline: the wall time of every sweep, marked by the
+#     caller with mark_sweep(), and the time each function took in it;
+#   - an attribution of the sweep time to UHD tuning (set_freq), Python
+#     in the tune callback (the rest of tune.eval) and the flow graph
+#     (everything else, samples streaming and settling).
+#
+# Times are inclusive, tune.eval contains set_next_freq contains
+# set_freq, and with several receivers the callbacks run in parallel,
+# so the function times of a sweep can add up to more than its wall time.
+# The attribution is divided by the number of receivers, which makes it
+# the split of an average receiver's time.
+#
+# --profile-sample MS also samples the Python stack of every thread each
+# MS milliseconds and reports the functions seen most, and
+# --profile-stacks FILE writes the samples as collapsed stacks for
+# flamegraph.pl.  Scheduler threads only have a Python stack while they
+# are in a callback, so the sampler sees the Python side only.
+#
+# --profile-timeline FILE also writes the timeline as csv.
+#
+
+import atexit
+import sys
+import thread
+import threading
+import time
+
+
+class profiler(object):
+
+    def __init__(self, receivers=1):
+        """
+        @param receivers: number of receivers whose callbacks are timed
+        """
+        self.receivers = max(1, receivers)
+        self.stats = {}             # label -> [calls, total, max]
+        self.labels = []
+        self.lock = threading.Lock()
+        self.start_time = time.time()
+        self.sweep_start = self.start_time
+        self.sweep_totals = {}      # label -> total at the start of the sweep
+        self.sweeps = []            # (start, wall, {label: seconds})
+        self.sampler = None
+
+    def patch(self, owner, name, label=None):
+        """
+        Replace owner.name, a function or method of a module or class,
+        with a timed version.
+
+        @param label: name to report it under, default name
+        """
+        if label is None:
+            label = name
+        orig = getattr(owner, name)
+        self._stat(label)
+        add = self.add
+        clock = time.time
+
+        def timed(*args, **kwargs):
+            t0 = clock()
+            try:
+                return orig(*args, **kwargs)
+            finally:
+                add(label, clock() - t0)
+        timed.__name__ = name
+        timed.__doc__ = orig.__doc__
+        setattr(owner, name, timed)
+
+    def _stat(self, label):
+        # call with the lock held, or before any thread runs
+        stat = self.stats.get(label)
+        if stat is None:
+            stat = self.stats[label] = [0, 0.0, 0.0]
+            self.labels.append(label)
+        return stat
+
+    def add(self, label, seconds):
+        """
+        Count one call of label that took seconds.
+        """
+        self.lock.acquire()
+        try:
+            stat = self._stat(label)
+            stat[0] += 1
+            stat[1] += seconds
+            if seconds > stat[2]:
+                stat[2] = seconds
+        finally:
+            self.lock.release()
+
+    def mark_sweep(self):
+        """
+        Close the current sweep of the timeline and start the next.
+        """
+        now = time.time()
+        spent = {}
+        self.lock.acquire()
+        try:
+            for label in self.labels:
+                total = self.stats[label][1]
+                spent[label] = total - self.sweep_totals.get(label, 0.0)
+                self.sweep_totals[label] = total
+        finally:
+            self.lock.release()
+        self.sweeps.append((self.sweep_start - self.start_time, now - self.sweep_start, spent))
+        self.sweep_start = now
+
+    def breakdown(self):
+        """
+        Return the per-function breakdown as text.
+        """
+        run = max(time.time() - self.start_time, 1e-9)
+        lines = ["%-16s %8s %10s %10s %10s %7s" % ("function", "calls", "total s",
+                                                  "mean ms", "max ms", "% run")]
+        for label in self.labels:
+            calls, total, longest = self.stats[label]
+            lines.append("%-16s %8d %10.3f %10.3f %10.3f %6.1f%%"
+                         % (label, calls, total, 1e3 * total / max(calls, 1),
+                            1e3 * longest, 100 * total / run))
+        return "\n".join(lines)
+
+    def timeline(self):
+        """
+        Return the per-sweep timeline as text.
+        """
+        lines = ["%5s %9s %9s " % ("sweep", "start s", "wall s")
+                 + " ".join(["%13s" % label for label in self.labels])]
+        for i, (start, wall, spent) in enumerate(self.sweeps):
+            lines.append("%5d %9.3f %9.3f " % (i, start, wall)
+                         + " ".join(["%13.3f" % spent.get(label, 0.0) for label in self.labels]))
+        return "\n".join(lines)
+
+    def attribution(self):
+        """
+        Return where the time of the finished sweeps went, as text, or
+        None without the tune.eval and set_freq timings.
+        """
+        if not self.sweeps or 'tune.eval' not in self.stats or 'set_freq' not in self.stats:
+            return None
+        wall = sum([s[1] for s in self.sweeps])
+        # the receivers' callbacks run side by side, so share them out
+        callback = sum([s[2].get('tune.eval', 0.0) for s in self.sweeps]) / self.receivers
+        tuning = sum([s[2].get('set_freq', 0.0) for s in self.sweeps]) / self.receivers
+        parts = [("UHD tuning (set_freq)", tuning),
+                 ("Python in the tune callback", max(0.0, callback - tuning)),
+                 ("flow graph", max(0.0, wall - callback))]
+        lines = ["%d sweeps, %.3f s" % (len(self.sweeps), wall)]
+        if self.receivers > 1:
+            lines[0] += ", per receiver of %d" % self.receivers
+        for name, t in parts:
+            lines.append("  %-28s %10.3f s %6.1f%%" % (name, t, 100 * t / max(wall, 1e-9)))
+        return "\n".join(lines)
+
+    def write_timeline(self, filename):
+        f = open(filename, 'w')
+        try:
+            f.write(",".join(["sweep", "start", "wall"] + self.labels) + "\n")
+            for i, (start, wall, spent) in enumerate(self.sweeps):
+                f.write(",".join(["%d" % i, "%.6f" % start, "%.6f" % wall]
+                                 + ["%.6f" % spent.get(label, 0.0) for label in self.labels]) + "\n")
+        finally:
+            f.close()
+
+    def report(self, out=sys.stderr):
+        """
+        Print the breakdown, the timeline, the attribution and the
+        sampler's findings.
+        """
+        out.write("\nprofile: per function\n%s\n" % self.breakdown())
+        out.write("\nprofile: per sweep\n%s\n" % self.timeline())
+        attribution = self.attribution()
+        if attribution:
+            out.write("\nprofile: sweep time\n%s\n" % attribution)
+        if self.sampler is not None:
+            self.sampler.stop()
+            out.write("\nprofile: sampled\n%s\n" % self.sampler.report())
+
+
+class sampler(object):
+    """
+    Samples the Python stack of every other thread from a thread of its own.
+    """
+    def __init__(self, interval):
+        """
+        @param interval: seconds between samples
+        """
+        self.interval = interval
+        self.samples = 0
+        self.leaf = {}              # function -> samples it was running in
+        self.stacks = {}            # collapsed stack -> samples
+        self.running = False
+        self.thread = None
+
+    def start(self):
+        self.running = True
+        self.thread = threading.Thread(target=self._run)
+        self.thread.setDaemon(True)
+        self.thread.start()
+
+    def stop(self):
+        self.running = False
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+
+    def _run(self):
+        me = thread.get_ident()
+        while self.running:
+            time.sleep(self.interval)
+            for tid, frame in sys._current_frames().items():
+                if tid == me:
+                    continue
+                names = []
+                while frame is not None:
+                    code = frame.f_code
+                    names.append("%s (%s:%d)" % (code.co_name, code.co_filename,
+                                                 code.co_firstlineno))
+                    frame = frame.f_back
+                self.samples += 1
+                self.leaf[names[0]] = self.leaf.get(names[0], 0) + 1
+                stack = ";".join(reversed(names))
+                self.stacks[stack] = self.stacks.get(stack, 0) + 1
+
+    def report(self, top=15):
+        """
+        Return the functions seen running most often, as text.
+        """
+        lines = ["%d samples" % self.samples]
+        ranked = sorted(self.leaf.items(), key=lambda x: x[1], reverse=True)
+        for name, n in ranked[:top]:
+            lines.append("%6.1f%%  %s" % (100.0 * n / max(self.samples, 1), name))
+        return "\n".join(lines)
+
+    def write_stacks(self, filename):
+        """
+        Write the samples as collapsed stacks, one "stack count" line each.
+        """
+        f = open(filename, 'w')
+        try:
+            for stack, n in sorted(self.stacks.items()):
+                f.write("%s %d\n" % (stack, n))
+        finally:
+            f.close()
+
+
+_active = None
+
+
+def mark_sweep():
+    """
+    Mark the end of a sweep, if profiling.
+    """
+    if _active is not None:
+        _active.mark_sweep()
+
+
+def record(label, seconds):
+    """
+    Count one call of label that took seconds, if profiling.
+    """
+    if _active is not None:
+        _active.add(label, seconds)
+
+
+def start_profiler(options, targets, receivers=1):
+    """
+    Start profiling if the options ask for it, and report at exit.
+
+    @param targets: (owner, name, label) to time, see profiler.patch
+    @param receivers: number of receivers, for the attribution
+    @returns: the profiler, or None
+    """
+    global _active
+    if not options.profile:
+        return None
+    prof = profiler(receivers)
+    for owner, name, label in targets:
+        prof.patch(owner, name, label)
+    if options.profile_sample > 0:
+        prof.sampler = sampler(options.profile_sample / 1e3)
+        prof.sampler.start()
+
+    def finish():
+        prof.report()
+        if options.profile_timeline:
+            prof.write_timeline(options.profile_timeline)
+        if prof.sampler is not None and options.profile_stacks:
+            prof.sampler.write_stacks(options.profile_stacks)
+    atexit.register(finish)
+    _active = prof
+    return prof
+
+
+def add_options(normal, expert):
+    """
+    Add profiling options to the Options parser
+    """
+    expert.add_option("", "--profile", action="store_true", default=False,
+                      help="time main_loop and the tune callback and report at exit")
+    expert.add_option("", "--profile-sample", type="eng_float", default=0, metavar="MS",
+                      help="with --profile, also sample Python stacks every MS ms, "
+                      "0 for never [default=%default]")
+    expert.add_option("", "--profile-stacks", type="string", default=None, metavar="FILE",
+                      help="write the sampled stacks to FILE for flamegraph.pl")
+    expert.add_option("", "--profile-timeline", type="string", default=None, metavar="FILE",
+                      help="write the per-sweep timeline to FILE as csv")
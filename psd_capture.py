@@ -0,0 +1,176 @@
+#!/usr/bin/env python
+#
+# Direct-to-PSD capture for long band surveys.
+#
+# Instead of IQ, psd_capture stores averaged power spectra.  The chain is
+# the sense_path one, stream_to_vector, a Blackman-Harris fft_vcc and
+# complex_to_mag_squared, followed by a single_pole_iir_filter_ff with
+# alpha = 1/average and keep_one_in_n, so the averaging runs in the flow
+# graph and Python only sees one vector per `average` frames.  The
+# filter starts from zero, so after n frames its output is short by a
+# factor 1-(1-alpha)^n; each row is divided by that factor, which makes
+# it the plain weighted average of the frames seen so far.  The first
+# rows are then unbiased instead of about 2 dB low.
+#
+# Rows are appended to PREFIX_spectrogram.dat as fixed size records,
+#
+#   timestamp     float64, time.time() at the end of the row
+#   center_freq   float64, Hz
+#   power         float32 x fft_size, dB with the sense_path offset k,
+#                 in fft_vcc order (DC first) like a bin_statistics_f vector
+#
+# with an iq_file style .json sidecar (format "psd") giving fft_size,
+# average and the sample rate.  read_spectrogram() maps the file as a
+# numpy record array, so week-long surveys never have to be loaded.
+# Appending to an existing file is only allowed with the same fft_size,
+# average and sample rate, and its sidecar is kept as it is.
+# Timestamps count samples from the start time rather than reading the
+# clock, so queueing delays do not skew them.
+#
+
+from gnuradio import gr, window
+import os
+import threading
+import time
+
+import numpy
+
+#from current dir
+from sense_path import fft_offset_db
+import iq_file
+
+
+def row_dtype(fft_size):
+    """
+    numpy dtype of one spectrogram row.
+    """
+    return numpy.dtype([('timestamp', '<f8'), ('center_freq', '<f8'),
+                        ('power', '<f4', (fft_size,))])
+
+
+def read_spectrogram(filename):
+    """
+    Memory-map a spectrogram file written by psd_capture.
+    """
+    meta = iq_file.read_metadata(filename)
+    if meta is None or meta.get('format') != 'psd':
+        raise ValueError("%s has no psd sidecar" % filename)
+    return numpy.memmap(filename, dtype=row_dtype(meta['fft_size']), mode='r')
+
+
+class psd_capture(gr.hier_block2):
+
+    def __init__(self, samp_rate, filename, center_freq, fft_size=1024, average=100, gain=None):
+        """
+        @param samp_rate: sample rate of the input stream
+        @param filename: spectrogram file to append to
+        @param center_freq: frequency the stream is tuned to
+        @param fft_size: number of FFT bins
+        @param average: frames averaged into each row
+        @param gain: RX gain, for the sidecar
+        """
+        gr.hier_block2.__init__(self, "psd_capture",
+                gr.io_signature(1, 1, gr.sizeof_gr_complex), # Input signature
+                gr.io_signature(0, 0, 0)) # Output signature
+
+        self.samp_rate = samp_rate
+        self.filename = filename
+        self.center_freq = center_freq
+        self.fft_size = fft_size
+        self.average = max(1, average)
+        self.gain = gain
+        self.k = fft_offset_db(fft_size)
+        self.row_time = float(fft_size) * self.average / samp_rate
+
+        self.msgq = gr.msg_queue(64)
+        s2v = gr.stream_to_vector(gr.sizeof_gr_complex, fft_size)
+        fft = gr.fft_vcc(fft_size, True, window.blackmanharris(fft_size))
+        c2mag = gr.complex_to_mag_squared(fft_size)
+        avg = gr.single_pole_iir_filter_ff(1.0 / self.average, fft_size)
+        keep = gr.keep_one_in_n(gr.sizeof_float * fft_size, self.average)
+        sink = gr.message_sink(gr.sizeof_float * fft_size, self.msgq, False)
+        self.connect(self, s2v, fft, c2mag, avg, keep, sink)
+
+        self.dtype = row_dtype(fft_size)
+        self.rows = 0
+        self.start_time = None
+        self.f = None
+        self.thread = None
+
+    def set_center_freq(self, freq):
+        """
+        Record that the stream was retuned; applies to the following rows.
+        """
+        self.center_freq = freq
+
+    def start(self):
+        """
+        Start appending rows in a background thread.  Call right after
+        starting the flow graph.
+        """
+        self.start_time = time.time()
+        if os.path.exists(self.filename) and os.path.getsize(self.filename) > 0:
+            self._check_append()
+        else:
+            iq_file.write_metadata(self.filename, 'psd', self.samp_rate, self.center_freq,
+                                   self.gain, self.start_time, fft_size=self.fft_size,
+                                   average=self.average)
+        self.f = open(self.filename, 'ab')
+        self.thread = threading.Thread(target=self._run)
+        self.thread.setDaemon(True)
+        self.thread.start()
+
+    def _check_append(self):
+        meta = iq_file.read_metadata(self.filename)
+        if meta is None or meta.get('format') != 'psd':
+            raise ValueError("%s exists and is not a spectrogram, not appending to it"
+                             % self.filename)
+        for key, value in (('fft_size', self.fft_size), ('average', self.average),
+                           ('samp_rate', self.samp_rate)):
+            if meta.get(key) != value:
+                raise ValueError("%s was recorded with %s %s, not appending with %s"
+                                 % (self.filename, key, meta.get(key), value))
+
+    def _run(self):
+        while True:
+            msg = self.msgq.delete_head()
+            if msg.type() == 1:
+                break
+            power = numpy.frombuffer(msg.to_string(), dtype=numpy.float32).reshape(-1, self.fft_size)
+            n = self.rows + 1 + numpy.arange(len(power))
+            # undo the filter's start from zero
+            frames = n * self.average
+            power = power / (1 - (1 - 1.0/self.average) ** frames)[:, numpy.newaxis]
+            rows = numpy.empty(len(power), dtype=self.dtype)
+            rows['timestamp'] = self.start_time + n * self.row_time
+            rows['center_freq'] = self.center_freq
+            rows['power'] = 10*numpy.log10(power) + self.k
+            rows.tofile(self.f)
+            self.f.flush()
+            self.rows += len(power)
+        self.f.close()
+
+    def stop(self):
+        """
+        Write out what is left and close the file.  Call after the flow
+        graph has stopped.
+        """
+        self.msgq.insert_tail(gr.message(1))
+        if self.thread is not None:
+            self.thread.join()
+
+    def summary(self):
+        """
+        One line on what was captured, for after stop().
+        """
+        return "%d spectra written" % (self.rows,)
+
+    def add_options(normal, expert):
+        """
+        Add PSD capture options to the Options parser
+        """
+        normal.add_option("", "--psd", type="int", default=0, metavar="N",
+                          help="store spectra averaged over N FFT frames instead of IQ, "
+                          "0 for IQ [default=%default]")
+    # Make a static method to call before instantiation
+    add_options = staticmethod(add_options)
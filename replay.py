@@ -0,0 +1,154 @@
+#!/usr/bin/env python
+#
+# Offline replay of a complex_filesink.py recording through the
+# sense_path chain.
+#
+# The recording is memory-mapped and cut into dwells exactly the way
+# bin_statistics_f does it live: tune_delay frames are skipped, then the
+# bins are max-held over dwell_delay frames and one result is reported.
+# Each frame gets the same Blackman-Harris window, FFT and mag squared
+# as sense_path, and the dB reduction is the one main_loop uses, so the
+# output lines match a live run dwelling on the recorded frequency.
+# Nothing is throttled; a capture can be re-analysed with different
+# --fft-size / --threshold / --dwell-delay as fast as the CPU allows.
+#
+# Recordings are read with iq_file, so sc16 and sc8 captures work too,
+# and the sample rate and frequency default to what the sidecar says.
+#
+
+from gnuradio.eng_option import eng_option
+from optparse import OptionParser
+import sys
+import time
+
+import numpy
+
+#from current dir
+from sense_path import fft_window, fft_mag_squared, fft_offset_db, fft_sum_db
+from occupancy_log import occupancy_log, open_log
+from iq_file import iq_file
+
+
+class replay(object):
+
+    def __init__(self, filename, samp_rate, fft_size, tune_delay, dwell_delay,
+                 center_freq=None, chunk_samples=1<<22, format=None):
+        """
+        @param filename: recording, see iq_file
+        @param samp_rate: sample rate of the recording, None for the sidecar's
+        @param fft_size: number of FFT bins
+        @param tune_delay: seconds skipped at the start of each dwell
+        @param dwell_delay: seconds max-held per result
+        @param center_freq: frequency the recording was made at, None for the sidecar's
+        @param chunk_samples: upper bound on samples processed at once
+        @param format: sample format, None for the sidecar's
+        """
+        self.filename = filename
+        self.data = iq_file(filename, format)
+        if samp_rate is None:
+            samp_rate = self.data.samp_rate
+        if samp_rate is None:
+            raise ValueError("%s has no sidecar, the sample rate must be given" % filename)
+        if center_freq is None:
+            center_freq = self.data.center_freq or 0
+        self.samp_rate = samp_rate
+        self.fft_size = fft_size
+        self.center_freq = center_freq
+
+        # same frame counts sense_path hands bin_statistics_f
+        self.tune_frames = max(0, int(round(tune_delay * samp_rate / fft_size)))
+        self.dwell_frames = max(1, int(round(dwell_delay * samp_rate / fft_size)))
+        self.visit_len = (self.tune_frames + self.dwell_frames) * fft_size
+        self.nvisits = len(self.data) // self.visit_len
+        self.batch = max(1, chunk_samples // self.visit_len)
+
+        self.window = fft_window(fft_size)
+        self.k = fft_offset_db(fft_size)
+
+    def dwells(self):
+        """
+        Generate (sample_offsets, stats) batches, where stats has one
+        max-held mag squared vector per row, like a bin_statistics_f message.
+        """
+        frames = self.tune_frames + self.dwell_frames
+        for first in range(0, self.nvisits, self.batch):
+            n = min(self.batch, self.nvisits - first)
+            start = first * self.visit_len
+            block = self.data.read(start, start + n*self.visit_len)
+            block = block.reshape(n, frames, self.fft_size)[:, self.tune_frames:, :]
+            stats = fft_mag_squared(block, self.window).max(axis=1)
+            offsets = start + numpy.arange(n) * self.visit_len
+            yield offsets, stats
+
+    def results(self):
+        """
+        Generate (sample_offset, center_freq, db) for every dwell.
+        """
+        for offsets, stats in self.dwells():
+            for offset, db in zip(offsets, fft_sum_db(stats, self.k)):
+                yield int(offset), self.center_freq, float(db)
+
+
+def main():
+    usage = "usage: %prog [options] complex_out.dat"
+    parser = OptionParser(option_class=eng_option, usage=usage)
+    expert_grp = parser.add_option_group("Expert")
+    parser.add_option("-s", "--samp_rate", type="eng_float", default=None,
+                      help="sample rate of the recording [default=from the .json sidecar]")
+    parser.add_option("-f", "--center-freq", type="eng_float", default=None,
+                      help="frequency the recording was made at [default=from the .json "
+                      "sidecar, else 0]")
+    iq_file.add_options(parser, expert_grp)
+    parser.add_option("", "--tune-delay", type="eng_float", default=.01, metavar="SECS",
+                      help="time to skip (in seconds) at the start of each dwell [default=%default]")
+    parser.add_option("", "--dwell-delay", type="eng_float", default=.05, metavar="SECS",
+                      help="time to dwell (in seconds) per result [default=%default]")
+    parser.add_option("-F", "--fft-size", type="int", default=1024,
+                      help="specify number of FFT bins [default=%default]")
+    parser.add_option("", "--threshold", type="eng_float", default=-54,
+                      help="set detection threshold [default=%default]")
+    parser.add_option("", "--log", action="store_true", default=False)
+    parser.add_option("-q", "--quiet", action="store_true", default=False,
+                      help="don't print a line per dwell")
+    expert_grp.add_option("", "--chunk-samples", type="intx", default=1<<22,
+                          help="samples processed at once, bounds memory use [default=%default]")
+    occupancy_log.add_options(parser, expert_grp)
+
+    (options, args) = parser.parse_args()
+    if len(args) != 1:
+        parser.print_help()
+        sys.exit(1)
+
+    try:
+        r = replay(args[0], options.samp_rate, options.fft_size, options.tune_delay,
+                   options.dwell_delay, options.center_freq, options.chunk_samples,
+                   options.format)
+    except ValueError, e:
+        parser.error(str(e))
+
+    log = None
+    if options.log:
+        log = open_log("spectrum_sense_replay_",
+                       "replay of %s at %s" % (args[0], r.center_freq), options)
+
+    t0 = time.time()
+    n = 0
+    for offset, center_freq, db in r.results():
+        n += 1
+        if log:
+            log.write(center_freq, db, db > options.threshold, True)
+        if not options.quiet:
+            print center_freq, db
+    elapsed = max(time.time() - t0, 1e-9)
+
+    if log:
+        log.close()
+    sys.stderr.write("%d dwells from %d samples in %.3f s (%.1f dwells/s, %.1f MS/s)\n"
+                     % (n, n * r.visit_len, elapsed, n / elapsed, n * r.visit_len / elapsed / 1e6))
+
+
+if __name__ == '__main__':
+    try:
+        main()
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,195 @@
+#!/usr/bin/env python
+#
+# Bounded ring capture for complex_filesink.
+#
+# Instead of one endless file, the file_sink writes a ring of segment
+# files, PREFIX_ring_00.dat, PREFIX_ring_01.dat, ...  Every segment_secs
+# the sink is switched to the next one with file_sink.open(), which
+# truncates it, so the ring holds the last pre_secs of IQ (plus the
+# segment being written) and disk use never grows.
+#
+# trigger() keeps what led up to an event: post_secs later the segments
+# are concatenated, oldest first, into PREFIX_trigger_<time>.dat, which
+# is never overwritten.  A dump notes which segments it needs and how
+# long they are under the ring lock, then copies them without it, oldest
+# first, releasing each segment as soon as it is copied.  Rotation only
+# waits if the segment it is about to reuse has not been copied yet, and
+# the sink keeps writing into the current segment meanwhile, past what
+# the dump takes.  Given the recording
+# metadata, every dump gets an iq_file sidecar whose start time is when
+# its oldest segment was started.
+#
+
+import math
+import os
+import threading
+import time
+
+#from current dir
+import iq_file
+
+
+class ring_capture(object):
+
+    def __init__(self, sink, prefix, pre_secs, segment_secs=1.0, post_secs=0, metadata=None):
+        """
+        @param sink: the gr.file_sink to rotate, already writing ring_name(prefix, 0)
+        @param prefix: prefix of the segment and trigger file names
+        @param pre_secs: seconds before a trigger to keep
+        @param segment_secs: length of one segment file
+        @param post_secs: seconds after a trigger to wait before dumping
+        @param metadata: iq_file metadata of the recording, None for no sidecar
+        """
+        self.sink = sink
+        self.prefix = prefix
+        self.segment_secs = segment_secs
+        self.post_secs = post_secs
+        self.metadata = metadata
+        nsegments = int(math.ceil(float(pre_secs) / segment_secs)) + 1
+        self.names = [ring_name(prefix, i) for i in range(nsegments)]
+        self.opened = [None] * nsegments    # time each segment was started
+        self.opened[0] = time.time()
+        self.current = 0
+        self.lock = threading.Lock()
+        self.released = threading.Condition(self.lock)
+        self.pinned = [0] * nsegments       # dumps still to copy each segment
+        self.done = threading.Event()
+        self.thread = None
+        self.dumps = []         # names of the trigger files written
+
+    def start(self):
+        """
+        Rotate segments in a background thread.
+        """
+        self.thread = threading.Thread(target=self._run)
+        self.thread.setDaemon(True)
+        self.thread.start()
+
+    def _run(self):
+        while not self.done.isSet():
+            self.done.wait(self.segment_secs)
+            if not self.done.isSet():
+                self.rotate()
+
+    def rotate(self):
+        """
+        Switch the sink to the oldest segment.
+        """
+        self.lock.acquire()
+        try:
+            nxt = (self.current + 1) % len(self.names)
+            while self.pinned[nxt]:
+                self.released.wait()
+            self.current = nxt
+            self.sink.open(self.names[self.current])
+            self.opened[self.current] = time.time()
+        finally:
+            self.lock.release()
+
+    def trigger(self):
+        """
+        Dump the ring to a trigger file after post_secs.
+        """
+        t = threading.Timer(self.post_secs, self.dump)
+        t.setDaemon(True)
+        t.start()
+
+    def dump(self):
+        """
+        Concatenate the segments, oldest first, into a new trigger file.
+        Returns its name.
+        """
+        now = time.time()
+        name = "%s_trigger_%s_%03d.dat" % (self.prefix, time.strftime("%Y%m%d_%H%M%S", time.localtime(now)),
+                                           int(now * 1000) % 1000)
+        self.lock.acquire()
+        try:
+            n = len(self.names)
+            order = [(self.current + 1 + i) % n for i in range(n)]
+            order = [i for i in order if self.opened[i] is not None and os.path.exists(self.names[i])]
+            sizes = [os.path.getsize(self.names[i]) for i in order]
+            if order:
+                start_time = self.opened[order[0]]
+            for i in order:
+                self.pinned[i] += 1
+        finally:
+            self.lock.release()
+
+        left = list(order)
+        try:
+            if self.metadata is not None and order:
+                meta = dict(self.metadata)
+                meta['start_time'] = start_time
+                iq_file.write_metadata(name, **meta)
+            out = open(name, 'wb')
+            try:
+                for i, size in zip(order, sizes):
+                    f = open(self.names[i], 'rb')
+                    try:
+                        _copy(f, out, size)
+                    finally:
+                        f.close()
+                    self._unpin([i])
+                    left.remove(i)
+            finally:
+                out.close()
+        finally:
+            self._unpin(left)
+        self.dumps.append(name)
+        print "dumped", name
+        return name
+
+    def _unpin(self, segments):
+        self.lock.acquire()
+        try:
+            for i in segments:
+                self.pinned[i] -= 1
+            self.released.notifyAll()
+        finally:
+            self.lock.release()
+
+    def stop(self):
+        self.done.set()
+        if self.thread is not None:
+            self.thread.join()
+        self.sink.close()
+
+    def summary(self):
+        """
+        One line on what was captured, for after stop().
+        """
+        return "%d trigger files written" % (len(self.dumps),)
+
+    def add_options(normal, expert):
+        """
+        Add ring capture options to the Options parser
+        """
+        normal.add_option("", "--ring", type="eng_float", default=0, metavar="SECS",
+                          help="keep only the last SECS of IQ in a ring of segment files, "
+                          "0 to write one endless file [default=%default]")
+        expert.add_option("", "--segment", type="eng_float", default=1.0, metavar="SECS",
+                          help="length of one ring segment file [default=%default]")
+        normal.add_option("", "--post-trigger", type="eng_float", default=0, metavar="SECS",
+                          help="keep capturing this long after a trigger before dumping the "
+                          "ring [default=%default]")
+    # Make a static method to call before instantiation
+    add_options = staticmethod(add_options)
+
+
+def ring_name(prefix, i):
+    """
+    Name of ring segment i.
+    """
+    return "%s_ring_%02d.dat" % (prefix, i)
+
+
+def _copy(src, dst, size, chunk=1 << 20):
+    """
+    Copy the first size bytes of src to dst.
+    """
+    while size > 0:
+        data = src.read(min(chunk, size))
+        if not data:
+            break
+        dst.write(data)
+        size -= len(data)
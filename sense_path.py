@@ -23,8 +23,50 @@
 from gnuradio import gr, gru, eng_notation, optfir, window
 from gnuradio.eng_option import eng_option
 #from usrpm import usrp_dbid
-import sys, struct
+import sys
 import math
+import time
+import numpy
+
+#from current dir
+from sweep_plan import sweep_plan, usable_bw
+from dwell import dwell_control, sprt
+import tune_scheduler
+from settle_cache import settle_cache
+from usrp_device import lo_tracker
+import metrics
+
+# pipeline metrics, shared by every sense_path and main_loop, see metrics.py
+CALLBACKS = metrics.REGISTRY.counter("sense_callbacks_total",
+                                     "tune callbacks, one per bin_statistics_f message sent")
+TUNES = metrics.REGISTRY.counter("sense_tunes_total", "retunes of the receiver")
+TUNE_FAILURES = metrics.REGISTRY.counter("sense_tune_failures_total", "retunes that failed")
+TUNE_SECONDS = metrics.REGISTRY.histogram("sense_tune_seconds", "time a retune takes")
+MESSAGES = metrics.REGISTRY.counter("sense_messages_total", "messages main_loop took off the queue")
+FLUSHED = metrics.REGISTRY.counter("sense_messages_flushed_total", "messages discarded by msgq.flush()")
+DROPPED = metrics.REGISTRY.gauge("sense_messages_dropped",
+                                 "messages bin_statistics_f dropped on a full queue, estimated")
+RESULTS = metrics.REGISTRY.counter("sense_results_total", "channel results reported")
+QUEUE_WAIT = metrics.REGISTRY.histogram("sense_queue_wait_seconds", "time main_loop blocks in delete_head")
+QUEUE_DEPTH = metrics.REGISTRY.gauge("sense_queue_depth", "messages waiting in all queues")
+QUEUE_LIMIT = metrics.REGISTRY.gauge("sense_queue_limit", "messages all queues hold before dropping")
+PARSE_SECONDS = metrics.REGISTRY.histogram("sense_parse_seconds", "time to unpack a message")
+REDUCE_SECONDS = metrics.REGISTRY.histogram("sense_reduce_seconds", "time to reduce a result to dB")
+
+
+def update_queue_metrics(queues):
+    """
+    Set the queue depth and dropped message gauges.
+
+    bin_statistics_f drops a message without a trace when the queue is
+    full, but it still calls back to retune, so whatever was called back
+    for and is neither queued, read nor flushed was dropped.
+
+    @param queues: the message queues of every sense_path
+    """
+    depth = sum([q.count() for q in queues])
+    QUEUE_DEPTH.set(depth)
+    DROPPED.set(max(0, CALLBACKS.value - MESSAGES.value - FLUSHED.value - depth - len(queues)))
 
 
 
@@ -61,19 +103,83 @@ class tune(gr.feval_dd):
 
 class parse_msg(object):
     def __init__(self, msg):
+        """
+        Unpack a bin_statistics_f message.
+
+        @param msg: message from sense_path.msgq
+
+        data is a read-only float32 view straight onto the message payload,
+        so no per-bin Python floats are created.  to_string() is the only way
+        to reach the payload from Python and makes the one copy.
+        """
         self.center_freq = msg.arg1()
         self.vlen = int(msg.arg2())
         assert(msg.length() == self.vlen * gr.sizeof_float)
 
-        # FIXME consider using Numarray or NumPy vector
-        t = msg.to_string()
-        self.raw_data = t
-        self.data = struct.unpack('%df' % (self.vlen,), t)
+        data = numpy.frombuffer(msg.to_string(), dtype=numpy.float32)
+        data.flags.writeable = False
+        self.data = data
+
+
+def fft_window(fft_size):
+    """
+    Return the Blackman-Harris window sense_path uses, as a NumPy array.
+    """
+    return numpy.array(window.blackmanharris(fft_size), dtype=numpy.float32)
+
+
+def fft_mag_squared(frames, mywindow):
+    """
+    NumPy version of the s2v -> fft_vcc -> complex_to_mag_squared chain.
+
+    @param frames: complex array with one fft_size frame per row
+    @param mywindow: window from fft_window
+    @rtype: float32 array of mag squared bins, same shape as frames
+
+    Bins are in fft_vcc order (DC first, not shifted), so the result can
+    be handed to fft_sum_db like a bin_statistics_f vector.
+    """
+    spec = numpy.fft.fft(frames * mywindow, axis=-1)
+    return (spec.real**2 + spec.imag**2).astype(numpy.float32)
+
+
+def fft_offset_db(fft_size):
+    """
+    Return the offset k (in dB) that normalizes the mag squared bins for the
+    FFT size and the Blackman-Harris window used in sense_path.
+    """
+    mywindow = window.blackmanharris(fft_size)
+    power = 0
+    for tap in mywindow:
+        power += tap*tap
+    return -20*math.log10(fft_size)-10*math.log10(power/fft_size)
+
+
+def fft_sum_db(data, k):
+    """
+    Average the FFT bins of a bin_statistics_f message in dB.
+
+    @param data: mag squared vector, or a 2-D array with one vector per row
+    @param k: normalization offset from fft_offset_db
+    @rtype: float, or an array with one value per row
+
+    Same result as averaging 10*log10(bin) + k over the bins one at a time,
+    but the log and the mean are done over the whole vector (or batch) at once.
+    """
+    data = numpy.asarray(data, dtype=numpy.float64)
+    return 10*numpy.log10(data).mean(axis=-1) + k
 
 
 class sense_path(gr.hier_block2):
 
-    def __init__(self, usrp_rate, tuner_callback, options):
+    def __init__(self, usrp_rate, tuner_callback, options, band=None, device_args=None):
+        """
+        @param usrp_rate: sample rate of the receiver
+        @param tuner_callback: function that tunes the receiver
+        @param options: parsed options
+        @param band: (min_freq, max_freq) to sweep instead of --start-freq/--end-freq
+        @param device_args: address of the receiver, defaults to --args
+        """
         gr.hier_block2.__init__(self, "sense_path",
                 gr.io_signature(1, 1, gr.sizeof_gr_complex), # Input signature
                 gr.io_signature(0, 0, 0)) # Output signature
@@ -85,8 +191,9 @@ class sense_path(gr.hier_block2):
             
         self.threshold = options.threshold
         
-        self.min_freq = options.start_freq
-        self.max_freq = options.end_freq
+        if band is None:
+            band = (options.start_freq, options.end_freq)
+        self.min_freq, self.max_freq = band
 
         if self.min_freq > self.max_freq:
             self.min_freq, self.max_freq = self.max_freq, self.min_freq   # swap them
@@ -110,34 +217,62 @@ class sense_path(gr.hier_block2):
 
         mywindow = window.blackmanharris(self.fft_size)
         fft = gr.fft_vcc(self.fft_size, True, mywindow)
-        power = 0
-        for tap in mywindow:
-            power += tap*tap
             
         c2mag = gr.complex_to_mag_squared(self.fft_size)
 
         # FIXME the log10 primitive is dog slow
-        log = gr.nlog10_ff(10, self.fft_size,
-                           -20*math.log10(self.fft_size)-10*math.log10(power/self.fft_size))
+        log = gr.nlog10_ff(10, self.fft_size, fft_offset_db(self.fft_size))
         
-        # Set the freq_step to 75% of the actual data throughput.
-        # This allows us to discard the bins on both ends of the spectrum.
+        # The planner steps by less than the sample rate, so the bins on
+        # both ends of the spectrum can be discarded.  With --usable-bw 0
+        # we step by the full rate and keep every bin.
 
         #changed on 2011 May 31, MR -- maybe change back at some point
-        self.freq_step = self.usrp_rate
-        self.min_center_freq = self.min_freq + self.freq_step/2
-        nsteps = math.ceil((self.max_freq - self.min_freq) / self.freq_step)
-        self.max_center_freq = self.min_center_freq + (nsteps * self.freq_step)
+        self.plan = sweep_plan(self.min_freq, self.max_freq, self.usrp_rate, self.fft_size,
+                               usable_bw(options, self.usrp_rate))
+        self.freq_step = self.plan.freq_step
+        self.min_center_freq = self.plan.min_center_freq
+        self.max_center_freq = self.plan.max_center_freq
 
-        self.next_freq = self.min_center_freq
+        self.scheduler = tune_scheduler.make_scheduler(options, self.plan.centers)
         
         tune_delay  = max(0, int(round(options.tune_delay * self.usrp_rate / self.fft_size)))  # in fft_frames
         dwell_delay = max(1, int(round(options.dwell_delay * self.usrp_rate / self.fft_size))) # in fft_frames
 
-        self.msgq = gr.msg_queue(16)
+        self.msgq = gr.msg_queue(options.queue_depth)
+        QUEUE_LIMIT.inc(self.msgq.limit())
         self._tune_callback = tune(self)        # hang on to this to keep it from being GC'd
-        stats = gr.bin_statistics_f(self.fft_size, self.msgq,
-                                    self._tune_callback, tune_delay, dwell_delay)
+
+        self.tune_delay = options.tune_delay
+        self.settle_cache = None
+        if options.tune_cache:
+            if device_args is None:
+                device_args = getattr(options, 'args', '')
+            self.settle_cache = settle_cache(options.tune_cache, device_args)
+        self.lo = None
+        if options.ddc_span:
+            self.lo = lo_tracker(options.ddc_span, self.freq_step)
+
+        if options.adaptive_dwell or self.settle_cache is not None or self.lo is not None:
+            # bin_statistics_f reports short slices and dwell_control does
+            # the tune delay and the dwell, see dwell.py
+            slice_frames = max(1, int(round(options.dwell_slice * self.usrp_rate / self.fft_size)))
+            self.slice_frames = slice_frames
+            k = fft_offset_db(self.fft_size)
+            test = None
+            if options.adaptive_dwell:
+                test = sprt(self.threshold, options.sprt_delta, options.sprt_sigma,
+                            options.sprt_alpha, options.sprt_beta)
+            self.dwell = dwell_control(int(math.ceil(float(tune_delay) / slice_frames)),
+                                       int(math.ceil(float(dwell_delay) / slice_frames)),
+                                       lambda data: fft_sum_db(self.plan.kept(data), k),
+                                       test, options.dwell_slice)
+            stats = gr.bin_statistics_f(self.fft_size, self.msgq,
+                                        self._tune_callback, 0, slice_frames)
+        else:
+            self.dwell = None
+            stats = gr.bin_statistics_f(self.fft_size, self.msgq,
+                                        self._tune_callback, tune_delay, dwell_delay)
 
         # FIXME leave out the log10 until we speed it up
         #self.connect(self, s2v, fft, c2mag, log, stats)
@@ -145,21 +280,51 @@ class sense_path(gr.hier_block2):
 
         
     def set_next_freq(self):
-        target_freq = self.next_freq
-        self.next_freq = self.next_freq + self.freq_step
-        if self.next_freq >= self.max_center_freq:
-            self.next_freq = self.min_center_freq
+        CALLBACKS.inc()
+        if self.dwell is not None and not self.dwell.move_on():
+            return self.dwell.seq           # keep measuring this channel
+
+        target_freq = self.scheduler.next()
+
+        # with --ddc-span, channels inside the current RF passband are
+        # reached by moving the DDC only and need no settling time
+        request, lo_moved = target_freq, True
+        if self.lo is not None:
+            request, lo_moved = self.lo.request(target_freq)
             
-        if not self.set_freq(target_freq):
+        t0 = time.time()
+        ok = self.set_freq(request)
+        TUNE_SECONDS.observe(time.time() - t0)
+        TUNES.inc()
+        if not ok:
+            TUNE_FAILURES.inc()
             print "Failed to set frequency to", target_freq
+
+        if self.dwell is not None:
+            if lo_moved:
+                self.dwell.start_visit(target_freq, self.settle_slices(target_freq))
+            else:
+                self.dwell.start_visit(target_freq, 0)
+            # label the slice, see dwell.py
+            return self.dwell.seq
                 
         return target_freq
             
+    def settle_slices(self, freq):
+        """
+        Number of slices to discard after retuning to freq, or None for
+        the --tune-delay default.
+        """
+        if self.settle_cache is None:
+            return None
+        secs = self.settle_cache.lookup(freq, self.tune_delay)
+        return int(math.ceil(secs * self.usrp_rate / self.fft_size / self.slice_frames))
+
     def set_freq(self, target_freq):
         """
         Set the center frequency we're interested in.
             
-        @param target_freq: frequency in Hz
+        @param target_freq: frequency in Hz, or a uhd.tune_request
         @rypte: bool
             
         Tuning is a two step process.  First we ask the front-end to
@@ -185,12 +350,20 @@ class sense_path(gr.hier_block2):
                           help="set detection threshold [default=%default]")
         expert.add_option("", "--real-time", action="store_true", default=False,
                           help="Attempt to enable real-time scheduling")
+        expert.add_option("", "--queue-depth", type="int", default=16,
+                          help="number of results bin_statistics_f may queue before dropping [default=%default]")
         normal.add_option("", "--num-tests", type="intx", default=1,
                           help="set the number of times to test the frequency band [default=%default]")
         normal.add_option("", "--start-freq", type="eng_float", default="631M",
                           help="set the start of the frequency band to sense over [default=%default]")
         normal.add_option("", "--end-freq", type="eng_float", default="671M",
                           help="set the end of the frequency band to sense over [default=%default]")
+        sweep_plan.add_options(normal, expert)
+        dwell_control.add_options(normal, expert)
+        tune_scheduler.add_options(normal, expert)
+        settle_cache.add_options(normal, expert)
+        lo_tracker.add_options(normal, expert)
+        metrics.add_options(normal, expert)
     # Make a static method to call before instantiation
     add_options = staticmethod(add_options)
             
@@ -0,0 +1,88 @@
+#!/usr/bin/env python
+#
+# Cache of per-frequency tune settling times, written by tune_cal.py.
+#
+# The JSON file holds one entry per device address, each a list of
+# [start, stop, settle_secs] frequency regions.
+#
+
+import json
+import os
+import time
+
+DEFAULT_CACHE = os.path.join(os.path.expanduser("~"), ".uhd_utils", "tune_cache.json")
+
+
+class settle_cache(object):
+    """
+    Settling times per frequency region for one device, backed by a JSON
+    file shared by all devices.
+    """
+    def __init__(self, filename, device):
+        self.filename = filename
+        self.device = device or "default"
+        self.regions = []       # sorted (start, stop, settle_secs)
+        self.load()
+
+    def load(self):
+        self.regions = []
+        if not os.path.exists(self.filename):
+            return
+        f = open(self.filename)
+        try:
+            entries = json.load(f)
+        finally:
+            f.close()
+        entry = entries.get(self.device)
+        if entry:
+            self.regions = sorted(tuple(r) for r in entry['regions'])
+
+    def save(self):
+        entries = {}
+        if os.path.exists(self.filename):
+            f = open(self.filename)
+            try:
+                entries = json.load(f)
+            finally:
+                f.close()
+        entries[self.device] = {'regions': [list(r) for r in self.regions],
+                                'measured': time.strftime('%Y-%m-%d %H:%M:%S')}
+        d = os.path.dirname(self.filename)
+        if d and not os.path.isdir(d):
+            os.makedirs(d)
+        tmp = self.filename + ".tmp"
+        f = open(tmp, 'w')
+        try:
+            json.dump(entries, f, indent=1, sort_keys=True)
+        finally:
+            f.close()
+        os.rename(tmp, self.filename)
+
+    def update(self, start, stop, settle):
+        """
+        Set the settling time of the region [start, stop), replacing any
+        region with the same bounds.
+        """
+        self.regions = sorted([r for r in self.regions if (r[0], r[1]) != (start, stop)] +
+                              [(start, stop, settle)])
+
+    def lookup(self, freq, default):
+        """
+        Return the settling time in seconds for freq, or default if no
+        region covers it.
+        """
+        for start, stop, settle in self.regions:
+            if start <= freq < stop:
+                return settle
+        return default
+
+    def add_options(normal, expert):
+        """
+        Add settling cache options to the Options parser
+        """
+        normal.add_option("", "--tune-cache", type="string", default=None, metavar="FILE",
+                          help="after each retune wait as long as tune_cal.py measured for "
+                          "that frequency instead of --tune-delay (its default file is %s)"
+                          % (DEFAULT_CACHE,))
+    # Make a static method to call before instantiation
+    add_options = staticmethod(add_options)
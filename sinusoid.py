@@ -26,6 +26,9 @@ from gnuradio.eng_option import eng_option
 from optparse import OptionParser
 from gnuradio import uhd
 
+#from current dir
+from control_server import control_server, make_control_server
+
 from grc_gnuradio import blks2 as grc_blks2
 import time
 
@@ -43,6 +46,7 @@ class my_top_block(gr.top_block):
                           help="set sinusoid frequency [default=%default]")
         parser.add_option("-a", "--amp", type="eng_float", default=.8,
                           help="set sinusoid amplitude, 0<=amp<=1 [default=%default]")
+        control_server.add_options(parser, parser)
                           
         (options, args) = parser.parse_args ()
         if len(args) != 0:
@@ -52,6 +56,8 @@ class my_top_block(gr.top_block):
         sample_rate = int(options.sample_rate)
         ampl = options.amp
 
+        self.options = options
+
         src0 = gr.sig_source_c (sample_rate, gr.GR_SIN_WAVE, options.sin_freq, ampl)
         self.dst =  uhd.usrp_sink(device_addr="", io_type=uhd.io_type.COMPLEX_FLOAT32, num_channels=1)
         self.dst.set_samp_rate(sample_rate) 
@@ -59,13 +65,24 @@ class my_top_block(gr.top_block):
         self.dst.set_gain(self.dst.get_gain_range().stop()/2, 0)
 
         self.connect (src0, self.dst)
+        self.src0 = src0
+
+    def commands(self):
+        """
+        Commands for the control endpoint.
+        """
+        return {"set_freq": lambda freq: self.dst.set_center_freq(freq, 0),
+                "set_gain": lambda gain: self.dst.set_gain(gain, 0),
+                "set_sig_freq": self.src0.set_frequency,
+                "set_amplitude": self.src0.set_amplitude}
 
 if __name__ == '__main__':
     tb = my_top_block()    
+    make_control_server(tb.options, tb.commands())
     try:
         tb.start()              # start executing flow graph in another thread...
         while 1:
-        	pass
+        	time.sleep(1)
     except KeyboardInterrupt:
         tb.stop()
         tb.wait()
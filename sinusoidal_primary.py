@@ -32,7 +32,13 @@ from gnuradio.eng_option import eng_option
 from optparse import OptionParser
 from gnuradio import uhd
 
-import time, struct, sys, random
+import time, struct, sys, random, threading
+
+#from current dir
+import usrp_device
+from hop_scheduler import hop_scheduler, make_schedule, read_schedule
+from control_server import control_server, make_control_server
+from multi_tone import tone_bank, tone_scheduler, parse_tones
 
 class my_top_block(gr.top_block):
     def __init__(self, options):
@@ -43,6 +49,11 @@ class my_top_block(gr.top_block):
         self.gain                 = options.gain               # USRP gain
         self.amp                 = options.amp
         self.sin_freq            = options.sin_freq
+        self._options            = options
+        # control commands come from the control server's thread, so a
+        # retune or gain change must not land inside set_freq_at's timed
+        # command window
+        self._lock               = threading.Lock()
 
         if self._tx_freq is None:
             sys.stderr.write("-f FREQ or --freq FREQ or --tx-freq FREQ must be specified\n")
@@ -51,9 +62,17 @@ class my_top_block(gr.top_block):
         # Set up USRP sink; also adjusts interp, and bitrate
         self._setup_usrp_sink()
 
-        sample_rate = 2000000
-        src0 = gr.sig_source_c (sample_rate, gr.GR_SIN_WAVE, self.sin_freq, self.amp)
-        self.connect (src0, self.u)
+        self.src0 = None
+        self.tones = None
+        if options.tone:
+            # several primaries at once, all inside one stream
+            self.tones = tone_bank(self._rate, parse_tones(options.tone), options.table_len, self.amp)
+            self.connect (self.tones, self.u)
+        else:
+            sample_rate = 2000000
+            src0 = gr.sig_source_c (sample_rate, gr.GR_SIN_WAVE, self.sin_freq, self.amp)
+            self.connect (src0, self.u)
+            self.src0 = src0
         
         
         if options.verbose:
@@ -64,11 +83,7 @@ class my_top_block(gr.top_block):
         Creates a USRP sink, determines the settings for best bitrate,
         and attaches to the transmitter's subdevice.
         """
-        self.u = uhd.usrp_sink(
-            device_addr = "",
-            io_type=uhd.io_type.COMPLEX_FLOAT32,
-            num_channels=1,
-        )
+        self.u = usrp_device.usrp_sink(self._options, self._rate)
 
         self.u.set_samp_rate(self._rate)
 
@@ -95,13 +110,59 @@ class my_top_block(gr.top_block):
         the result of that operation and our target_frequency to
         determine the value for the digital up converter.
         """
-        r = self.u.set_center_freq(target_freq)
+        self._lock.acquire()
+        try:
+            r = self.u.set_center_freq(target_freq)
+        finally:
+            self._lock.release()
+
+    def sync_time(self):
+        """
+        Zero the device time and remember how it maps to host time.
+        """
+        self.u.set_time_now(uhd.time_spec_t(0.0))
+        self._time_offset = time.time() - self.u.get_time_now().get_real_secs()
+
+    def set_freq_at(self, target_freq, when):
+        """
+        Hop to target_freq at host time when, as a timed command the
+        device carries out against its own time.  Call sync_time first.
+
+        Returns the device time, as host time, read back after the
+        command was issued; if it is past when, the command was late.
+        """
+        self._lock.acquire()
+        try:
+            self.u.set_command_time(uhd.time_spec_t(when - self._time_offset))
+            self.u.set_center_freq(target_freq)
+            self.u.clear_command_time()
+        finally:
+            self._lock.release()
+        return self.u.get_time_now().get_real_secs() + self._time_offset
         
     def set_gain(self, gain):
         """
         Sets the analog gain in the USRP
         """
-        self.u.set_gain(gain)
+        self._lock.acquire()
+        try:
+            self.u.set_gain(gain)
+        finally:
+            self._lock.release()
+
+    def commands(self):
+        """
+        Commands for the control endpoint.
+        """
+        commands = {"set_freq": self.set_freq,
+                    "set_gain": self.set_gain}
+        if self.src0 is not None:
+            commands["set_sig_freq"] = self.src0.set_frequency
+            commands["set_amplitude"] = self.src0.set_amplitude
+        if self.tones is not None:
+            commands["tone_on"] = lambda offset: self.tones.set_tone(offset, True)
+            commands["tone_off"] = lambda offset: self.tones.set_tone(offset, False)
+        return commands
 
     def add_options(normal, expert):
         """
@@ -117,6 +178,9 @@ class my_top_block(gr.top_block):
                           help="set sinusoid amplitude 0<amp<1 [default=%default]")
         expert.add_option("-r", "--sin-freq", type="eng_float", default=4e3,
                           help="set sinusoid frequency [default=%default]")
+        usrp_device.add_options(normal, expert)
+        control_server.add_options(normal, expert)
+        tone_scheduler.add_options(normal, expert)
     # Make a static method to call before instantiation
     add_options = staticmethod(add_options)
 
@@ -171,6 +235,7 @@ def main():
                           help="Set bandwidth of an expected channel [default=%default]")
     parser.add_option("", "--total-time", type="eng_float", default=50,
                           help="time to run in seconds [default=%default]")
+    hop_scheduler.add_options(parser, expert_grp)
      
                       
     my_top_block.add_options(parser, expert_grp)
@@ -181,6 +246,12 @@ def main():
 
     channels = [600000000, 620000000, 625000000, 640000000, 645000000, 650000000]
 
+    if options.schedule:
+        schedule = read_schedule(options.schedule)
+    else:
+        schedule = make_schedule(channels, options.channel_interval, options.total_time,
+                                 options.random)
+
     # build the graph
     tb = my_top_block(options)
     
@@ -188,40 +259,48 @@ def main():
     if r != gr.RT_OK:
         print "Warning: failed to enable realtime scheduling"
 
-    tb.start()                       # start flow graph
-    
+    def hop(new_freq, when=None):
+        # print first, so the hop log does not time the print
+        print "\nchanging frequencies to ", new_freq, " at time ", time.strftime("%X")
+        if when is None:
+            tb.set_freq(new_freq)
+        else:
+            return tb.set_freq_at(new_freq, when)
 
-    #timing parameters
-    last_change = time.clock()
+    tb.start()                       # start flow graph
+    make_control_server(options, tb.commands())
     
     print "\nstarting frequency: ", options.tx_freq, " at time: ", time.strftime("%X")
-    
-    current_chan = 0
-    start_time = time.clock()
-    while time.clock() - start_time < options.total_time * 2:
-        if time.clock() - last_change < options.channel_interval:
-            pass 
-        else:
-            
-            #change channels
-            if options.random:
-                current_chan = random.randint(0, len(channels) - 1)
+
+    if tb.tones is not None:
+        # the LO stays put; tones are switched on and off instead
+        try:
+            if options.tone_schedule:
+                tone_scheduler(read_schedule(options.tone_schedule), tb.tones,
+                               options.tone_log).run()
             else:
-                current_chan = (current_chan + 1) % len(channels)
-            new_freq = channels[current_chan]
-
-            #if options.num_channels == 1:
-            #    new_freq = (options.start_freq + 3*options.channel_rate/2) + (random.randint(0,4))*options.channel_rate
-            #elif options.num_channels == 3:
-            #    new_freq = (options.start_freq + 3*options.channel_rate/2) + (random.randint(1,5))*options.rate
-            #else:
-            #    pass
-                #just do nothing for now
-            last_change = time.clock()
-            print "\nchanging frequencies to ", new_freq, " at time ", time.strftime("%X")
-            tb.set_freq(new_freq)
-        
-    tb.wait()                       # wait for it to finish
+                tb.tones.set_all(True)
+                time.sleep(options.total_time)
+        finally:
+            tb.stop()
+            tb.wait()
+        return
+
+    # sleeps between hops instead of polling the clock
+    lead = 0
+    if options.timed_hops:
+        tb.sync_time()
+        lead = options.command_lead
+    hops = hop_scheduler(schedule, hop, options.hop_log, lead)
+    try:
+        hops.run()
+    finally:
+        tb.stop()
+        tb.wait()                   # wait for it to finish
+
+    mean, worst = hops.jitter()
+    print "\n%d hops, late by %.3f ms on average, %.3f ms at most" % (
+        len(hops.hops), mean * 1e3, worst * 1e3)
 
 if __name__ == '__main__':
     try:
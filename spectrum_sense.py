@@ -31,9 +31,16 @@ from optparse import OptionParser
 import sys
 import math
 import time
+import threading
+import Queue
 
 #from current dir
 from sense_path import *
+from occupancy_log import occupancy_log, open_log
+from sweep_merge import sweep_merger
+from sweep_plan import spectrum_file
+import usrp_device
+import profiling
 
 
 class my_top_block(gr.top_block):
@@ -44,10 +51,13 @@ class my_top_block(gr.top_block):
         # build graph
         
         #updated 2011 May 27, MR
-        self.u = uhd.usrp_source(device_addr="", io_type=uhd.io_type.COMPLEX_FLOAT32, num_channels=1)
-        self.u.set_subdev_spec("", 0)
-        self.u.set_antenna("TX/RX", 0)
-        self.u.set_samp_rate(options.samp_rate)
+        receivers = usrp_device.usrp_sources(options, options.samp_rate)
+        self.u = receivers[0][0]
+        for u, port, chan, addr in receivers:
+            if chan == 0:
+                u.set_subdev_spec("", 0)
+                u.set_samp_rate(options.samp_rate)
+            u.set_antenna("TX/RX", chan)
 
         #adc_rate = self.u.adc_rate()                # 64 MS/s
         #usrp_decim = options.decim
@@ -56,9 +66,27 @@ class my_top_block(gr.top_block):
         if options.verbose:
             print "sample rate is", self.usrp_rate
         
-        self.sense = sense_path(self.usrp_rate, self.set_freq, options)
-
-        self.connect(self.u, self.sense)
+        # With several receivers the band is split into one part per
+        # receiver and every part gets its own sense_path.
+        bands = [None]
+        if len(receivers) > 1:
+            plan = sweep_plan(options.start_freq, options.end_freq, self.usrp_rate,
+                              options.fft_size, usable_bw(options, self.usrp_rate))
+            bands = plan.split(len(receivers))
+        self.receivers = receivers[:len(bands)]
+        self.senses = []
+        for (u, port, chan, addr), band in zip(self.receivers, bands):
+            sense = sense_path(self.usrp_rate, self.tuner(u, chan), options, band, addr)
+            self.connect((u, port), sense)
+            self.senses.append(sense)
+        for u, port, chan, addr in receivers[len(bands):]:
+            # more receivers than tunes in the band
+            self.connect((u, port), gr.null_sink(gr.sizeof_gr_complex))
+        self.sense = self.senses[0]
+        if options.verbose:
+            for sense in self.senses:
+                print "sweeping %s - %s" % (eng_notation.num_to_str(sense.min_freq),
+                                            eng_notation.num_to_str(sense.max_freq))
 
         if options.gain is None:
             # if no gain was specified, use the mid-point in dB
@@ -86,11 +114,20 @@ class my_top_block(gr.top_block):
         #updated 2011 May 31, MR
         #return self.u.tune(0, self.subdev, target_freq)
         return self.u.set_center_freq(target_freq, 0)
+
+    def tuner(self, u, chan):
+        """
+        Return a set_freq for channel chan of device u.
+        """
+        def set_freq(target_freq):
+            return u.set_center_freq(target_freq, chan)
+        return set_freq
             
     def set_gain(self, gain):
         #updated 2011 May 31, MR
         #self.subdev.set_gain(gain)
-        self.u.set_gain(gain)
+        for u, port, chan, addr in self.receivers:
+            u.set_gain(gain, chan)
     
     def add_options(normal, expert):
         normal.add_option("-g", "--gain", type="eng_float", default=None,
@@ -102,68 +139,155 @@ class my_top_block(gr.top_block):
     add_options = staticmethod(add_options)
 
 
-def main_loop(tb, log):
-    if log:
-        filename = "spectrum_sense_exp_" + time.strftime('%y%m%d_%H%M%S') + ".csv"
-        f = open(filename, 'w')
-        f.write("detecting on %s BW channels between " %(tb.usrp_rate))
-        f.write("%s and " %(tb.sense.min_freq))
-        f.write("%s\n" %(tb.sense.max_freq))
-        f.close()
+def visits(sense):
+    """
+    Yield the finished visits of a sense_path.
+    """
+    while True:
+        # Get the next message sent from the C++ code (blocking call).
+        # It contains the center frequency and the mag squared of the fft
+        t0 = time.time()
+        msg = sense.msgq.delete_head()
+        t1 = time.time()
+        m = parse_msg(msg)
+        PARSE_SECONDS.observe(time.time() - t1)
+        QUEUE_WAIT.observe(t1 - t0)
+        MESSAGES.inc()
+        if sense.dwell is not None:
+            # only a finished visit counts as a result
+            m = sense.dwell.accept(m)
+            if m is None:
+                continue
+        yield m
+
+
+def read_results(sense, receiver, results):
+    """
+    Put every finished visit of a sense_path on the results queue as
+    (receiver, timestamp, result).  Runs in a thread of its own.
+    """
+    for m in visits(sense):
+        results.put((receiver, time.time(), m))
+
+
+def all_results(tb):
+    """
+    Yield (receiver, timestamp, result) for the finished visits of every
+    sense_path, in the order they come in.
+    """
+    if len(tb.senses) == 1:
+        for m in visits(tb.sense):
+            yield 0, time.time(), m
+    results = Queue.Queue()
+    for i, sense in enumerate(tb.senses):
+        t = threading.Thread(target=read_results, args=(sense, i, results))
+        t.setDaemon(True)
+        t.start()
+    while True:
+        try:
+            # a timeout keeps Ctrl-C working while we wait
+            yield results.get(True, 1.0)
+        except Queue.Empty:
+            pass
+
+
+def main_loop(tb, log, spectrum=None):
+    """
+    Read and report sense_path results.
+
+    @param log: an occupancy_log to record decisions in, or None
+    @param spectrum: a spectrum_file to write the stitched spectrum to, or None
+
+    With several receivers the results are merged, and logged and printed
+    a whole sweep of the band at a time.
+    """
     i = 0
-    mywindow = window.blackmanharris(tb.sense.fft_size)
-    power = 0
-    for tap in mywindow:
-        power += tap*tap
-        
-    k = -20*math.log10(tb.sense.fft_size)-10*math.log10(power/tb.sense.fft_size)
+    k = fft_offset_db(tb.sense.fft_size)
+    merger = None
+    if len(tb.senses) > 1:
+        merger = sweep_merger(len(tb.senses))
+    results = all_results(tb)
+    got = None
     
     while i < 9*tb.sense.num_tests:
+        t0 = time.time()
+        if got is not None:
+            profiling.record('main_loop.work', t0 - got)
+        receiver, timestamp, m = results.next()
+        got = time.time()
+        profiling.record('main_loop.wait', got - t0)
+        sense = tb.senses[receiver]
         i = i+1
-        # Get the next message sent from the C++ code (blocking call).
-        # It contains the center frequency and the mag squared of the fft
-        m = parse_msg(tb.sense.msgq.delete_head())
         
-        #fft_sum_db = 20*math.log10(sum(m.data)/m.vlen)
-        temp_list = []
-        for item in m.data:
-            temp_list.append(10*math.log10(item) + k)
-        fft_sum_db = sum(temp_list)/m.vlen
-        if log:
-            f = open(filename, 'a')
-            if fft_sum_db > tb.sense.threshold:
-                f.write("1,")
-            else:
-                f.write("0,")
-            #f.write(str(m.center_freq))
-            #f.write(", ")
-            #f.write(str(fft_sum_db))
-            #f.write("\n")
-        print m.center_freq, fft_sum_db
+        t0 = time.time()
+        db = fft_sum_db(sense.plan.kept(m.data), k)
+        REDUCE_SECONDS.observe(time.time() - t0)
+        RESULTS.inc()
+        update_queue_metrics([s.msgq for s in tb.senses])
+        sense.plan.stitch(m.center_freq, m.data)
+        sweep_done = sense.scheduler.end_of_sweep(m.center_freq)
+        sense.scheduler.update(m.center_freq, db > sense.threshold)
+        if merger is None:
+            if sweep_done:
+                if spectrum:
+                    spectrum.write(timestamp)
+                profiling.mark_sweep()
+            if log:
+                log.write(m.center_freq, db, db > sense.threshold, sweep_done)
+            print m.center_freq, db
+            continue
 
-        
-        if log:
-            if m.center_freq >= tb.sense.max_center_freq - tb.sense.freq_step:
-                f.write("\n")
-            #    break
-            f.close()
+        for rows in merger.add(receiver, m.center_freq, db, db > sense.threshold,
+                               sweep_done, timestamp):
+            for j, (freq, db, decision, timestamp) in enumerate(rows):
+                if log:
+                    log.write(freq, db, decision, j == len(rows) - 1, timestamp)
+                print freq, db
+            if spectrum:
+                spectrum.write(timestamp)
+            profiling.mark_sweep()
     
     
 if __name__ == '__main__':
     parser = OptionParser(option_class=eng_option)
     expert_grp = parser.add_option_group("Expert")
     parser.add_option("", "--log", action="store_true", default=False)
+    occupancy_log.add_options(parser, expert_grp)
     sense_path.add_options(parser, expert_grp)
     my_top_block.add_options(parser, expert_grp)
+    usrp_device.add_options(parser, expert_grp)
+    usrp_device.add_receiver_options(parser, expert_grp)
+    profiling.add_options(parser, expert_grp)
 
     (options, args) = parser.parse_args()
     
     tb = my_top_block(options)
+    metrics.start_exporter(options)
+    this = sys.modules[__name__]
+    profiling.start_profiler(options, [(this, 'parse_msg', 'parse_msg'),
+                                       (tune, 'eval', 'tune.eval'),
+                                       (sense_path, 'set_next_freq', 'set_next_freq'),
+                                       (sense_path, 'set_freq', 'set_freq')],
+                             len(tb.senses))
+    log = None
+    if options.log:
+        log = open_log("spectrum_sense_exp_",
+                       "detecting on %s BW channels between %s and %s"
+                       % (tb.usrp_rate, tb.sense.min_freq, tb.sense.max_freq), options)
+    spectrum = None
+    if options.spectrum_file:
+        spectrum = spectrum_file(options.spectrum_file, [s.plan for s in tb.senses],
+                                 fft_offset_db(tb.sense.fft_size))
     try:
         tb.start()              # start executing flow graph in another thread...
-        main_loop(tb, options.log)
+        main_loop(tb, log, spectrum)
         tb.stop()
         tb.wait()
         
     except KeyboardInterrupt:
         pass
+
+    if log:
+        log.close()
+    if spectrum:
+        spectrum.close()
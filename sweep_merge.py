@@ -0,0 +1,64 @@
+#!/usr/bin/env python
+#
+# Merges the sweeps of several receivers into one.
+#
+# With more than one receiver (see usrp_device.usrp_sources) every
+# sense_path sweeps its own part of the band, at its own pace.
+# sweep_merger keeps what each receiver found during its n-th sweep and,
+# once all of them have finished sweep n, hands back the whole band in
+# frequency order.  The merged output looks like a single receiver's
+# sweep, it just comes around sooner.  Merged sweeps always come out in
+# order, since sweep n+1 can only be complete after sweep n is.
+#
+# Receivers with fewer tunes in their part of the band finish their
+# sweeps sooner and run ahead.  At most max_pending sweeps are kept: when
+# a receiver starts one more, the oldest is handed back incomplete, and
+# the receivers still in it carry on in the oldest sweep left.
+#
+
+
+class sweep_merger(object):
+
+    def __init__(self, nreceivers, max_pending=4):
+        """
+        @param nreceivers: number of receivers whose sweeps are merged
+        @param max_pending: sweeps kept before the oldest is handed back incomplete
+        """
+        self.nreceivers = nreceivers
+        self.max_pending = max(1, max_pending)
+        self.sweep = [0] * nreceivers   # sweep each receiver is in
+        self.rows = {}                  # sweep -> results so far
+        self.finished = {}              # sweep -> receivers done with it
+
+    def add(self, receiver, center_freq, db, decision, end_of_sweep, timestamp=None):
+        """
+        Add one result of a receiver.
+
+        @param receiver: index of the receiver
+        @param end_of_sweep: True for the last channel of the receiver's sweep
+        @rtype: list of the merged sweeps this result completes, oldest
+        first, each a list of (center_freq, db, decision, timestamp)
+        sorted by frequency
+        """
+        merged = []
+        n = self.sweep[receiver]
+        if n not in self.rows and len(self.rows) >= self.max_pending:
+            merged.append(self._hand_back(min(self.rows)))
+        self.rows.setdefault(n, []).append((center_freq, db, decision, timestamp))
+        if not end_of_sweep:
+            return merged
+        self.sweep[receiver] += 1
+        self.finished[n] = self.finished.get(n, 0) + 1
+        if self.finished[n] == self.nreceivers:
+            merged.append(self._hand_back(n))
+        return merged
+
+    def _hand_back(self, n):
+        rows = self.rows.pop(n)
+        self.finished.pop(n, None)
+        # receivers still in sweep n carry on in the next one
+        for r in range(self.nreceivers):
+            if self.sweep[r] <= n:
+                self.sweep[r] = n + 1
+        rows.sort()
+        return rows
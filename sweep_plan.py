@@ -0,0 +1,274 @@
+#!/usr/bin/env python
+#
+# Sweep planner for the spectrum sensing scripts.
+#
+# Without a usable bandwidth the plan is the legacy one: step by
+# freq_step (the sample rate, or --chan-bandwidth) and use every FFT bin,
+# including the filter roll-off at both edges.  The scripts only ask for
+# that with --usable-bw 0; by default usable_bw() keeps the middle
+# USABLE_FRACTION of the sample rate, where the USRP's decimating
+# half-band filters are still flat.
+#
+# With a usable bandwidth only the bins within usable_bw/2 of the center
+# are kept.  The planner then picks the fewest retunes that cover the
+# band with kept bins and spreads the band evenly over them.  Each step
+# is a whole number of bins, so the kept bins of successive tunes butt up
+# against each other.  stitch() drops them into one continuous wideband
+# spectrum array.
+#
+# With a channel bandwidth (channelizer mode) every tune is split into as
+# many whole channels as fit in the usable bandwidth, each a group of
+# adjacent FFT bins.  The sweep then advances by all of those channels at
+# once and channels() hands back one row of bins per channel, ready for a
+# batched fft_sum_db.  A channel is a whole number of bins, so unless the
+# channel bandwidth is a multiple of the bin width the channels are
+# chan_width wide instead, and that grid is what channel_freqs() reports.
+#
+# spectrum_file appends the stitched spectrum of one or more plans to
+# --spectrum-file once per sweep, as fixed size records,
+#
+#   timestamp     float64, time.time() at the end of the sweep
+#   power         float32 x nbins, dB, low frequency first
+#
+# with an iq_file style .json sidecar (format "sweep") listing the
+# frequency of every bin.  read_spectrum_file() maps it back.
+#
+
+import math
+import time
+
+import numpy
+
+#from current dir
+import iq_file
+
+
+# part of the sample rate clear of the filter roll-off
+USABLE_FRACTION = 0.8
+
+
+def usable_bw(options, samp_rate):
+    """
+    The usable bandwidth the options ask for: --usable-bw, by default
+    USABLE_FRACTION of the sample rate, or None (every bin) for 0.
+    """
+    if options.usable_bw is None:
+        return USABLE_FRACTION * samp_rate
+    if options.usable_bw <= 0:
+        return None
+    return options.usable_bw
+
+
+class sweep_plan(object):
+
+    def __init__(self, min_freq, max_freq, samp_rate, fft_size, usable_bw=None, freq_step=None,
+                 chan_bw=None):
+        """
+        @param min_freq: start of the band in Hz
+        @param max_freq: end of the band in Hz
+        @param samp_rate: sample rate, i.e. the width of one FFT
+        @param fft_size: number of FFT bins
+        @param usable_bw: bandwidth around the center to keep, None for all bins
+        @param freq_step: legacy step when usable_bw is None, default samp_rate
+        @param chan_bw: channel bandwidth to split every tune into, None for one channel per tune
+        """
+        if min_freq > max_freq:
+            min_freq, max_freq = max_freq, min_freq
+        self.min_freq = min_freq
+        self.max_freq = max_freq
+        self.fft_size = fft_size
+        self.bin_width = float(samp_rate) / fft_size
+        self.nchan = 1
+        self.chan_width = None
+
+        if chan_bw is not None:
+            if usable_bw is None:
+                usable_bw = samp_rate
+            self.chan_bins = int(round(chan_bw / self.bin_width))
+            if self.chan_bins < 1:
+                raise ValueError("channel bandwidth is narrower than one FFT bin")
+            self.nchan = min(fft_size, int(usable_bw / self.bin_width)) // self.chan_bins
+            if self.nchan < 1:
+                raise ValueError("channel bandwidth is wider than the usable bandwidth")
+            nchannels = max(1, int(math.ceil((max_freq - min_freq) / (self.chan_bins * self.bin_width))))
+            self.ntunes = int(math.ceil(float(nchannels) / self.nchan))
+            self.nchan = int(math.ceil(float(nchannels) / self.ntunes))
+            self.kept_bins = self.nchan * self.chan_bins
+            self.freq_step = self.kept_bins * self.bin_width
+            # the channel bandwidth rounded to whole bins
+            self.chan_width = self.chan_bins * self.bin_width
+            lo = fft_size//2 - self.kept_bins//2
+            self.kept_idx = numpy.fft.fftshift(numpy.arange(fft_size))[lo:lo + self.kept_bins]
+            self.aligned = True
+        elif usable_bw is None:
+            # what sense_path and uhd_spectrum_sense_sum have always done
+            if freq_step is None:
+                freq_step = samp_rate
+            self.freq_step = freq_step
+            self.kept_bins = fft_size
+            self.kept_idx = None
+            self.ntunes = max(1, int(math.ceil((max_freq - min_freq) / freq_step)))
+            self.aligned = (freq_step == samp_rate)
+        else:
+            usable_bins = min(fft_size, int(usable_bw / self.bin_width))
+            if usable_bins < 1:
+                raise ValueError("usable bandwidth is narrower than one FFT bin")
+            span_bins = int(math.ceil((max_freq - min_freq) / self.bin_width))
+            self.ntunes = max(1, int(math.ceil(float(span_bins) / usable_bins)))
+            self.kept_bins = int(math.ceil(float(span_bins) / self.ntunes))
+            self.freq_step = self.kept_bins * self.bin_width
+            # the kept bins, centered, in fft_vcc (unshifted) order
+            lo = fft_size//2 - self.kept_bins//2
+            self.kept_idx = numpy.fft.fftshift(numpy.arange(fft_size))[lo:lo + self.kept_bins]
+            self.aligned = True
+
+        if self.chan_width is None:
+            self.chan_width = self.freq_step
+        self.min_center_freq = self.min_freq + self.freq_step/2
+        self.max_center_freq = self.min_center_freq + (self.ntunes * self.freq_step)
+        self.centers = [self.min_center_freq + i*self.freq_step for i in range(self.ntunes)]
+
+        self.spectrum = numpy.zeros(self.ntunes * self.kept_bins, dtype=numpy.float32)
+
+    def kept(self, data):
+        """
+        Return the bins of a bin_statistics_f vector (or rows of a batch)
+        that fall inside the usable bandwidth, low frequency first.
+        """
+        if self.kept_idx is None:
+            return data
+        return numpy.asarray(data)[..., self.kept_idx]
+
+    def channels(self, data):
+        """
+        Return the kept bins of a vector (or batch) grouped by channel, with
+        one row of chan_bins bins per channel, low frequency first.
+        """
+        kept = numpy.asarray(self.kept(data))
+        if self.nchan == 1:
+            return kept[..., numpy.newaxis, :]
+        return kept.reshape(kept.shape[:-1] + (self.nchan, self.chan_bins))
+
+    def channel_freqs(self, center_freq):
+        """
+        Return the center frequency of every channel of the tune at center_freq.
+        """
+        return (center_freq - self.freq_step/2
+                + (numpy.arange(self.nchan) + 0.5) * self.chan_width)
+
+    def tune_index(self, center_freq):
+        """
+        Return which tune of the sweep center_freq is, or None if it is not
+        one of the planned centers.
+        """
+        i = int(round((center_freq - self.min_center_freq) / self.freq_step))
+        if i < 0 or i >= self.ntunes or abs(self.centers[i] - center_freq) > self.bin_width/2:
+            return None
+        return i
+
+    def stitch(self, center_freq, data):
+        """
+        Copy the kept bins of a mag squared vector into the wideband
+        spectrum.  Returns False if center_freq is not on the plan.
+        """
+        i = self.tune_index(center_freq)
+        if i is None or not self.aligned:
+            return False
+        if self.kept_idx is None:
+            row = numpy.fft.fftshift(data)
+        else:
+            row = self.kept(data)
+        self.spectrum[i*self.kept_bins:(i+1)*self.kept_bins] = row
+        return True
+
+    def frequencies(self):
+        """
+        Return the center frequency of every bin of the wideband spectrum.
+        """
+        first = self.min_center_freq - (self.kept_bins//2) * self.bin_width
+        return first + numpy.arange(len(self.spectrum)) * self.bin_width
+
+    def split(self, n):
+        """
+        Split the band into n sub-bands of whole tunes, for sweeping it
+        with n receivers.  Returns a list of (min_freq, max_freq).
+        """
+        n = max(1, min(n, self.ntunes))
+        bands = []
+        for i in range(n):
+            first = i * self.ntunes // n
+            last = (i+1) * self.ntunes // n
+            # half a bin short, so the sub-plan does not round up a tune
+            bands.append((self.min_freq + first * self.freq_step,
+                          self.min_freq + last * self.freq_step - self.bin_width/2))
+        return bands
+
+    def add_options(normal, expert):
+        """
+        Add sweep planner options to the Options parser
+        """
+        normal.add_option("", "--usable-bw", type="eng_float", default=None,
+                          help="keep only the FFT bins within this bandwidth of the center, "
+                          "dropping the filter roll-off, and plan the sweep around it, "
+                          "0 for all bins [default=%g of the sample rate]" % USABLE_FRACTION)
+        normal.add_option("", "--spectrum-file", type="string", default=None, metavar="FILE",
+                          help="append the stitched wideband spectrum to FILE once per sweep")
+    # Make a static method to call before instantiation
+    add_options = staticmethod(add_options)
+
+
+def spectrum_dtype(nbins):
+    """
+    numpy dtype of one --spectrum-file row.
+    """
+    return numpy.dtype([('timestamp', '<f8'), ('power', '<f4', (nbins,))])
+
+
+def read_spectrum_file(filename):
+    """
+    Memory-map a file written by spectrum_file.  Returns the frequency of
+    every bin and the rows.
+    """
+    meta = iq_file.read_metadata(filename)
+    if meta is None or meta.get('format') != 'sweep':
+        raise ValueError("%s has no sweep sidecar" % filename)
+    freqs = numpy.array(meta['frequencies'])
+    return freqs, numpy.memmap(filename, dtype=spectrum_dtype(len(freqs)), mode='r')
+
+
+class spectrum_file(object):
+
+    def __init__(self, filename, plans, k):
+        """
+        @param filename: file to write
+        @param plans: the sweep_plans whose spectra make up the band, in frequency order
+        @param k: dB offset of the FFT, see fft_offset_db
+        """
+        for plan in plans:
+            if not plan.aligned:
+                raise ValueError("the stitched spectrum needs tunes that butt up "
+                                 "against each other, drop --chan-bandwidth or set --usable-bw")
+        self.plans = plans
+        self.k = k
+        freqs = numpy.concatenate([plan.frequencies() for plan in plans])
+        self.row = numpy.zeros(1, dtype=spectrum_dtype(len(freqs)))
+        iq_file.write_metadata(filename, 'sweep', plans[0].bin_width * plans[0].fft_size,
+                               start_time=time.time(),
+                               frequencies=[float(f) for f in freqs])
+        self.f = open(filename, 'wb')
+
+    def write(self, timestamp=None):
+        """
+        Append the spectrum as it is now, at the end of a sweep.
+        """
+        if timestamp is None:
+            timestamp = time.time()
+        power = numpy.concatenate([plan.spectrum for plan in self.plans])
+        self.row['timestamp'] = timestamp
+        # tunes not visited yet are still 0
+        self.row['power'] = 10*numpy.log10(numpy.maximum(power, 1e-20)) + self.k
+        self.row.tofile(self.f)
+        self.f.flush()
+
+    def close(self):
+        self.f.close()
@@ -0,0 +1,128 @@
+#!/usr/bin/env python
+#
+# Tests for control_server.py
+#
+
+import json
+import os
+import shutil
+import socket
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+#from current dir
+from control_server import control_server
+
+
+class recorder(object):
+    # a device stand-in that remembers what it was told
+    def __init__(self):
+        self.calls = []
+
+    def set_freq(self, value):
+        self.calls.append(('set_freq', value))
+
+    def set_gain(self, value):
+        if value > 31.5:
+            raise ValueError("gain out of range")
+        self.calls.append(('set_gain', value))
+
+    def commands(self):
+        return {"set_freq": self.set_freq, "set_gain": self.set_gain}
+
+
+def ask(sock, request):
+    # send one line and read the one line reply
+    sock.sendall(request + "\n")
+    reply = ""
+    while not reply.endswith("\n"):
+        data = sock.recv(4096)
+        if not data:
+            break
+        reply += data
+    return json.loads(reply)
+
+
+class test_execute(unittest.TestCase):
+
+    def setUp(self):
+        self.dev = recorder()
+        self.server = control_server(self.dev.commands(), port=0)
+
+    def tearDown(self):
+        self.server.server.server_close()
+
+    def test_runs_the_command_with_its_value(self):
+        reply = self.server.execute('{"cmd": "set_freq", "value": 650e6}')
+        self.assertTrue(reply["ok"])
+        self.assertEqual(reply["cmd"], "set_freq")
+        self.assertTrue(reply["elapsed"] >= 0)
+        self.assertEqual(self.dev.calls, [('set_freq', 650e6)])
+
+    def test_unknown_command(self):
+        reply = self.server.execute('{"cmd": "set_fre", "value": 1}')
+        self.assertEqual(reply, {"ok": False, "cmd": "set_fre", "error": "unknown command"})
+        self.assertEqual(self.dev.calls, [])
+
+    def test_bad_requests(self):
+        for line in ('not json', '{"value": 1}', '[1, 2]'):
+            reply = self.server.execute(line)
+            self.assertFalse(reply["ok"])
+            self.assertTrue(reply["error"].startswith("bad request"))
+
+    def test_command_errors_are_reported(self):
+        reply = self.server.execute('{"cmd": "set_gain", "value": 40}')
+        self.assertEqual(reply, {"ok": False, "cmd": "set_gain", "error": "gain out of range"})
+        # and the lock is not left held
+        self.assertTrue(self.server.execute('{"cmd": "set_gain", "value": 10}')["ok"])
+
+    def test_help_lists_the_commands(self):
+        reply = self.server.execute('{"cmd": "help"}')
+        self.assertEqual(reply["commands"], ["set_freq", "set_gain"])
+
+
+class test_sockets(unittest.TestCase):
+
+    def test_tcp(self):
+        dev = recorder()
+        server = control_server(dev.commands(), port=0)
+        server.start()
+        try:
+            sock = socket.create_connection(server.server.server_address)
+            try:
+                self.assertTrue(ask(sock, '{"cmd": "set_freq", "value": 600e6}')["ok"])
+                self.assertFalse(ask(sock, '{"cmd": "nope"}')["ok"])
+                self.assertTrue(ask(sock, '{"cmd": "set_gain", "value": 3}')["ok"])
+            finally:
+                sock.close()
+        finally:
+            server.stop()
+        self.assertEqual(dev.calls, [('set_freq', 600e6), ('set_gain', 3)])
+
+    def test_unix_socket(self):
+        tmp = tempfile.mkdtemp()
+        try:
+            path = os.path.join(tmp, "control")
+            dev = recorder()
+            server = control_server(dev.commands(), path=path)
+            server.start()
+            try:
+                sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+                sock.connect(path)
+                try:
+                    self.assertTrue(ask(sock, '{"cmd": "set_freq", "value": 640e6}')["ok"])
+                finally:
+                    sock.close()
+            finally:
+                server.stop()
+            self.assertFalse(os.path.exists(path))
+            self.assertEqual(dev.calls, [('set_freq', 640e6)])
+        finally:
+            shutil.rmtree(tmp)
+
+
+if __name__ == '__main__':
+    unittest.main()
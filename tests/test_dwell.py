@@ -0,0 +1,124 @@
+#!/usr/bin/env python
+#
+# Tests for dwell.py
+#
+
+import os
+import sys
+import unittest
+
+import numpy
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+#from current dir
+from dwell import sprt, dwell_control
+
+
+class msg(object):
+    # stands in for a parse_msg
+    def __init__(self, center_freq, data):
+        self.center_freq = center_freq
+        self.data = numpy.array(data, dtype=numpy.float32)
+
+
+class test_sprt(unittest.TestCase):
+
+    def test_decides_busy(self):
+        self.assertEqual(sprt(-70).update(-60), 1)
+
+    def test_decides_idle(self):
+        self.assertEqual(sprt(-70).update(-80), -1)
+
+    def test_undecided_at_the_threshold(self):
+        test = sprt(-70)
+        for i in range(10):
+            self.assertEqual(test.update(-70), 0)
+
+    def test_reset(self):
+        test = sprt(-70)
+        test.update(-71)
+        test.reset()
+        self.assertEqual(test.llr, 0.0)
+
+
+class test_dwell_control(unittest.TestCase):
+
+    # the tune callback returns dwell.seq, which comes back as center_freq
+
+    def test_fixed_dwell(self):
+        # one settle slice, then two measured slices max-held together
+        dwell = dwell_control(1, 2)
+        dwell.start_visit(100)
+        self.assertEqual(dwell.accept(msg(dwell.seq, [9, 9])), None)     # settle
+        self.assertFalse(dwell.move_on())
+        self.assertEqual(dwell.accept(msg(dwell.seq, [1, 5])), None)
+        self.assertFalse(dwell.move_on())
+        result = dwell.accept(msg(dwell.seq, [3, 2]))
+        self.assertTrue(dwell.move_on())
+        self.assertEqual(result.center_freq, 100)
+        self.assertEqual(result.slices, 2)
+        self.assertEqual(list(result.data), [3, 5])
+        self.assertEqual(result.verdict, 0)
+
+    def test_dropped_slice_only_costs_its_visit(self):
+        dwell = dwell_control(0, 2)
+        dwell.start_visit(100)
+        self.assertFalse(dwell.move_on())
+        self.assertTrue(dwell.move_on())
+        dwell.start_visit(200)
+        # both slices of the visit to 100 were dropped
+        self.assertEqual(dwell.accept(msg(dwell.seq, [1])), None)
+        self.assertFalse(dwell.move_on())
+        result = dwell.accept(msg(dwell.seq, [2]))
+        self.assertEqual(result.center_freq, 200)
+        self.assertEqual(list(result.data), [2])
+
+    def test_same_frequency_visits_stay_apart(self):
+        # e.g. a single tune plan: every visit is to 100
+        dwell = dwell_control(1, 2)
+        dwell.start_visit(100)
+        first = dwell.seq
+        dwell.move_on()
+        dwell.move_on()
+        last = dwell.seq
+        self.assertTrue(dwell.move_on())
+        dwell.start_visit(100)
+        second = dwell.seq
+        # the settle slice of the first visit was dropped
+        self.assertEqual(dwell.accept(msg(first + 1, [5])), None)
+        result = dwell.accept(msg(last, [7]))
+        self.assertEqual(result.slices, 2)
+        self.assertEqual(list(result.data), [7])
+        # the next visit starts with its own settle slice, not a measurement
+        self.assertEqual(dwell.accept(msg(second, [99])), None)
+        self.assertEqual(dwell.acc, None)
+
+    def test_dropped_last_slice_still_finishes_the_visit(self):
+        dwell = dwell_control(0, 3)
+        dwell.start_visit(100)
+        labels = [dwell.seq]
+        while not dwell.move_on():
+            labels.append(dwell.seq)
+        self.assertEqual(dwell.accept(msg(labels[0], [1])), None)
+        result = dwell.accept(msg(labels[2], [3]))
+        self.assertEqual(result.slices, 2)
+        self.assertEqual(list(result.data), [3])
+
+    def test_sprt_ends_the_visit_early(self):
+        dwell = dwell_control(0, 10, lambda data: float(data.max()), sprt(-70), timeout=0)
+        dwell.start_visit(100)
+        result = dwell.accept(msg(dwell.seq, [-40]))
+        self.assertEqual(result.verdict, 1)
+        self.assertEqual(result.slices, 1)
+        self.assertTrue(dwell.move_on())
+
+    def test_flush_forgets_labels(self):
+        dwell = dwell_control(0, 1)
+        dwell.start_visit(100)
+        dwell.flush()
+        self.assertEqual(dwell.accept(msg(dwell.seq, [1])), None)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,56 @@
+#!/usr/bin/env python
+#
+# Tests for hop_scheduler.py
+#
+
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+#from current dir
+from hop_scheduler import read_schedule, make_schedule
+
+
+class test_read_schedule(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.name = os.path.join(self.dir, "schedule")
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def read(self, text):
+        f = open(self.name, 'w')
+        f.write(text)
+        f.close()
+        return read_schedule(self.name)
+
+    def test_sorted_with_dwells_filled_in(self):
+        hops = self.read("# a comment\n"
+                         "\n"
+                         "2.5 101M\n"
+                         "0 100M\n"
+                         "4 102.5M 1\n")
+        self.assertEqual(hops, [(0.0, 100e6, 2.5), (2.5, 101e6, 1.5), (4.0, 102.5e6, 1.0)])
+
+    def test_last_hop_without_dwell(self):
+        self.assertEqual(self.read("1 100M\n"), [(1.0, 100e6, 0)])
+
+    def test_bad_line(self):
+        self.assertRaises(ValueError, self.read, "1\n")
+
+
+class test_make_schedule(unittest.TestCase):
+
+    def test_round_robin(self):
+        hops = make_schedule([1, 2, 3], 1.0, 3.5)
+        self.assertEqual(hops, [(1.0, 2, 1.0), (2.0, 3, 1.0), (3.0, 1, 0.5)])
+
+
+if __name__ == '__main__':
+    unittest.main()
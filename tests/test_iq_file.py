@@ -0,0 +1,77 @@
+#!/usr/bin/env python
+#
+# Tests for iq_file.py
+#
+
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+import numpy
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+#from current dir
+import iq_file
+
+
+class test_iq_file(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.name = os.path.join(self.dir, "capture.dat")
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def write(self, format, values):
+        dtype, scale = iq_file.FORMATS[format]
+        numpy.array(values, dtype=dtype).tofile(self.name)
+        iq_file.write_metadata(self.name, format, 1e6, 100e6, 20, 5.0)
+
+    def test_sample_size(self):
+        self.assertEqual(iq_file.sample_size('fc32'), 8)
+        self.assertEqual(iq_file.sample_size('sc16'), 4)
+        self.assertEqual(iq_file.sample_size('sc8'), 2)
+
+    def test_sc16(self):
+        self.write('sc16', [32767, -32767, 0, 16384])
+        f = iq_file.iq_file(self.name)
+        self.assertEqual(f.format, 'sc16')
+        self.assertEqual(len(f), 2)
+        data = f.read(0, 2)
+        self.assertEqual(data.dtype, numpy.complex64)
+        self.assertTrue(numpy.allclose(data, [1 - 1j, 16384/32767.0 * 1j]))
+
+    def test_sc8(self):
+        self.write('sc8', [127, 0, -127, 127, 64, -64])
+        data = iq_file.iq_file(self.name).read(0, 3)
+        self.assertTrue(numpy.allclose(data, [1, -1 + 1j, (64 - 64j) / 127.0]))
+
+    def test_metadata(self):
+        self.write('sc16', [0, 0])
+        f = iq_file.iq_file(self.name)
+        self.assertEqual(f.samp_rate, 1e6)
+        self.assertEqual(f.center_freq, 100e6)
+        self.assertEqual(f.gain, 20)
+        self.assertEqual(f.start_time, 5.0)
+
+    def test_no_sidecar_is_fc32(self):
+        numpy.array([1 + 2j, 3 - 4j], dtype=numpy.complex64).tofile(self.name)
+        f = iq_file.iq_file(self.name)
+        self.assertEqual(f.format, 'fc32')
+        self.assertEqual(list(f.read(0, 2)), [1 + 2j, 3 - 4j])
+
+    def test_chunks(self):
+        self.write('sc16', range(20))
+        f = iq_file.iq_file(self.name)
+        chunks = list(f.chunks(4))
+        self.assertEqual([start for start, data in chunks], [0, 4, 8])
+        self.assertTrue(numpy.allclose(numpy.concatenate([data for start, data in chunks]),
+                                       f.read(0, 10)))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,72 @@
+#!/usr/bin/env python
+#
+# Tests for metrics.py
+#
+
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+#from current dir
+import metrics
+
+
+class test_metrics(unittest.TestCase):
+
+    def test_render(self):
+        reg = metrics.registry()
+        reg.counter("a_total", "things").inc(3)
+        reg.gauge("b", "level").set(-2)
+        self.assertEqual(reg.render(),
+                         "# HELP a_total things\n"
+                         "# TYPE a_total counter\n"
+                         "a_total 3.0\n"
+                         "# HELP b level\n"
+                         "# TYPE b gauge\n"
+                         "b -2.0\n")
+
+    def test_histogram_buckets_are_cumulative(self):
+        h = metrics.histogram("h", "latency", buckets=(1, 10))
+        for value in (.5, 1, 5, 50):
+            h.observe(value)
+        self.assertEqual(h.samples(), [('h_bucket{le="1"}', 2), ('h_bucket{le="10"}', 3),
+                                       ('h_bucket{le="+Inf"}', 4), ('h_sum', 56.5),
+                                       ('h_count', 4)])
+
+    def test_same_name_same_metric(self):
+        reg = metrics.registry()
+        self.assertTrue(reg.counter("a_total", "x") is reg.counter("a_total", "x"))
+
+    def test_counts_from_threads_add_up(self):
+        c = metrics.counter("c_total", "x")
+
+        def count():
+            for i in range(10000):
+                c.inc()
+        threads = [threading.Thread(target=count) for i in range(4)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual(c.value, 40000)
+
+    def test_write_file(self):
+        d = tempfile.mkdtemp()
+        try:
+            reg = metrics.registry()
+            reg.counter("a_total", "things").inc()
+            name = os.path.join(d, "metrics.prom")
+            metrics.write_file(name, reg)
+            self.assertEqual(open(name).read(), reg.render())
+            self.assertFalse(os.path.exists(name + ".tmp"))
+        finally:
+            shutil.rmtree(d)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,57 @@
+#!/usr/bin/env python
+#
+# Tests for occupancy_log.py
+#
+
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+#from current dir
+from occupancy_log import occupancy_log, read_occupancy_log
+
+
+class test_occupancy_log(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_bin_round_trip(self):
+        name = os.path.join(self.dir, "log.bin")
+        log = occupancy_log(name, "a run", 'bin', flush_bytes=21*2)
+        rows = [(100e6, -60.5, True, 1.0), (101e6, -80.25, False, 2.0),
+                (102e6, -70.0, True, 3.0)]
+        for freq, db, decision, t in rows:
+            log.write(freq, db, decision, timestamp=t)
+        log.close()
+        header, cols = read_occupancy_log(name)
+        self.assertEqual(header, "a run")
+        self.assertEqual(list(cols['center_freq']), [r[0] for r in rows])
+        self.assertEqual(list(cols['db']), [r[1] for r in rows])
+        self.assertEqual(list(cols['decision']), [1, 0, 1])
+        self.assertEqual(list(cols['timestamp']), [r[3] for r in rows])
+
+    def test_csv(self):
+        name = os.path.join(self.dir, "log.csv")
+        log = occupancy_log(name, "a run", 'csv')
+        log.write(100e6, -60, True)
+        log.write(101e6, -80, False, end_of_sweep=True)
+        log.write(100e6, -80, False)
+        log.close()
+        self.assertEqual(open(name).read(), "a run\n1,0,\n0,")
+
+    def test_read_rejects_csv(self):
+        name = os.path.join(self.dir, "log.csv")
+        occupancy_log(name, "a run", 'csv').close()
+        self.assertRaises(ValueError, read_occupancy_log, name)
+
+
+if __name__ == '__main__':
+    unittest.main()
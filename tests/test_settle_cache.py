@@ -0,0 +1,69 @@
+#!/usr/bin/env python
+#
+# Tests for settle_cache.py
+#
+
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+#from current dir
+from settle_cache import settle_cache
+
+
+class test_settle_cache(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.filename = os.path.join(self.dir, "sub", "cache.json")
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_missing_file_is_empty(self):
+        cache = settle_cache(self.filename, "addr=1")
+        self.assertEqual(cache.regions, [])
+        self.assertEqual(cache.lookup(100e6, 0.01), 0.01)
+
+    def test_lookup_uses_half_open_regions(self):
+        cache = settle_cache(self.filename, None)
+        cache.update(100e6, 106e6, 0.002)
+        cache.update(106e6, 112e6, 0.005)
+        self.assertEqual(cache.lookup(100e6, 1), 0.002)
+        self.assertEqual(cache.lookup(105.9e6, 1), 0.002)
+        self.assertEqual(cache.lookup(106e6, 1), 0.005)
+        self.assertEqual(cache.lookup(112e6, 1), 1)
+        self.assertEqual(cache.lookup(99e6, 1), 1)
+
+    def test_update_replaces_same_bounds_and_keeps_order(self):
+        cache = settle_cache(self.filename, None)
+        cache.update(106e6, 112e6, 0.005)
+        cache.update(100e6, 106e6, 0.002)
+        cache.update(106e6, 112e6, 0.003)
+        self.assertEqual(cache.regions, [(100e6, 106e6, 0.002), (106e6, 112e6, 0.003)])
+
+    def test_devices_share_the_file(self):
+        a = settle_cache(self.filename, "addr=a")
+        a.update(100e6, 106e6, 0.002)
+        a.save()
+        b = settle_cache(self.filename, "addr=b")
+        self.assertEqual(b.regions, [])
+        b.update(100e6, 106e6, 0.007)
+        b.save()
+        self.assertEqual(settle_cache(self.filename, "addr=a").lookup(101e6, 0), 0.002)
+        self.assertEqual(settle_cache(self.filename, "addr=b").lookup(101e6, 0), 0.007)
+        self.assertFalse(os.path.exists(self.filename + ".tmp"))
+
+    def test_no_device_address_is_default(self):
+        cache = settle_cache(self.filename, "")
+        cache.update(100e6, 106e6, 0.002)
+        cache.save()
+        self.assertEqual(settle_cache(self.filename, None).regions, [(100e6, 106e6, 0.002)])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,53 @@
+#!/usr/bin/env python
+#
+# Tests for sweep_merge.py
+#
+
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+#from current dir
+from sweep_merge import sweep_merger
+
+
+class test_sweep_merger(unittest.TestCase):
+
+    def test_merges_in_frequency_order(self):
+        merger = sweep_merger(2)
+        self.assertEqual(merger.add(1, 300, -50, True, False, 1), [])
+        self.assertEqual(merger.add(0, 100, -60, False, False, 2), [])
+        self.assertEqual(merger.add(1, 400, -55, True, True, 3), [])
+        merged = merger.add(0, 200, -70, False, True, 4)
+        self.assertEqual(len(merged), 1)
+        self.assertEqual([row[0] for row in merged[0]], [100, 200, 300, 400])
+        self.assertEqual(merged[0][0], (100, -60, False, 2))
+
+    def test_sweeps_come_out_in_order(self):
+        merger = sweep_merger(2)
+        # receiver 0 finishes two sweeps before receiver 1 finishes one
+        merger.add(0, 100, 0, False, True)
+        merger.add(0, 101, 0, False, True)
+        merged = merger.add(1, 200, 0, False, True)
+        self.assertEqual([[row[0] for row in rows] for rows in merged], [[100, 200]])
+        merged = merger.add(1, 201, 0, False, True)
+        self.assertEqual([[row[0] for row in rows] for rows in merged], [[101, 201]])
+
+    def test_pending_sweeps_are_bounded(self):
+        # receiver 1 has three tunes per sweep, receiver 0 one
+        merger = sweep_merger(2, max_pending=2)
+        merged = []
+        for i in range(30):
+            merged += merger.add(0, 100 + i, 0, False, True)
+            merged += merger.add(1, 200 + i % 3, 0, False, i % 3 == 2)
+            self.assertTrue(len(merger.rows) <= 2)
+        # every result comes out exactly once
+        out = sorted([row[0] for rows in merged for row in rows])
+        left = sorted([row[0] for rows in merger.rows.values() for row in rows])
+        self.assertEqual(len(out) + len(left), 60)
+
+
+if __name__ == '__main__':
+    unittest.main()
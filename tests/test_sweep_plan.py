@@ -0,0 +1,103 @@
+#!/usr/bin/env python
+#
+# Tests for sweep_plan.py
+#
+
+import os
+import sys
+import unittest
+
+import numpy
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+#from current dir
+from sweep_plan import sweep_plan, usable_bw, USABLE_FRACTION
+
+
+class options(object):
+    def __init__(self, usable_bw):
+        self.usable_bw = usable_bw
+
+
+def bin_offsets(fft_size, idx):
+    # offset from the center, in bins, of fft_vcc bins idx
+    idx = numpy.asarray(idx)
+    return numpy.where(idx < fft_size//2, idx, idx - fft_size)
+
+
+class test_sweep_plan(unittest.TestCase):
+
+    def test_legacy_keeps_every_bin(self):
+        plan = sweep_plan(100e6, 110e6, 1e6, 64)
+        self.assertEqual(plan.ntunes, 10)
+        self.assertEqual(plan.kept_bins, 64)
+        data = numpy.arange(64, dtype=numpy.float32)
+        self.assertTrue(plan.kept(data) is data)
+
+    def test_kept_bins_are_centered_and_contiguous(self):
+        plan = sweep_plan(0, 10e6, 1e6, 100, usable_bw=.8e6)
+        self.assertEqual(plan.ntunes, 13)
+        self.assertEqual(plan.kept_bins, 77)
+        self.assertAlmostEqual(plan.freq_step, 77 * 1e4)
+        kept = plan.kept(numpy.arange(100))
+        self.assertEqual(list(bin_offsets(100, kept)), range(-38, 39))
+
+    def test_kept_works_on_batches(self):
+        plan = sweep_plan(0, 10e6, 1e6, 100, usable_bw=.8e6)
+        batch = numpy.tile(numpy.arange(100), (3, 1))
+        self.assertEqual(plan.kept(batch).shape, (3, 77))
+
+    def test_stitch_fills_every_tune(self):
+        plan = sweep_plan(0, 10e6, 1e6, 100, usable_bw=.8e6)
+        for i, center in enumerate(plan.centers):
+            self.assertTrue(plan.stitch(center, numpy.ones(100, dtype=numpy.float32) * i))
+        expected = numpy.repeat(numpy.arange(plan.ntunes), plan.kept_bins)
+        self.assertTrue((plan.spectrum == expected).all())
+
+    def test_stitch_rejects_off_plan_frequency(self):
+        plan = sweep_plan(0, 10e6, 1e6, 100, usable_bw=.8e6)
+        self.assertFalse(plan.stitch(plan.centers[0] + plan.freq_step/2, numpy.ones(100)))
+
+    def test_frequencies_line_up_with_centers(self):
+        plan = sweep_plan(0, 10e6, 1e6, 100, usable_bw=.8e6)
+        freqs = plan.frequencies()
+        self.assertEqual(len(freqs), len(plan.spectrum))
+        self.assertTrue(numpy.allclose(numpy.diff(freqs), plan.bin_width))
+        for i, center in enumerate(plan.centers):
+            self.assertAlmostEqual(freqs[i*plan.kept_bins + plan.kept_bins//2], center)
+
+    def test_channels(self):
+        plan = sweep_plan(0, 10e6, 1e6, 100, usable_bw=.8e6, chan_bw=.2e6)
+        self.assertEqual(plan.chan_bins, 20)
+        channels = plan.channels(numpy.arange(100))
+        self.assertEqual(channels.shape, (plan.nchan, 20))
+        self.assertEqual(len(plan.channel_freqs(plan.centers[0])), plan.nchan)
+
+    def test_channel_width_is_whole_bins(self):
+        # 203 kHz rounds to 20 bins of 10 kHz
+        plan = sweep_plan(0, 10e6, 1e6, 100, usable_bw=.8e6, chan_bw=.203e6)
+        self.assertEqual(plan.chan_bins, 20)
+        self.assertAlmostEqual(plan.chan_width, .2e6)
+        freqs = plan.channel_freqs(plan.centers[1])
+        self.assertTrue(numpy.allclose(numpy.diff(freqs), plan.chan_width))
+        # the channels tile the tune exactly
+        self.assertAlmostEqual(freqs[0] - plan.chan_width/2, plan.centers[1] - plan.freq_step/2)
+        self.assertAlmostEqual(freqs[-1] + plan.chan_width/2, plan.centers[1] + plan.freq_step/2)
+
+    def test_usable_bw_default(self):
+        self.assertAlmostEqual(usable_bw(options(None), 1e6), USABLE_FRACTION * 1e6)
+        self.assertEqual(usable_bw(options(0), 1e6), None)
+        self.assertEqual(usable_bw(options(.5e6), 1e6), .5e6)
+
+    def test_split_covers_the_band(self):
+        plan = sweep_plan(0, 10e6, 1e6, 100, usable_bw=.8e6)
+        bands = plan.split(3)
+        self.assertEqual(len(bands), 3)
+        self.assertEqual(bands[0][0], 0)
+        ntunes = sum([sweep_plan(lo, hi, 1e6, 100, usable_bw=.8e6).ntunes for lo, hi in bands])
+        self.assertEqual(ntunes, plan.ntunes)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,79 @@
+#!/usr/bin/env python
+#
+# Tests for tune_scheduler.py
+#
+
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+#from current dir
+from tune_scheduler import round_robin_scheduler, activity_scheduler
+
+
+class test_round_robin_scheduler(unittest.TestCase):
+
+    def test_sweeps_and_wraps(self):
+        s = round_robin_scheduler([100, 200, 300])
+        self.assertEqual([s.next() for i in range(5)], [100, 200, 300, 100, 200])
+        s.restart()
+        self.assertEqual(s.next(), 100)
+
+    def test_end_of_sweep_is_the_last_channel(self):
+        s = round_robin_scheduler([100, 200, 300])
+        self.assertEqual([s.end_of_sweep(f) for f in (100, 200, 300)], [False, False, True])
+
+
+class test_activity_scheduler(unittest.TestCase):
+
+    def test_never_seen_channels_go_first_in_sweep_order(self):
+        s = activity_scheduler([100, 200, 300], max_staleness=100)
+        self.assertEqual([s.next(now=t) for t in (0, 1, 2)], [100, 200, 300])
+
+    def test_priority_is_age_times_volatility(self):
+        s = activity_scheduler([100, 200, 300], max_staleness=100, volatility_weight=4.0)
+        for t, f in enumerate((100, 200, 300)):
+            self.assertEqual(s.next(now=t), f)
+        s.volatility = [0.0, 0.5, 0.0]
+        # at t=10 the ages are 10, 9 and 8: 100 scores 10, 200 scores 9*(1+4*0.5) = 27
+        self.assertEqual(s.next(now=10), 200)
+        # 200 was just visited, so it is skipped; 100 is older than 300
+        self.assertEqual(s.next(now=11), 100)
+
+    def test_overdue_channels_go_first_oldest_first(self):
+        s = activity_scheduler([100, 200, 300, 400], max_staleness=5.5, volatility_weight=4.0)
+        for t, f in enumerate((100, 200, 300, 400)):
+            s.next(now=t)
+        s.volatility = [0.0, 0.0, 1.0, 0.0]
+        # at t=7 100 (age 7) and 200 (age 6) are overdue and go before
+        # 300 (age 5, score 25); by t=8 300 is overdue too
+        self.assertEqual(s.next(now=7), 100)
+        self.assertEqual(s.next(now=7.5), 200)
+        self.assertEqual(s.next(now=8), 300)
+
+    def test_never_skips_a_single_channel(self):
+        s = activity_scheduler([100])
+        self.assertEqual([s.next(now=t) for t in (0, 1, 2)], [100, 100, 100])
+
+    def test_update_tracks_volatility(self):
+        s = activity_scheduler([100, 200], smoothing=0.5)
+        s.update(100, True)
+        self.assertEqual(s.volatility[0], 0.0)      # nothing to compare with yet
+        s.update(100, False)
+        self.assertEqual(s.volatility[0], 0.5)
+        s.update(100, False)
+        self.assertEqual(s.volatility[0], 0.25)
+        s.update(999, True)                         # not a channel, ignored
+        self.assertEqual(s.volatility, [0.25, 0.0])
+
+    def test_end_of_sweep_counts_results(self):
+        s = activity_scheduler([100, 200, 300])
+        # whichever channels the results were for
+        ends = [s.end_of_sweep(f) for f in (100, 100, 200, 300, 300, 300)]
+        self.assertEqual(ends, [False, False, True, False, False, True])
+
+
+if __name__ == '__main__':
+    unittest.main()
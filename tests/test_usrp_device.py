@@ -0,0 +1,128 @@
+#!/usr/bin/env python
+#
+# Tests for usrp_device.py
+#
+
+import os
+import sys
+import time
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from gnuradio import uhd
+
+#from current dir
+from usrp_device import sim_device, lo_tracker, parse_primaries
+
+
+def make_device(tune_latency=0):
+    # the settings half of sim_source / sim_sink, without a flow graph
+    d = sim_device()
+    d._sim_init(1e6, tune_latency)
+    return d
+
+
+def tune_request(target, policy, rf_freq=None):
+    req = uhd.tune_request(target)
+    req.rf_freq_policy = policy
+    if rf_freq is not None:
+        req.rf_freq = rf_freq
+    return req
+
+
+class test_sim_device(unittest.TestCase):
+
+    def test_moving_the_lo_takes_the_tune_latency(self):
+        d = make_device(0.05)
+        t0 = time.time()
+        d.set_center_freq(100e6)
+        self.assertTrue(time.time() - t0 >= 0.05)
+        self.assertEqual(d.get_center_freq(), 100e6)
+        self.assertEqual([f for t, f in d.tune_log], [100e6])
+
+    def test_retune_to_the_same_lo_is_free(self):
+        d = make_device(0.2)
+        d.set_center_freq(100e6)
+        t0 = time.time()
+        d.set_center_freq(100e6)
+        self.assertTrue(time.time() - t0 < 0.1)
+
+    def test_policy_none_only_moves_the_dsp(self):
+        d = make_device(0.2)
+        d.set_center_freq(100e6)
+        t0 = time.time()
+        result = d.set_center_freq(tune_request(101e6, uhd.tune_request.POLICY_NONE))
+        self.assertTrue(time.time() - t0 < 0.1)
+        self.assertEqual(d.get_center_freq(), 101e6)
+        self.assertEqual(result.actual_rf_freq, 100e6)
+        self.assertEqual(result.actual_dsp_freq, 1e6)
+
+    def test_policy_manual_sets_the_lo(self):
+        d = make_device()
+        result = d.set_center_freq(tune_request(101e6, uhd.tune_request.POLICY_MANUAL, 103e6))
+        self.assertEqual(result.actual_rf_freq, 103e6)
+        self.assertEqual(result.actual_dsp_freq, -2e6)
+        self.assertEqual(d.get_center_freq(), 101e6)
+
+    def test_timed_retune_waits_for_the_command_time(self):
+        d = make_device()
+        d.set_center_freq(100e6)
+        d.set_time_now(0)
+        d.set_command_time(0.2)
+        t0 = time.time()
+        d.set_center_freq(200e6)
+        d.clear_command_time()
+        # returns right away and the retune has not happened yet
+        self.assertTrue(time.time() - t0 < 0.1)
+        self.assertEqual(d.get_center_freq(), 100e6)
+        time.sleep(0.4)
+        self.assertEqual(d.get_center_freq(), 200e6)
+
+    def test_past_command_time_retunes_now(self):
+        d = make_device()
+        d.set_time_now(10)
+        d.set_command_time(5)
+        d.set_center_freq(200e6)
+        self.assertEqual(d.get_center_freq(), 200e6)
+
+
+class test_lo_tracker(unittest.TestCase):
+
+    def test_first_request_moves_the_lo_ahead(self):
+        tracker = lo_tracker(10e6, 2e6)
+        req, moved = tracker.request(100e6)
+        self.assertTrue(moved)
+        self.assertEqual(req.rf_freq_policy, uhd.tune_request.POLICY_MANUAL)
+        # far enough ahead that the following channels fit
+        self.assertEqual(req.rf_freq, 104e6)
+
+    def test_channels_inside_the_span_keep_the_lo(self):
+        tracker = lo_tracker(10e6, 2e6)
+        tracker.request(100e6)
+        for freq in (102e6, 104e6, 106e6, 108e6):
+            req, moved = tracker.request(freq)
+            self.assertFalse(moved)
+            self.assertEqual(req.rf_freq_policy, uhd.tune_request.POLICY_NONE)
+        self.assertEqual(tracker.lo, 104e6)
+
+    def test_channel_past_the_span_moves_the_lo(self):
+        tracker = lo_tracker(10e6, 2e6)
+        tracker.request(100e6)
+        # 110 MHz +- 1 MHz reaches 7 MHz past the LO, more than span/2
+        req, moved = tracker.request(110e6)
+        self.assertTrue(moved)
+        self.assertEqual(req.rf_freq_policy, uhd.tune_request.POLICY_MANUAL)
+        self.assertEqual(req.rf_freq, 114e6)
+
+
+class test_parse_primaries(unittest.TestCase):
+
+    def test_parses_freq_and_db(self):
+        self.assertEqual(parse_primaries(["101M:-40", "1.5G:-60.5"]),
+                         [(101e6, -40.0), (1.5e9, -60.5)])
+        self.assertEqual(parse_primaries(None), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
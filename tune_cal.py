@@ -0,0 +1,192 @@
+#!/usr/bin/env python
+#
+# Per-frequency tune settling calibration.
+#
+# --tune-delay is one number for the whole band, but LO settling varies a
+# lot with frequency and daughterboard.  This script measures it: the
+# band is split into regions, and for every region the radio is retuned
+# from the previous region (or, if there is only one, from one region
+# width above it) and the power of each FFT frame after the retune is
+# recorded.  The settling time is how long it takes until the
+# frame power stays within --tolerance dB of where it ends up.
+#
+# bin_statistics_f is used with no tune delay and a one frame dwell, so
+# every frame comes back as a message and the retune happens in the tune
+# callback, exactly in step with the sample stream.  The callback returns
+# a frame sequence number instead of the frequency, and bin_statistics_f
+# puts it in the next message, so every frame is matched to its visit
+# and position even when messages are lost.  A visit missing any of its
+# frames is not used.
+#
+# Results go to a JSON cache file keyed by device address.  sense_path
+# loads it with --tune-cache and waits only as long as each frequency
+# needs after a retune.
+#
+
+from gnuradio import gr, eng_notation, window
+from gnuradio.eng_option import eng_option
+from optparse import OptionParser
+import math
+
+import numpy
+
+#from current dir
+from sense_path import tune, parse_msg, fft_offset_db, fft_sum_db
+from settle_cache import settle_cache, DEFAULT_CACHE
+import usrp_device
+
+def settle_time(powers, tolerance):
+    """
+    Return the index of the first frame from which the power stays within
+    tolerance dB of its final level (the median of the second half).
+    """
+    powers = numpy.asarray(powers)
+    final = numpy.median(powers[len(powers)//2:])
+    outside = numpy.nonzero(numpy.abs(powers - final) > tolerance)[0]
+    if len(outside) == 0:
+        return 0
+    return int(outside[-1]) + 1
+
+
+class cal_top_block(gr.top_block):
+
+    def __init__(self, options, visits):
+        """
+        @param visits: list of frequencies to retune to, in order
+        """
+        gr.top_block.__init__(self)
+        self.u = usrp_device.usrp_source(options, options.samp_rate)
+        self.u.set_samp_rate(options.samp_rate)
+        self.usrp_rate = self.u.get_samp_rate()
+        g = self.u.get_gain_range()
+        if options.gain is None:
+            options.gain = float(g.start()+g.stop())/2
+        self.u.set_gain(options.gain)
+
+        self.fft_size = options.fft_size
+        self.frames = options.frames
+        self.visits = visits
+        self.visit = -1
+        self.count = 0
+        self.seq = 0
+        self.labels = {}        # sequence number -> (visit, frame index)
+
+        s2v = gr.stream_to_vector(gr.sizeof_gr_complex, self.fft_size)
+        fft = gr.fft_vcc(self.fft_size, True, window.blackmanharris(self.fft_size))
+        c2mag = gr.complex_to_mag_squared(self.fft_size)
+        self.msgq = gr.msg_queue(1024)
+        self._tune_callback = tune(self)        # hang on to this to keep it from being GC'd
+        stats = gr.bin_statistics_f(self.fft_size, self.msgq, self._tune_callback, 0, 1)
+        self.connect(self.u, s2v, fft, c2mag, stats)
+
+    def set_next_freq(self):
+        # called after every frame
+        if self.visit >= 0 and self.count < self.frames:
+            self.count += 1
+        elif self.visit + 1 < len(self.visits):
+            self.visit += 1
+            self.count = 1
+            self.u.set_center_freq(self.visits[self.visit], 0)
+        else:
+            self.count += 1     # out of visits, keep going until stopped
+        # label the frame that follows with a sequence number
+        self.seq += 1
+        self.labels[self.seq] = (self.visit, self.count - 1)
+        return self.seq
+
+
+def main():
+    parser = OptionParser(option_class=eng_option)
+    expert_grp = parser.add_option_group("Expert")
+    parser.add_option("", "--start-freq", type="eng_float", default="631M",
+                      help="start of the band to calibrate [default=%default]")
+    parser.add_option("", "--end-freq", type="eng_float", default="671M",
+                      help="end of the band to calibrate [default=%default]")
+    parser.add_option("", "--region", type="eng_float", default="6M",
+                      help="width of each calibrated region [default=%default]")
+    parser.add_option("-s", "--samp_rate", type="intx", default=6000000,
+                      help="set sample rate to SAMP_RATE [default=%default]")
+    parser.add_option("-F", "--fft-size", type="int", default=256,
+                      help="specify number of FFT bins [default=%default]")
+    parser.add_option("-g", "--gain", type="eng_float", default=None,
+                      help="set gain in dB (default is midpoint)")
+    parser.add_option("", "--frames", type="int", default=400,
+                      help="frames recorded after each retune [default=%default]")
+    parser.add_option("", "--repeats", type="int", default=3,
+                      help="retunes per region, the slowest one is kept [default=%default]")
+    parser.add_option("", "--tolerance", type="eng_float", default=1.0, metavar="DB",
+                      help="power must stay within this of its final level [default=%default]")
+    parser.add_option("", "--tune-cache", type="string", default=DEFAULT_CACHE,
+                      help="cache file to update [default=%default]")
+    usrp_device.add_options(parser, expert_grp)
+    (options, args) = parser.parse_args()
+
+    lo, hi = sorted((options.start_freq, options.end_freq))
+    nregions = max(1, int(math.ceil((hi - lo) / options.region)))
+    regions = [(lo + i*options.region, lo + (i+1)*options.region) for i in range(nregions)]
+    centers = [(a + b) / 2 for a, b in regions]
+    # approach every region from its neighbour, like a sweep does; a lone
+    # region has none, so go one region width away and back each time
+    visits = []
+    region_of = []
+    for r in range(options.repeats):
+        if nregions == 1:
+            visits.append(centers[0] + options.region)
+            region_of.append(None)
+        visits.extend(centers)
+        region_of.extend(range(nregions))
+
+    tb = cal_top_block(options, visits)
+    cache = settle_cache(options.tune_cache, options.args)
+    k = fft_offset_db(options.fft_size)
+    frame_time = float(options.fft_size) / tb.usrp_rate
+
+    powers = [[None] * options.frames for v in visits]
+    tb.start()
+    try:
+        while True:
+            m = parse_msg(tb.msgq.delete_head())
+            label = tb.labels.pop(int(m.center_freq), None)
+            if label is None:
+                continue        # the frame before the first retune
+            visit, index = label
+            if region_of[visit] is not None and index < options.frames:
+                powers[visit][index] = fft_sum_db(m.data, k)
+            if visit == len(visits) - 1 and index >= options.frames - 1:
+                break
+    finally:
+        tb.stop()
+        tb.wait()
+
+    for i, (start, stop) in enumerate(regions):
+        worst = None
+        for visit in range(len(visits)):
+            if region_of[visit] != i:
+                continue
+            missing = powers[visit].count(None)
+            if missing:
+                # positions are what settle_time measures, so a gap would
+                # make the settling look shorter than it is
+                print "%s: %d of %d frames lost, retune not used" % (
+                    eng_notation.num_to_str(visits[visit]), missing, options.frames)
+                continue
+            settle = settle_time(powers[visit], options.tolerance)
+            if worst is None or settle > worst:
+                worst = settle
+        if worst is None:
+            print "%s - %s: no complete retune, not updated" % (eng_notation.num_to_str(start),
+                                                               eng_notation.num_to_str(stop))
+            continue
+        settle = worst * frame_time
+        cache.update(start, stop, settle)
+        print "%s - %s: %.2f ms" % (eng_notation.num_to_str(start),
+                                    eng_notation.num_to_str(stop), settle * 1e3)
+    cache.save()
+    print "saved to", options.tune_cache
+
+
+if __name__ == '__main__':
+    try:
+        main()
+    except KeyboardInterrupt:
+        pass
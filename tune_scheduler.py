@@ -0,0 +1,162 @@
+#!/usr/bin/env python
+#
+# Tune schedulers for the spectrum sensing scripts.
+#
+# set_next_freq asks the scheduler which channel to visit next and
+# main_loop tells it what it found there.  Two schedulers are provided:
+#
+#   rr        the legacy sweep, min_center_freq up to max_center_freq and
+#             wrap around.
+#
+#   activity  keeps per-channel state (last occupancy, time of the last
+#             visit, how often the occupancy flips) and visits the
+#             channel with the highest priority,
+#
+#                 age * (1 + volatility_weight * volatility)
+#
+#             so channels that change often are revisited sooner and
+#             stable ones later.  A channel not visited for
+#             max_staleness seconds always goes first.
+#
+# next() is called from the tune callback on the GNU Radio scheduler
+# thread and update() from main_loop, so state is guarded by a lock.
+#
+
+import threading
+import time
+
+
+class round_robin_scheduler(object):
+
+    def __init__(self, centers):
+        self.centers = list(centers)
+        self.index = 0
+        self.lock = threading.Lock()
+
+    def next(self, now=None):
+        """
+        Return the center frequency to tune to next.
+        """
+        self.lock.acquire()
+        try:
+            freq = self.centers[self.index]
+            self.index = (self.index + 1) % len(self.centers)
+            return freq
+        finally:
+            self.lock.release()
+
+    def update(self, freq, busy, now=None):
+        """
+        Record the occupancy decision main_loop made for freq.
+        """
+        pass
+
+    def restart(self):
+        """
+        Start the next sweep from the first channel.
+        """
+        self.lock.acquire()
+        self.index = 0
+        self.lock.release()
+
+    def end_of_sweep(self, freq):
+        """
+        True if freq is the last channel of a sweep.
+        """
+        return freq >= self.centers[-1]
+
+
+class activity_scheduler(round_robin_scheduler):
+
+    def __init__(self, centers, max_staleness=5.0, volatility_weight=4.0, smoothing=0.3):
+        """
+        @param centers: channel center frequencies
+        @param max_staleness: longest a channel may go unvisited, in seconds
+        @param volatility_weight: how much more often a channel that always flips is visited
+        @param smoothing: weight of the newest visit in the volatility average
+        """
+        round_robin_scheduler.__init__(self, centers)
+        self.max_staleness = max_staleness
+        self.volatility_weight = volatility_weight
+        self.smoothing = smoothing
+
+        n = len(self.centers)
+        self.last_visit = [None] * n
+        self.last_busy = [None] * n
+        self.volatility = [0.0] * n
+        self.current = None
+        self.results = 0            # main_loop only, see end_of_sweep
+        self.index_of = dict((f, i) for i, f in enumerate(self.centers))
+
+    def next(self, now=None):
+        if now is None:
+            now = time.time()
+        self.lock.acquire()
+        try:
+            best = None
+            best_key = None
+            for i in range(len(self.centers)):
+                if i == self.current and len(self.centers) > 1:
+                    continue
+                if self.last_visit[i] is None:
+                    key = (2, 0, -i)                # never seen, in sweep order
+                else:
+                    age = now - self.last_visit[i]
+                    if age >= self.max_staleness:
+                        key = (1, age, 0)           # overdue, oldest first
+                    else:
+                        key = (0, age * (1 + self.volatility_weight * self.volatility[i]), 0)
+                if best_key is None or key > best_key:
+                    best, best_key = i, key
+            self.current = best
+            self.last_visit[best] = now
+            return self.centers[best]
+        finally:
+            self.lock.release()
+
+    def update(self, freq, busy, now=None):
+        i = self.index_of.get(freq)
+        if i is None:
+            return
+        self.lock.acquire()
+        try:
+            if self.last_busy[i] is not None:
+                flip = float(bool(busy) != self.last_busy[i])
+                self.volatility[i] += self.smoothing * (flip - self.volatility[i])
+            self.last_busy[i] = bool(busy)
+        finally:
+            self.lock.release()
+
+    def restart(self):
+        pass
+
+    def end_of_sweep(self, freq):
+        # a "sweep" is as many results as there are channels; main_loop
+        # calls this once per result, so the count needs no lock
+        self.results += 1
+        if self.results >= len(self.centers):
+            self.results = 0
+            return True
+        return False
+
+
+def make_scheduler(options, centers):
+    """
+    Make the scheduler selected by the options.
+    """
+    if options.scheduler == 'activity':
+        return activity_scheduler(centers, options.max_staleness, options.volatility_weight)
+    return round_robin_scheduler(centers)
+
+
+def add_options(normal, expert):
+    """
+    Add scheduler options to the Options parser
+    """
+    normal.add_option("", "--scheduler", type="choice", choices=["rr", "activity"], default="rr",
+                      help="channel visiting order, rr (sweep) or activity [default=%default]")
+    expert.add_option("", "--max-staleness", type="eng_float", default=5.0, metavar="SECS",
+                      help="longest the activity scheduler leaves a channel unvisited [default=%default]")
+    expert.add_option("", "--volatility-weight", type="eng_float", default=4.0,
+                      help="how much sooner the activity scheduler revisits channels that "
+                      "keep changing [default=%default]")
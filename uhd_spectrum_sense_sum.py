@@ -30,11 +30,21 @@ from optparse import OptionParser
 #from usrpm import usrp_dbid
 import sys
 import math
-import struct
 import time
 
 import os
 
+#from current dir
+from sense_path import parse_msg, fft_offset_db, fft_sum_db
+import sense_path
+import metrics
+import profiling
+from occupancy_log import occupancy_log, open_log
+import usrp_device
+from sweep_plan import sweep_plan, spectrum_file, usable_bw
+import tune_scheduler
+from dwell import dwell_control
+
 
 class tune(gr.feval_dd):
     """
@@ -67,18 +77,6 @@ class tune(gr.feval_dd):
             print "tune: Exception: ", e
 
 
-class parse_msg(object):
-    def __init__(self, msg):
-        self.center_freq = msg.arg1()
-        self.vlen = int(msg.arg2())
-        assert(msg.length() == self.vlen * gr.sizeof_float)
-
-        # FIXME consider using Numarray or NumPy vector
-        t = msg.to_string()
-        self.raw_data = t
-        self.data = struct.unpack('%df' % (self.vlen,), t)
-
-
 class my_top_block(gr.top_block):
 
     def __init__(self):
@@ -99,8 +97,12 @@ class my_top_block(gr.top_block):
         #updated 2011 May 27, MR
         parser.add_option("-s", "--samp_rate", type="intx", default=6000000,
         				  help="set sample rate to SAMP_RATE [default=%default]")
-        parser.add_option("", "--chan-bandwidth", type="intx", default=6000000,
-        				  help="set channel bw [default=%default]")
+        parser.add_option("", "--chan-bandwidth", type="intx", default=None,
+        				  help="set channel bw, the sweep step with --usable-bw 0 or the "
+                          "channel width with --channelize [default=6000000]")
+        parser.add_option("", "--channelize", action="store_true", default=False,
+                          help="measure every --chan-bandwidth channel inside the usable "
+                          "bandwidth of each tune and step the sweep by all of them")
         #parser.add_option("-d", "--decim", type="intx", default=16,
         #                  help="set decimation to DECIM [default=%default]")
         parser.add_option("", "--real-time", action="store_true", default=False,
@@ -116,12 +118,26 @@ class my_top_block(gr.top_block):
         				  help="set the number of times to test the frequency band [default=%default]")
         parser.add_option("", "--log-file", action="store_true", default=False,
                           help="log output to a file")
+        occupancy_log.add_options(parser, parser)
+        sweep_plan.add_options(parser, parser)
+        tune_scheduler.add_options(parser, parser)
+        usrp_device.add_options(parser, parser)
+        usrp_device.lo_tracker.add_options(parser, parser)
+        metrics.add_options(parser, parser)
+        profiling.add_options(parser, parser)
+        dwell_control.add_slice_options(parser, parser)
 
         (options, args) = parser.parse_args()
         if len(args) != 2:
             parser.print_help()
             sys.exit(1)
             
+        if options.chan_bandwidth is None:
+            options.chan_bandwidth = 6000000
+        elif not options.channelize and usable_bw(options, options.samp_rate) is not None:
+            # the planner steps by the usable bandwidth then, not by this
+            parser.error("--chan-bandwidth needs --usable-bw 0 or --channelize")
+
         self.num_tests = options.num_tests
             
         self.threshold = options.threshold
@@ -131,8 +147,7 @@ class my_top_block(gr.top_block):
         self.max_freq = eng_notation.str_to_num(args[1])
         
         self.log_file = options.log_file
-        
-        self.num_channels = int((self.max_freq - self.min_freq)/self.samp_rate) + 2
+        self.options = options
         
         if self.min_freq > self.max_freq:
             self.min_freq, self.max_freq = self.max_freq, self.min_freq   # swap them
@@ -170,7 +185,7 @@ class my_top_block(gr.top_block):
         # build graph
         
         #updated 2011 May 27, MR
-        self.u = uhd.usrp_source(device_addr="", io_type=uhd.io_type.COMPLEX_FLOAT32, num_channels=1)
+        self.u = usrp_device.usrp_source(options, options.samp_rate)
         self.u.set_subdev_spec("", 0)
         self.u.set_antenna("TX/RX", 0)
         self.u.set_samp_rate(options.samp_rate)
@@ -192,35 +207,63 @@ class my_top_block(gr.top_block):
 
         mywindow = window.blackmanharris(self.fft_size)
         fft = gr.fft_vcc(self.fft_size, True, mywindow)
-        power = 0
-        for tap in mywindow:
-            power += tap*tap
             
         c2mag = gr.complex_to_mag_squared(self.fft_size)
 
         # FIXME the log10 primitive is dog slow
-        log = gr.nlog10_ff(10, self.fft_size,
-                           -20*math.log10(self.fft_size)-10*math.log10(power/self.fft_size))
+        log = gr.nlog10_ff(10, self.fft_size, fft_offset_db(self.fft_size))
 		
-        # Set the freq_step to 75% of the actual data throughput.
-        # This allows us to discard the bins on both ends of the spectrum.
+        # The planner steps by less than the sample rate, so the bins on
+        # both ends of the spectrum can be discarded (all are kept with
+        # --usable-bw 0, stepping by --chan-bandwidth as before).
+        # With --channelize each tune is split into all the channels it
+        # covers by grouping FFT bins, and the sweep steps by all of them.
 
         #changed on 2011 May 31, MR -- maybe change back at some point
         #self.freq_step = 0.75 * self.usrp_rate
-        self.freq_step = options.chan_bandwidth
-        self.min_center_freq = self.min_freq + self.freq_step/2
-        nsteps = math.ceil((self.max_freq - self.min_freq) / self.freq_step)
-        self.max_center_freq = self.min_center_freq + (nsteps * self.freq_step)
+        if options.channelize:
+            self.plan = sweep_plan(self.min_freq, self.max_freq, self.usrp_rate, self.fft_size,
+                                   usable_bw(options, self.usrp_rate),
+                                   chan_bw=options.chan_bandwidth)
+            print "%d channels of %s per tune, %d tunes per sweep" % (
+                self.plan.nchan, eng_notation.num_to_str(self.plan.chan_width), self.plan.ntunes)
+            if abs(self.plan.chan_width - options.chan_bandwidth) > 1e-6 * options.chan_bandwidth:
+                print "Warning: --chan-bandwidth %s is not a whole number of %s FFT bins, " \
+                      "channels are %s wide" % (eng_notation.num_to_str(options.chan_bandwidth),
+                                               eng_notation.num_to_str(self.plan.bin_width),
+                                               eng_notation.num_to_str(self.plan.chan_width))
+        else:
+            self.plan = sweep_plan(self.min_freq, self.max_freq, self.usrp_rate, self.fft_size,
+                                   usable_bw(options, self.usrp_rate), options.chan_bandwidth)
+        self.freq_step = self.plan.freq_step
+        self.min_center_freq = self.plan.min_center_freq
+        self.max_center_freq = self.plan.max_center_freq
 
-        self.next_freq = self.min_center_freq
+        self.scheduler = tune_scheduler.make_scheduler(options, self.plan.centers)
         
         tune_delay  = max(0, int(round(options.tune_delay * self.usrp_rate / self.fft_size)))  # in fft_frames
         dwell_delay = max(1, int(round(options.dwell_delay * self.usrp_rate / self.fft_size))) # in fft_frames
 
         self.msgq = gr.msg_queue(16)
+        sense_path.QUEUE_LIMIT.inc(self.msgq.limit())
         self._tune_callback = tune(self)        # hang on to this to keep it from being GC'd
-        stats = gr.bin_statistics_f(self.fft_size, self.msgq,
-                                    self._tune_callback, tune_delay, dwell_delay)
+
+        # With --ddc-span, channels that fit in the current RF passband are
+        # reached by moving the DDC only.  Those steps need no tune delay,
+        # so the dwell is measured in slices and the settle slices are
+        # only skipped when the LO actually moved.
+        self.lo = None
+        self.dwell = None
+        if options.ddc_span:
+            self.lo = usrp_device.lo_tracker(options.ddc_span, self.freq_step)
+            slice_frames = max(1, int(round(options.dwell_slice * self.usrp_rate / self.fft_size)))
+            self.dwell = dwell_control(int(math.ceil(float(tune_delay) / slice_frames)),
+                                       int(math.ceil(float(dwell_delay) / slice_frames)))
+            stats = gr.bin_statistics_f(self.fft_size, self.msgq,
+                                        self._tune_callback, 0, slice_frames)
+        else:
+            stats = gr.bin_statistics_f(self.fft_size, self.msgq,
+                                        self._tune_callback, tune_delay, dwell_delay)
 
         # FIXME leave out the log10 until we speed it up
         #self.connect(self.u, s2v, fft, c2mag, log, stats)
@@ -237,13 +280,31 @@ class my_top_block(gr.top_block):
         print "gain =", options.gain
         
     def set_next_freq(self):
-        target_freq = self.next_freq
-        self.next_freq = self.next_freq + self.freq_step
-        if self.next_freq >= self.max_center_freq:
-        	self.next_freq = self.min_center_freq
+        sense_path.CALLBACKS.inc()
+        if self.dwell is not None and not self.dwell.move_on():
+        	return self.dwell.seq
         	
-        if not self.set_freq(target_freq):
+        target_freq = self.scheduler.next()
+        
+        request, lo_moved = target_freq, True
+        if self.lo is not None:
+        	request, lo_moved = self.lo.request(target_freq)
+        	
+        t0 = time.time()
+        ok = self.set_freq(request)
+        sense_path.TUNE_SECONDS.observe(time.time() - t0)
+        sense_path.TUNES.inc()
+        if not ok:
+        	sense_path.TUNE_FAILURES.inc()
         	print "Failed to set frequency to", target_freq
+        	
+        if self.dwell is not None:
+        	if lo_moved:
+        		self.dwell.start_visit(target_freq)
+        	else:
+        		self.dwell.start_visit(target_freq, 0)
+        	# label the slice, see dwell.py
+        	return self.dwell.seq
         		
         return target_freq
         	
@@ -251,7 +312,7 @@ class my_top_block(gr.top_block):
         """
         Set the center frequency we're interested in.
         	
-        @param target_freq: frequency in Hz
+        @param target_freq: frequency in Hz, or a uhd.tune_request
         @rypte: bool
         	
         Tuning is a two step process.  First we ask the front-end to
@@ -270,68 +331,93 @@ class my_top_block(gr.top_block):
 
 
 def main_loop(tb):
+	log = None
 	if tb.log_file:
-		filename = "spectrum_sense_exp_" + time.strftime('%y%m%d_%H%M%S') + ".csv"
-		f = open(filename, 'w')
-		f.write("detecting on %s BW channels between " %(tb.samp_rate))
-		f.write("%s and " %(tb.min_freq))
-		f.write("%s\n" %(tb.max_freq))
-		f.close()
+		log = open_log("spectrum_sense_exp_",
+		               "detecting on %s BW channels between %s and %s"
+		               % (tb.samp_rate, tb.min_freq, tb.max_freq), tb.options)
 	i = 0
-	mywindow = window.blackmanharris(tb.fft_size)
-	power = 0
-	for tap in mywindow:
-		power += tap*tap
-		
-	k = -20*math.log10(tb.fft_size)-10*math.log10(power/tb.fft_size)
+	k = fft_offset_db(tb.fft_size)
+	spectrum = None
+	if tb.options.spectrum_file:
+		spectrum = spectrum_file(tb.options.spectrum_file, [tb.plan], k)
+	got = None
 	
 	while i < tb.num_tests or tb.num_tests == 0:
-		i = (i+1)
-				
 		# Get the next message sent from the C++ code (blocking call).
 		# It contains the center frequency and the mag squared of the fft
-		m = parse_msg(tb.msgq.delete_head())
+		t0 = time.time()
+		if got is not None:
+			profiling.record('main_loop.work', t0 - got)
+		msg = tb.msgq.delete_head()
+		t1 = got = time.time()
+		profiling.record('main_loop.wait', t1 - t0)
+		m = parse_msg(msg)
+		sense_path.PARSE_SECONDS.observe(time.time() - t1)
+		sense_path.QUEUE_WAIT.observe(t1 - t0)
+		sense_path.MESSAGES.inc()
+		if tb.dwell is not None:
+			m = tb.dwell.accept(m)
+			if m is None:
+				continue
+		i = (i+1)
 		
-		#fft_sum_db = 20*math.log10(sum(m.data)/m.vlen)
-		temp_list = []
-		for item in m.data:
-			temp_list.append(10*math.log10(item) + k)
-		fft_sum_db = sum(temp_list)/m.vlen
+		# one power per channel; a single channel unless --channelize
+		t0 = time.time()
+		dbs = fft_sum_db(tb.plan.channels(m.data), k)
+		sense_path.REDUCE_SECONDS.observe(time.time() - t0)
+		sense_path.RESULTS.inc(len(dbs))
+		sense_path.update_queue_metrics([tb.msgq])
+		freqs = tb.plan.channel_freqs(m.center_freq)
+		db = dbs.max()
+		tb.plan.stitch(m.center_freq, m.data)
 		
 		
-		if tb.log_file:
-			f = open(filename, 'a')
-			if fft_sum_db > tb.threshold:
-				f.write("1,")
-			else:
-				f.write("0,")
-			#f.write(str(m.center_freq))
-			#f.write(", ")
-			#f.write(str(fft_sum_db))
-			#f.write("\n")
-			if m.center_freq >= tb.max_center_freq - tb.freq_step:
-				f.write("\n")
-			#	break
-			f.close()
+		sweep_done = tb.scheduler.end_of_sweep(m.center_freq)
+		tb.scheduler.update(m.center_freq, db > tb.threshold)
+		if sweep_done:
+			if spectrum:
+				spectrum.write()
+			profiling.mark_sweep()
+		
+		if log:
+			for j in range(len(dbs)):
+				log.write(freqs[j], dbs[j], dbs[j] > tb.threshold,
+				          sweep_done and j == len(dbs) - 1)
 			
 		if not tb.log_file and m.center_freq == tb.min_center_freq:
 				os.system("clear")
 				#tb.next_freq = tb.min_center_freq
 				#tb.msgq.flush()
 		
-		print m.center_freq, fft_sum_db
+		if len(dbs) == 1:
+			print m.center_freq, db
+		else:
+			for j in range(len(dbs)):
+				print freqs[j], dbs[j]
 
-		if not tb.log_file and m.center_freq >= tb.max_center_freq - tb.freq_step:
+		if not tb.log_file and sweep_done:
 				time.sleep(.5)
-				tb.next_freq = tb.min_center_freq
+				tb.scheduler.restart()
+				sense_path.FLUSHED.inc(tb.msgq.count())
 				tb.msgq.flush()
+				if tb.dwell is not None:
+					tb.dwell.flush()
 
-	
-	#f.close()
+	if log:
+		log.close()
+	if spectrum:
+		spectrum.close()
 
     
 if __name__ == '__main__':
     tb = my_top_block()
+    metrics.start_exporter(tb.options)
+    this = sys.modules[__name__]
+    profiling.start_profiler(tb.options, [(this, 'parse_msg', 'parse_msg'),
+                                          (tune, 'eval', 'tune.eval'),
+                                          (my_top_block, 'set_next_freq', 'set_next_freq'),
+                                          (my_top_block, 'set_freq', 'set_freq')])
     try:
         tb.start()              # start executing flow graph in another thread...
         main_loop(tb)
@@ -0,0 +1,367 @@
+#!/usr/bin/env python
+#
+# Pluggable device layer for the UHD scripts.
+#
+# usrp_source() and usrp_sink() return either a real uhd.usrp_source /
+# uhd.usrp_sink or, with --sim, a simulated device that needs no
+# hardware.  The simulated devices are hier blocks with the same
+# set_center_freq / set_samp_rate / get_gain_range / set_gain surface the
+# scripts use, so a flow graph does not have to know which one it got.
+#
+# The simulated source synthesizes a complex gaussian noise floor plus a
+# tone for every --sim-primary that falls inside the current passband.
+# Levels are given in dB of power at 0 dB gain; set_gain() scales
+# everything, like the RX gain on a real front end.  set_center_freq()
+# blocks for --sim-tune-latency to model LO settling, unless it was given
+# a tune request that leaves the LO where it is.  By default the
+# source is not throttled and runs as fast as the CPU allows.
+#
+# The simulated devices also keep a device time (set_time_now /
+# get_time_now) and honour set_command_time: a retune issued while a
+# command time is set is carried out by a timer at that device time.
+#
+# usrp_sources() makes one receiver per --args / --device-args address
+# and RX channel, so a band can be split across several radios.  With
+# --sim every one of them is a separate simulated source.
+#
+
+from gnuradio import gr, eng_notation
+from gnuradio import uhd
+import threading
+import time
+
+
+class sim_gain_range(object):
+    """
+    Stand-in for the uhd gain range object.
+    """
+    def __init__(self, start, stop, step):
+        self._start = start
+        self._stop = stop
+        self._step = step
+
+    def start(self):
+        return self._start
+
+    def stop(self):
+        return self._stop
+
+    def step(self):
+        return self._step
+
+
+class sim_tune_result(object):
+    """
+    Stand-in for the uhd tune result.  Always true.
+    """
+    def __init__(self, target_freq, lo_freq):
+        self.target_rf_freq = lo_freq
+        self.actual_rf_freq = lo_freq
+        self.target_dsp_freq = target_freq - lo_freq
+        self.actual_dsp_freq = target_freq - lo_freq
+
+    def __nonzero__(self):
+        return True
+
+
+def time_secs(time_spec):
+    """
+    Seconds in a uhd.time_spec_t (or a plain number).
+    """
+    if hasattr(time_spec, 'get_real_secs'):
+        return time_spec.get_real_secs()
+    return float(time_spec)
+
+
+class sim_device(object):
+    """
+    Settings shared by the simulated source and sink.
+    """
+    def _sim_init(self, samp_rate, tune_latency):
+        self._time_zero = time.time()   # host time at device time 0
+        self._command_time = None
+        self._samp_rate = samp_rate
+        self._center_freq = 0.0
+        self._lo_freq = None
+        self._gain = 0.0
+        self._gain_range = sim_gain_range(0.0, 31.5, 0.5)
+        self._subdev_spec = ""
+        self._antenna = ""
+        self.tune_latency = tune_latency
+        self.tune_log = []      # (time, freq) of every set_center_freq
+
+    def set_subdev_spec(self, spec, mboard=0):
+        self._subdev_spec = spec
+
+    def set_antenna(self, ant, chan=0):
+        self._antenna = ant
+
+    def get_dboard_sensor_names(self, chan=0):
+        return []
+
+    def set_samp_rate(self, rate):
+        self._samp_rate = rate
+        self._update()
+
+    def get_samp_rate(self):
+        return self._samp_rate
+
+    def set_time_now(self, time_spec, mboard=0):
+        self._time_zero = time.time() - time_secs(time_spec)
+
+    def get_time_now(self, mboard=0):
+        return uhd.time_spec_t(time.time() - self._time_zero)
+
+    def set_command_time(self, time_spec, mboard=0):
+        self._command_time = time_secs(time_spec)
+
+    def clear_command_time(self, mboard=0):
+        self._command_time = None
+
+    def set_center_freq(self, freq, chan=0):
+        if self._command_time is not None:
+            delay = self._time_zero + self._command_time - time.time()
+            if delay > 0:
+                # timed command, carried out when the device time comes
+                t = threading.Timer(delay, self._set_center_freq, (freq, chan))
+                t.setDaemon(True)
+                t.start()
+                target = getattr(freq, 'target_freq', freq)
+                return sim_tune_result(target, target)
+        return self._set_center_freq(freq, chan)
+
+    def _set_center_freq(self, freq, chan=0):
+        # freq may be a plain frequency or a uhd.tune_request
+        lo = None
+        if hasattr(freq, 'target_freq'):
+            if freq.rf_freq_policy == uhd.tune_request.POLICY_NONE:
+                lo = self._lo_freq
+            elif freq.rf_freq_policy == uhd.tune_request.POLICY_MANUAL:
+                lo = freq.rf_freq
+            freq = freq.target_freq
+        if lo is None:
+            lo = freq
+        if lo != self._lo_freq and self.tune_latency > 0:
+            # only moving the LO costs settling time
+            time.sleep(self.tune_latency)
+        self._lo_freq = lo
+        self._center_freq = freq
+        self.tune_log.append((time.time(), freq))
+        self._update()
+        return sim_tune_result(freq, lo)
+
+    def get_center_freq(self, chan=0):
+        return self._center_freq
+
+    def get_gain_range(self, chan=0):
+        return self._gain_range
+
+    def set_gain(self, gain, chan=0):
+        self._gain = gain
+        self._update()
+
+    def get_gain(self, chan=0):
+        return self._gain
+
+    def _update(self):
+        pass
+
+
+class sim_source(gr.hier_block2, sim_device):
+    """
+    Simulated uhd.usrp_source.
+    """
+    def __init__(self, samp_rate, noise_db=-90, primaries=(), tune_latency=0, throttle=False):
+        """
+        @param samp_rate: initial sample rate
+        @param noise_db: noise floor power in dB
+        @param primaries: list of (freq, power in dB)
+        @param tune_latency: seconds set_center_freq blocks for
+        @param throttle: limit the output to samp_rate samples per second
+        """
+        gr.hier_block2.__init__(self, "sim_source",
+                gr.io_signature(0, 0, 0), # Input signature
+                gr.io_signature(1, 1, gr.sizeof_gr_complex)) # Output signature
+        self._sim_init(samp_rate, tune_latency)
+
+        self.noise_db = noise_db
+        self.primaries = list(primaries)
+
+        self.noise = gr.noise_source_c(gr.GR_GAUSSIAN, 0)
+        self.tones = []
+        for freq, db in self.primaries:
+            self.tones.append(gr.sig_source_c(samp_rate, gr.GR_SIN_WAVE, 0, 0))
+
+        if self.tones:
+            add = gr.add_cc()
+            self.connect(self.noise, (add, 0))
+            for i, tone in enumerate(self.tones):
+                self.connect(tone, (add, i+1))
+            out = add
+        else:
+            out = self.noise
+
+        if throttle:
+            th = gr.throttle(gr.sizeof_gr_complex, samp_rate)
+            self.connect(out, th)
+            out = th
+        self.connect(out, self)
+        self._update()
+
+    def _update(self):
+        scale = 10**(self._gain/20.0)
+        self.noise.set_amplitude(scale * 10**(self.noise_db/20.0))
+        for (freq, db), tone in zip(self.primaries, self.tones):
+            offset = freq - self._center_freq
+            tone.set_sampling_freq(self._samp_rate)
+            if abs(offset) < self._samp_rate/2:
+                tone.set_frequency(offset)
+                tone.set_amplitude(scale * 10**(db/20.0))
+            else:
+                tone.set_amplitude(0)
+
+
+class sim_sink(gr.hier_block2, sim_device):
+    """
+    Simulated uhd.usrp_sink.  Samples are discarded; tune_log records
+    when each retune happened.
+    """
+    def __init__(self, samp_rate, tune_latency=0, throttle=False):
+        gr.hier_block2.__init__(self, "sim_sink",
+                gr.io_signature(1, 1, gr.sizeof_gr_complex), # Input signature
+                gr.io_signature(0, 0, 0)) # Output signature
+        self._sim_init(samp_rate, tune_latency)
+
+        null = gr.null_sink(gr.sizeof_gr_complex)
+        if throttle:
+            th = gr.throttle(gr.sizeof_gr_complex, samp_rate)
+            self.connect(self, th, null)
+        else:
+            self.connect(self, null)
+
+
+class lo_tracker(object):
+    """
+    Decides when a retune can move only the DSP (DDC/DUC) offset.
+
+    While a whole channel of width chan_bw stays within span/2 of the
+    current LO, request() returns a tune request that leaves the LO
+    alone.  Otherwise the LO is moved far enough ahead that the following
+    channels of an upward sweep fit too.
+    """
+    def __init__(self, span, chan_bw):
+        self.span = span
+        self.chan_bw = chan_bw
+        self.lo = None
+
+    def request(self, target_freq):
+        """
+        Return (tune request, lo_moved) for target_freq.
+        """
+        req = uhd.tune_request(target_freq)
+        if self.lo is not None and abs(target_freq - self.lo) + self.chan_bw/2 <= self.span/2:
+            req.rf_freq_policy = uhd.tune_request.POLICY_NONE
+            return req, False
+        self.lo = target_freq + max(0, self.span - self.chan_bw)/2
+        req.rf_freq_policy = uhd.tune_request.POLICY_MANUAL
+        req.rf_freq = self.lo
+        return req, True
+
+    def add_options(normal, expert):
+        """
+        Add DDC retune options to the Options parser
+        """
+        expert.add_option("", "--ddc-span", type="eng_float", default=0,
+                          help="RF bandwidth around the LO inside which a retune only moves "
+                          "the DDC and skips the tune delay, 0 to always move the LO "
+                          "[default=%default]")
+    # Make a static method to call before instantiation
+    add_options = staticmethod(add_options)
+
+
+def parse_primaries(specs):
+    """
+    Turn a list of "FREQ:DB" strings into (freq, db) tuples.
+    """
+    primaries = []
+    for spec in specs or []:
+        freq, db = spec.split(':')
+        primaries.append((eng_notation.str_to_num(freq), float(db)))
+    return primaries
+
+
+def usrp_source(options, samp_rate, num_channels=1):
+    """
+    Make the receive device selected by the options.
+    """
+    if options.sim:
+        return sim_source(samp_rate, options.sim_noise, parse_primaries(options.sim_primary),
+                          options.sim_tune_latency, options.sim_throttle)
+    return uhd.usrp_source(device_addr=options.args, io_type=uhd.io_type.COMPLEX_FLOAT32,
+                           num_channels=num_channels)
+
+
+def usrp_sources(options, samp_rate):
+    """
+    Make every receiver selected by the options.
+
+    Returns a list of (block, port, chan, args): the output port of block
+    carrying the receiver, the channel to pass to set_center_freq and
+    set_gain, and the device address.
+    """
+    addrs = [options.args] + list(options.device_args)
+    nchan = max(1, options.rx_channels)
+    receivers = []
+    for addr in addrs:
+        if options.sim:
+            for chan in range(nchan):
+                u = sim_source(samp_rate, options.sim_noise, parse_primaries(options.sim_primary),
+                               options.sim_tune_latency, options.sim_throttle)
+                receivers.append((u, 0, 0, addr))
+        else:
+            u = uhd.usrp_source(device_addr=addr, io_type=uhd.io_type.COMPLEX_FLOAT32,
+                                num_channels=nchan)
+            for chan in range(nchan):
+                receivers.append((u, chan, chan, addr))
+    return receivers
+
+
+def usrp_sink(options, samp_rate, num_channels=1):
+    """
+    Make the transmit device selected by the options.
+    """
+    if options.sim:
+        return sim_sink(samp_rate, options.sim_tune_latency, options.sim_throttle)
+    return uhd.usrp_sink(device_addr=options.args, io_type=uhd.io_type.COMPLEX_FLOAT32,
+                         num_channels=num_channels)
+
+
+def add_options(normal, expert):
+    """
+    Add device selection options to the Options parser
+    """
+    normal.add_option("", "--args", type="string", default="",
+                      help="UHD device address [default=%default]")
+    normal.add_option("", "--sim", action="store_true", default=False,
+                      help="use a simulated device instead of a USRP")
+    expert.add_option("", "--sim-noise", type="eng_float", default=-90,
+                      help="simulated noise floor in dB [default=%default]")
+    expert.add_option("", "--sim-primary", type="string", action="append", default=[],
+                      metavar="FREQ:DB",
+                      help="add a simulated primary at FREQ with power DB, may be repeated")
+    expert.add_option("", "--sim-tune-latency", type="eng_float", default=0, metavar="SECS",
+                      help="time a simulated retune takes [default=%default]")
+    expert.add_option("", "--sim-throttle", action="store_true", default=False,
+                      help="run the simulated device at its sample rate instead of flat out")
+
+
+def add_receiver_options(normal, expert):
+    """
+    Add the options of usrp_sources to the Options parser, for the
+    scripts that split their work across several receivers
+    """
+    normal.add_option("", "--device-args", type="string", action="append", default=[],
+                      metavar="ARGS",
+                      help="address of another device to receive with, may be repeated")
+    expert.add_option("", "--rx-channels", type="int", default=1,
+                      help="RX channels to use on every device [default=%default]")
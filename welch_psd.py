@@ -0,0 +1,164 @@
+#!/usr/bin/env python
+#
+# Chunked, multi-core Welch PSD of a complex_filesink.py capture.
+#
+# The capture is memory-mapped, never loaded.  It is cut into rows of
+# --frames-per-row overlapping FFT frames (--overlap), and every worker
+# process maps the file itself and averages the windowed mag squared
+# frames of the rows it is given.  Rows carry on where the previous row
+# stopped, so consecutive rows overlap by the same amount as frames do.
+#
+# Frames use the Blackman-Harris window from sense_path and the same
+# normalization offset k main_loop adds, so the dB values line up with
+# live sensing.  Bins are in fft_vcc order (DC first), like a
+# bin_statistics_f vector.
+#
+# Outputs, both .npy files that numpy.load(..., mmap_mode='r') can open:
+#
+#   PREFIX_spectrogram.npy   rows x fft_size float32, dB
+#   PREFIX_psd.npy           fft_size float32, dB, average over all rows
+#
+# Memory use is bounded by the number of workers times one row.
+#
+# Captures are read with iq_file, so sc16 and sc8 recordings are
+# converted to complex64 one row at a time in the workers.
+#
+
+from gnuradio.eng_option import eng_option
+from optparse import OptionParser
+import multiprocessing
+import sys
+import time
+
+import numpy
+from numpy.lib.stride_tricks import as_strided
+from numpy.lib.format import open_memmap
+
+#from current dir
+from sense_path import fft_window, fft_mag_squared, fft_offset_db
+from iq_file import iq_file
+
+# per worker process state, set up by _init_worker
+_worker = {}
+
+
+def _init_worker(filename, format, fft_size, hop, frames_per_row):
+    _worker['data'] = iq_file(filename, format)
+    _worker['window'] = fft_window(fft_size)
+    _worker['fft_size'] = fft_size
+    _worker['hop'] = hop
+    _worker['frames_per_row'] = frames_per_row
+
+
+def _psd_row(row):
+    """
+    Average linear power over the frames of one row.
+    """
+    data = _worker['data']
+    fft_size = _worker['fft_size']
+    hop = _worker['hop']
+    n = _worker['frames_per_row']
+    start = row * n * hop
+    chunk = numpy.array(data.read(start, start + (n-1)*hop + fft_size))
+    itemsize = chunk.strides[0]
+    frames = as_strided(chunk, shape=(n, fft_size), strides=(hop*itemsize, itemsize))
+    return row, fft_mag_squared(frames, _worker['window']).mean(axis=0)
+
+
+class welch_psd(object):
+
+    def __init__(self, filename, fft_size, overlap=0.5, frames_per_row=256, format=None):
+        """
+        @param filename: capture, see iq_file
+        @param fft_size: number of FFT bins
+        @param overlap: fraction of a frame shared with the next one, 0 <= overlap < 1
+        @param frames_per_row: frames averaged into each spectrogram row
+        @param format: sample format, None for the sidecar's
+
+        Raises ValueError if the capture is too short for one row.
+        """
+        if not 0 <= overlap < 1:
+            raise ValueError("overlap must be in [0, 1)")
+        self.filename = filename
+        self.format = format
+        self.fft_size = fft_size
+        self.hop = max(1, int(round(fft_size * (1 - overlap))))
+        self.frames_per_row = frames_per_row
+        self.k = fft_offset_db(fft_size)
+
+        nsamples = len(iq_file(filename, format))
+        nframes = max(0, (nsamples - fft_size) // self.hop + 1)
+        self.nrows = nframes // frames_per_row
+        if self.nrows == 0:
+            raise ValueError("%s: %d samples is less than one row of %d frames"
+                             % (filename, nsamples, frames_per_row))
+
+    def run(self, prefix, processes=None):
+        """
+        Compute the spectrogram and average PSD and write them to
+        prefix_spectrogram.npy and prefix_psd.npy.
+
+        @returns: the average PSD in dB
+        """
+        spectrogram = open_memmap(prefix + "_spectrogram.npy", mode='w+',
+                                  dtype=numpy.float32, shape=(self.nrows, self.fft_size))
+        total = numpy.zeros(self.fft_size, dtype=numpy.float64)
+
+        pool = multiprocessing.Pool(processes, _init_worker,
+                                    (self.filename, self.format, self.fft_size, self.hop,
+                                     self.frames_per_row))
+        try:
+            for row, power in pool.imap_unordered(_psd_row, xrange(self.nrows), 4):
+                spectrogram[row] = 10*numpy.log10(power) + self.k
+                total += power
+        finally:
+            pool.close()
+            pool.join()
+        spectrogram.flush()
+        del spectrogram
+
+        psd = (10*numpy.log10(total / self.nrows) + self.k).astype(numpy.float32)
+        numpy.save(prefix + "_psd.npy", psd)
+        return psd
+
+
+def main():
+    usage = "usage: %prog [options] complex_out.dat"
+    parser = OptionParser(option_class=eng_option, usage=usage)
+    parser.add_option("-F", "--fft-size", type="int", default=1024,
+                      help="specify number of FFT bins [default=%default]")
+    parser.add_option("", "--overlap", type="eng_float", default=0.5,
+                      help="fraction of overlap between frames [default=%default]")
+    parser.add_option("-n", "--frames-per-row", type="int", default=256,
+                      help="frames averaged into each spectrogram row [default=%default]")
+    parser.add_option("-j", "--processes", type="int", default=None,
+                      help="worker processes [default=one per CPU]")
+    parser.add_option("-o", "--output", type="string", default="welch",
+                      help="output file prefix [default=%default]")
+    iq_file.add_options(parser, parser)
+    (options, args) = parser.parse_args()
+    if len(args) != 1:
+        parser.print_help()
+        sys.exit(1)
+
+    try:
+        w = welch_psd(args[0], options.fft_size, options.overlap, options.frames_per_row,
+                      options.format)
+    except ValueError, e:
+        print >> sys.stderr, "welch_psd:", e
+        sys.exit(1)
+    t0 = time.time()
+    psd = w.run(options.output, options.processes)
+    elapsed = time.time() - t0
+    print "%d rows of %d frames in %.2f s" % (w.nrows, w.frames_per_row, elapsed)
+    # mean over the bins of the Welch-averaged PSD in dB; main_loop's
+    # fft_sum_db averages bins that bin_statistics_f max-held over a dwell,
+    # so it reads higher on the same signal
+    print "average PSD %.2f dB" % (psd.mean(),)
+
+
+if __name__ == '__main__':
+    try:
+        main()
+    except KeyboardInterrupt:
+        pass